@@ -7,6 +7,7 @@ import re
 import time
 from datetime import datetime
 from playwright.sync_api import sync_playwright
+from opportunity_scoring import score_opportunities, profitable_mask, DEFAULT_MIN_ROI
 
 def get_jpy_to_usd_rate():
     """Get current JPY to USD exchange rate"""
@@ -278,6 +279,64 @@ def export_bulk_opportunities(opportunities):
     print(f"SUCCESS: {len(unique_opportunities)} unique opportunities exported to: {filename}")
     return filename
 
+def score_priced_cards(priced_cards):
+    """Score every priced card in one vectorized pass and return the opportunities"""
+    if not priced_cards:
+        return []
+    
+    scores = score_opportunities(
+        [card['price_usd'] for card in priced_cards],
+        [card['market_price'] for card in priced_cards]
+    )
+    profits = scores['profit'][0]
+    margins = scores['roi'][0]
+    mask = profitable_mask(scores, min_roi=DEFAULT_MIN_ROI)[0]
+    
+    opportunities = []
+    for idx in mask.nonzero()[0]:
+        card = priced_cards[idx]
+        opportunities.append({
+            'japanese_name': card['name'],
+            'english_name': card['english_name'],
+            'card_number': extract_card_number_for_csv(card['name']),
+            'card_type': extract_card_type_for_csv(card['name']),
+            'buy_price_jpy': card['price_jpy'],
+            'buy_price_usd': round(card['price_usd'], 2),
+            'sell_price_usd': round(card['market_price'], 2),
+            'profit_usd': round(float(profits[idx]), 2),
+            'profit_margin_percent': round(float(margins[idx]), 1),
+            'cardrush_url': card['url'],
+            'source_page_url': card['source_url'],
+            'ebay_search_url': card['ebay_url']
+        })
+    
+    return opportunities
+
+def export_priced_cards(priced_cards):
+    """Export every priced card so the run can be re-scored with opportunity_scoring.py"""
+    if not priced_cards:
+        return None
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"bulk_priced_cards_{timestamp}.csv"
+    
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        fieldnames = ['japanese_name', 'buy_price_jpy', 'buy_price_usd', 'sell_price_usd', 'ebay_search_url']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        
+        writer.writeheader()
+        for card in priced_cards:
+            writer.writerow({
+                'japanese_name': card['name'],
+                'buy_price_jpy': card['price_jpy'],
+                'buy_price_usd': round(card['price_usd'], 2),
+                'sell_price_usd': round(card['market_price'], 2),
+                'ebay_search_url': card['ebay_url']
+            })
+    
+    print(f"SUCCESS: {len(priced_cards)} priced cards exported to: {filename}")
+    return filename
+
 def log_progress(message, progress_file="bulk_progress.log"):
     """Log progress to a file with timestamp"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -315,6 +374,7 @@ def main():
     
     all_opportunities = []
     all_cards = []
+    priced_cards = []
     
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
@@ -346,31 +406,16 @@ def main():
                     market_price, ebay_url = get_ebay_price_improved(card['name'])
                     
                     if market_price and ebay_url:
-                        profit = market_price - card['price_usd']
-                        margin = (profit / card['price_usd']) * 100
-                        
                         log_progress(f"CardRush: ¥{card['price_jpy']:,} (${card['price_usd']:.2f})", progress_file)
                         log_progress(f"eBay average: ${market_price:.2f}", progress_file)
-                        log_progress(f"Profit: ${profit:.2f} ({margin:.1f}%)", progress_file)
                         
-                        if margin > 20:  # 20% profit margin threshold
-                            all_opportunities.append({
-                                'japanese_name': card['name'],
-                                'english_name': english_name,
-                                'card_number': extract_card_number_for_csv(card['name']),
-                                'card_type': extract_card_type_for_csv(card['name']),
-                                'buy_price_jpy': card['price_jpy'],
-                                'buy_price_usd': round(card['price_usd'], 2),
-                                'sell_price_usd': round(market_price, 2),
-                                'profit_usd': round(profit, 2),
-                                'profit_margin_percent': round(margin, 1),
-                                'cardrush_url': card['url'],
-                                'source_page_url': card['source_url'],
-                                'ebay_search_url': ebay_url
-                            })
-                            log_progress("OPPORTUNITY FOUND!", progress_file)
-                        else:
-                            log_progress("Not profitable enough", progress_file)
+                        # Scoring happens in one vectorized pass over all priced cards
+                        priced_cards.append({
+                            **card,
+                            'english_name': english_name,
+                            'market_price': market_price,
+                            'ebay_url': ebay_url
+                        })
                     else:
                         log_progress("No market price found", progress_file)
                     
@@ -380,15 +425,19 @@ def main():
             
             # Save intermediate results every 5 URLs
             if i % 5 == 0:
+                all_opportunities = score_priced_cards(priced_cards)
                 save_intermediate_results(all_opportunities, all_cards, progress_file)
         
         browser.close()
     
+    all_opportunities = score_priced_cards(priced_cards)
+    
     # Final results
     log_progress(f"\nBULK ANALYSIS COMPLETE", progress_file)
     log_progress("=" * 50, progress_file)
     log_progress(f"Total URLs processed: {len(urls)}", progress_file)
     log_progress(f"Total cards found: {len(all_cards)}", progress_file)
+    log_progress(f"Total cards priced: {len(priced_cards)}", progress_file)
     log_progress(f"Total opportunities found: {len(all_opportunities)}", progress_file)
     
     if all_opportunities:
@@ -411,6 +460,9 @@ def main():
     else:
         log_progress("\nNo profitable opportunities found", progress_file)
     
+    # Keep every priced card so the run can be re-scored under other fee/FX assumptions
+    export_priced_cards(priced_cards)
+    
     log_progress(f"\nIMPORTANT NOTES:", progress_file)
     log_progress("• These are estimates based on recent eBay sold listings", progress_file)
     log_progress("• Consider eBay/PayPal fees (~13% total)", progress_file)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Scored ranking of card search results
+Scores every candidate in an API response against the query on name
+similarity, card number, set and suffix (ex / V / VMAX ...) in one NumPy
+pass and returns the best match with a confidence value, so callers can
+re-query precisely instead of trusting the first hit
+"""
+
+import re
+import numpy as np
+
+# Suffixes that make a different card from the same Pokemon
+SUFFIXES = {'ex', 'v', 'vmax', 'vstar', 'gx', 'break', 'lv', 'prime', 'star', 'delta'}
+
+# Set-code-like tokens: swsh284, sv3pt5, sm12, xy7, tg05, gg44 ...
+SET_CODE_PATTERN = re.compile(r'^(swsh|sv|sm|xy|bw|dp|tg|gg|svp|pgo|cel)\d+[a-z0-9]*$')
+
+# Component weights; components the query says nothing about are left out and the rest rescaled
+WEIGHTS = {'name': 0.45, 'number': 0.25, 'suffix': 0.15, 'set': 0.15}
+
+# At or above this a match is taken without further queries
+CONFIDENT = 0.7
+
+# Below this even the best candidate is not used
+MIN_CONFIDENCE = 0.4
+
+# A runner-up this close (or closer) halves the confidence
+AMBIGUOUS_GAP = 0.05
+CLEAR_GAP = 0.25
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+def normalize_number(number):
+    """'025' -> '25', '199/165' -> '199', 'TG05' -> 'tg05'"""
+    number = str(number or '').lower().split('/')[0].strip()
+    return number.lstrip('0') or number
+
+
+class QueryParts:
+    """A free-text card query split into base name, suffix, number and set tokens"""
+
+    __slots__ = ('text', 'name_tokens', 'suffix', 'number', 'set_tokens')
+
+    def __init__(self, card_name):
+        self.text = card_name
+        self.name_tokens = []
+        self.suffix = None
+        self.number = None
+        self.set_tokens = []
+
+        # "199/165" keeps only the card's own number
+        for raw in re.findall(r'[A-Za-z0-9/]+', card_name):
+            token = raw.lower()
+            if '/' in token or token.isdigit():
+                if self.number is None:
+                    self.number = normalize_number(token)
+                continue
+            for part in tokenize(token):
+                if part in SUFFIXES:
+                    self.suffix = part
+                elif SET_CODE_PATTERN.match(part):
+                    self.set_tokens.append(part)
+                    # Promo codes double as card numbers (SWSH284)
+                    if self.number is None and re.search(r'\d', part):
+                        self.number = part
+                else:
+                    self.name_tokens.append(part)
+
+    @property
+    def base_name(self):
+        return ' '.join(self.name_tokens)
+
+
+def candidate_fields(card):
+    """(name, number, set name, set code tokens) from a RapidAPI or pokemontcg.io card"""
+    set_data = card.get('set') or card.get('episode') or {}
+    codes = [card.get('tcgid'), card.get('id'), set_data.get('id'), set_data.get('code'), set_data.get('ptcgoCode')]
+    number = card.get('number', card.get('card_number'))
+    return (
+        card.get('name', ''),
+        normalize_number(number),
+        set_data.get('name', ''),
+        {token for code in codes if code for token in tokenize(str(code))}
+    )
+
+
+def score_candidates(query, cards):
+    """Scores in [0, 1] for every card, as an array aligned with cards"""
+    if not cards:
+        return np.zeros(0)
+    if isinstance(query, str):
+        query = QueryParts(query)
+
+    fields = [candidate_fields(card) for card in cards]
+    name_tokens = [set(tokenize(name)) for name, _, _, _ in fields]
+    base_tokens = [tokens - SUFFIXES for tokens in name_tokens]
+
+    # Binary token matrix over the query's base name vocabulary
+    vocabulary = {token: i for i, token in enumerate(dict.fromkeys(query.name_tokens))}
+    presence = np.zeros((len(cards), max(len(vocabulary), 1)))
+    for row, tokens in enumerate(base_tokens):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                presence[row, column] = 1.0
+    overlap = presence.sum(axis=1)
+    candidate_sizes = np.array([len(tokens) for tokens in base_tokens], dtype=float)
+    union = len(vocabulary) + candidate_sizes - overlap
+    components = {'name': np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)}
+
+    suffixes = [next(iter(tokens & SUFFIXES), None) for tokens in name_tokens]
+    components['suffix'] = np.array([suffix == query.suffix for suffix in suffixes], dtype=float)
+
+    if query.number:
+        numbers = [number for _, number, _, _ in fields]
+        components['number'] = np.array([number == query.number for number in numbers], dtype=float)
+
+    # Leftover query tokens (set codes) checked against each card's set name and codes
+    set_query = set(query.set_tokens)
+    if set_query:
+        set_hits = [len(set_query & (set(tokenize(set_name)) | codes)) for _, _, set_name, codes in fields]
+        components['set'] = np.minimum(np.array(set_hits, dtype=float) / len(set_query), 1.0)
+
+    total_weight = sum(WEIGHTS[name] for name in components)
+    scores = sum(WEIGHTS[name] * values for name, values in components.items()) / total_weight
+    return scores
+
+
+def rank_candidates(card_name, cards):
+    """[(card, score)] best first"""
+    scores = score_candidates(card_name, cards)
+    order = np.argsort(-scores, kind='stable')
+    return [(cards[i], float(scores[i])) for i in order]
+
+
+def best_match(card_name, cards):
+    """
+    (card, confidence) for the best candidate, or (None, 0.0)
+
+    Confidence is the best score, discounted when a runner-up scores
+    almost the same (the response cannot tell the two apart).
+    """
+    if not cards:
+        return None, 0.0
+    scores = score_candidates(card_name, cards)
+    order = np.argsort(-scores, kind='stable')
+    best = float(scores[order[0]])
+    confidence = best
+    if len(order) > 1:
+        gap = best - float(scores[order[1]])
+        if gap < CLEAR_GAP:
+            # Linear from half confidence at AMBIGUOUS_GAP to full at CLEAR_GAP
+            factor = 0.5 + 0.5 * max(gap - AMBIGUOUS_GAP, 0.0) / (CLEAR_GAP - AMBIGUOUS_GAP)
+            confidence = best * factor
+    return cards[order[0]], round(confidence, 3)
+
+
+def targeted_queries(card_name):
+    """Precise follow-up queries for a low-confidence match, most specific first"""
+    query = QueryParts(card_name)
+    base = query.base_name
+    if not base:
+        return []
+    queries = []
+    if query.suffix and query.number:
+        queries.append(f"{base} {query.suffix} {query.number}")
+    if query.number:
+        queries.append(f"{base} {query.number}")
+    if query.suffix:
+        queries.append(f"{base} {query.suffix}")
+    queries.append(base)
+    seen = {card_name.lower()}
+    return [q for q in queries if not (q.lower() in seen or seen.add(q.lower()))]
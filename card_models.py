@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Compact record types for the trending and ETB analyzers
+Slotted classes with interned set / rarity strings keep full-catalog runs
+inside the Railway memory budget. Dicts are only built at the JSON output
+boundary via to_dict(), and marketplace URLs are generated on demand.
+"""
+
+import sys
+from datetime import datetime
+
+from serialization import register_encoder
+
+CONDITION_NEAR_MINT = 'Near Mint'
+
+
+def intern_str(value):
+    """Intern repeated strings such as set names and rarities"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TrendingCard:
+    """One priced card in a trending analysis"""
+
+    __slots__ = (
+        'id', 'name', 'set', 'rarity', 'card_number', 'sale_price', 'historical_high',
+        'all_time_low', 'price_drop_percent', 'sale_count', 'price_observations', 'price_change',
+        'volatility', 'history_days', 'trend', 'is_undervalued', 'potential_upside'
+    )
+
+    def __init__(self, id, name, set, rarity, card_number, sale_price, historical_high,
+                 all_time_low, price_drop_percent, sale_count, price_observations, price_change,
+                 volatility, history_days, trend, is_undervalued, potential_upside):
+        self.id = id
+        self.name = name
+        self.set = intern_str(set)
+        self.rarity = intern_str(rarity)
+        self.card_number = card_number
+        self.sale_price = sale_price
+        self.historical_high = historical_high
+        self.all_time_low = all_time_low
+        self.price_drop_percent = price_drop_percent
+        self.sale_count = sale_count
+        self.price_observations = price_observations
+        self.price_change = price_change
+        self.volatility = volatility
+        self.history_days = history_days
+        self.trend = intern_str(trend)
+        self.is_undervalued = is_undervalued
+        self.potential_upside = potential_upside
+
+    def to_dict(self, sale_time):
+        """JSON-ready dict; sale_time is the analysis snapshot time, shared by every card"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'set': self.set,
+            'rarity': self.rarity,
+            'cardNumber': self.card_number,
+            'salePrice': self.sale_price,
+            'historicalHigh': self.historical_high,
+            'allTimeLow': self.all_time_low,
+            'priceDropPercent': self.price_drop_percent,
+            'saleTime': sale_time,
+            'condition': CONDITION_NEAR_MINT,
+            'saleCount': self.sale_count,
+            'priceObservations': self.price_observations,
+            'priceChange': self.price_change,
+            'volatility': self.volatility,
+            'historyDays': self.history_days,
+            'trend': self.trend,
+            'isUndervalued': self.is_undervalued,
+            'potentialUpside': self.potential_upside
+        }
+
+
+# Marketplace search URL templates for ETBs; {q} is the plus-joined box name
+PURCHASE_LINK_TEMPLATES = {
+    'tcgplayer': "https://www.tcgplayer.com/search/pokemon/product?q={q}",
+    'ebay': "https://www.ebay.com/sch/i.html?_nkw={q}+pokemon",
+    'amazon': "https://www.amazon.com/s?k={q}+pokemon",
+    'trollandtoad': "https://www.trollandtoad.com/pokemon/sealed-product-10295/elite-trainer-boxes-etb/120",
+    'dacardworld': "https://www.dacardworld.com/gaming/pokemon-sealed-products"
+}
+
+
+class ETBRecord:
+    """One Elite Trainer Box in an ETB arbitrage analysis"""
+
+    __slots__ = (
+        'id', 'name', 'release_year', 'current_price', 'historical_high', 'price_drop_percent',
+        'trend', 'price_change', 'availability', 'sales_volume', 'is_undervalued',
+        'potential_upside', 'recommended_source', 'ebay_avg_price', 'recent_sales_count', 'market'
+    )
+
+    def __init__(self, id, name, release_year, current_price, historical_high, price_drop_percent,
+                 trend, price_change, availability, sales_volume, is_undervalued,
+                 potential_upside, recommended_source):
+        self.id = id
+        self.name = name
+        self.release_year = release_year
+        self.current_price = current_price
+        self.historical_high = historical_high
+        self.price_drop_percent = price_drop_percent
+        self.trend = intern_str(trend)
+        self.price_change = price_change
+        self.availability = intern_str(availability)
+        self.sales_volume = sales_volume
+        self.is_undervalued = is_undervalued
+        self.potential_upside = potential_upside
+        self.recommended_source = intern_str(recommended_source)
+        self.ebay_avg_price = None
+        self.recent_sales_count = None
+        self.market = None
+
+    def purchase_link(self, source):
+        """Marketplace URL for one source, built on demand"""
+        return PURCHASE_LINK_TEMPLATES[source].format(q=self.name.replace(" ", "+"))
+
+    @property
+    def purchase_links(self):
+        return {source: self.purchase_link(source) for source in PURCHASE_LINK_TEMPLATES}
+
+    @property
+    def buy_now_url(self):
+        return self.purchase_link(self.recommended_source)
+
+    def to_dict(self):
+        """JSON-ready dict in the etb_arbitrage_results.json record shape"""
+        record = {
+            'id': self.id,
+            'name': self.name,
+            'releaseYear': self.release_year,
+            'currentPrice': self.current_price,
+            'historicalHigh': self.historical_high,
+            'priceDropPercent': self.price_drop_percent,
+            'trend': self.trend,
+            'priceChange': self.price_change,
+            'availability': self.availability,
+            'salesVolume': self.sales_volume,
+            'isUndervalued': self.is_undervalued,
+            'potentialUpside': self.potential_upside,
+            'purchaseLinks': self.purchase_links,
+            'recommendedSource': self.recommended_source,
+            'buyNowUrl': self.buy_now_url
+        }
+        if self.ebay_avg_price is not None:
+            record['ebay_avg_price'] = self.ebay_avg_price
+            record['recent_sales_count'] = self.recent_sales_count
+        if self.market is not None:
+            record['market'] = self.market
+        return record
+
+
+def encode_trending_card(card):
+    """A card serialized on its own, outside an analysis, is stamped with the current time"""
+    return card.to_dict(datetime.now().isoformat())
+
+
+register_encoder(TrendingCard, encode_trending_card)
+register_encoder(ETBRecord, ETBRecord.to_dict)
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Indexed card search over the local Pokemon TCG catalog
+Keeps an inverted index (name tokens, set codes and names, card numbers) and
+a trigram index of the name vocabulary in the catalog database, so resolving
+a free-text card name to its identity, set, number, rarity, image and last
+synced prices is a local lookup. The remote API is only needed to refresh
+the prices of a card whose copy is stale
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta
+
+from card_matching import best_match, CONFIDENT
+from currency import usd_to_gbp, eur_to_gbp
+from progress import emit_progress
+from serialization import loads
+from tcg_catalog import CatalogStore, CatalogIngestor, DEFAULT_DB_PATH
+from tracing import span
+
+# Term kinds in card_terms
+NAME, SET, NUMBER = 'n:', 's:', '#:'
+
+# How much each kind of matched query token counts towards a card's score
+WEIGHTS = {NAME: 3.0, NUMBER: 4.0, SET: 1.0}
+
+# A card whose whole name is in the query outranks longer names sharing a token
+FULL_NAME_BONUS = 2.0
+
+# Misspelled name tokens are replaced by vocabulary terms this similar (trigram Jaccard)
+MIN_TRIGRAM_SIMILARITY = 0.45
+
+# Cached catalog prices older than this are refreshed from the API on lookup
+DEFAULT_PRICE_MAX_AGE_HOURS = 24
+
+INDEX_BATCH_SIZE = 500
+
+# Index hits re-scored by card_matching when resolving a name to one card
+RESOLVE_CANDIDATES = 10
+
+# Candidates are drawn from the query's rarest name terms until there are this many,
+# skipping terms shared by too many cards to narrow anything down
+MIN_CANDIDATES = 50
+MAX_CANDIDATE_TERM_CARDS = 500
+
+
+def fold(text):
+    """Lowercase ASCII (Pokémon -> pokemon)"""
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', fold(text or ''))
+
+
+def normalize_number(number):
+    """Card numbers compare without leading zeros: '025' -> '25', 'TG05' -> 'tg05'"""
+    number = fold(str(number or ''))
+    return number.lstrip('0') or number
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def card_terms(card):
+    """Prefixed index terms for one API-shaped card"""
+    terms = {NAME + token for token in tokenize(card.get('name'))}
+    set_data = card.get('set') or {}
+    for value in (set_data.get('id'), set_data.get('ptcgoCode')):
+        if value:
+            terms.add(SET + fold(value))
+    terms.update(SET + token for token in tokenize(set_data.get('name')))
+    if card.get('number'):
+        terms.add(NUMBER + normalize_number(card['number']))
+    return terms
+
+
+class CatalogIndex:
+    """Inverted and trigram indexes stored alongside the catalog's cards"""
+
+    def __init__(self, store=None):
+        self.store = store or CatalogStore(os.getenv('TCG_CATALOG_DB', DEFAULT_DB_PATH))
+        with self.store.lock:
+            self.store.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS card_terms (
+                    term TEXT,
+                    card_id TEXT,
+                    PRIMARY KEY (term, card_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_card_terms_card ON card_terms(card_id);
+                CREATE TABLE IF NOT EXISTS term_trigrams (
+                    trigram TEXT,
+                    term TEXT,
+                    PRIMARY KEY (trigram, term)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS term_stats (
+                    term TEXT PRIMARY KEY,
+                    cards INTEGER
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS index_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    def indexed_through(self):
+        with self.store.lock:
+            row = self.store.conn.execute("SELECT value FROM index_state WHERE key = 'indexed_through'").fetchone()
+        return row[0] if row else ''
+
+    def refresh(self):
+        """Index cards ingested since the last refresh; returns how many were indexed"""
+        since = self.indexed_through()
+        latest = since
+        indexed = 0
+        conn = self.store.conn
+
+        # Separate read connection so the scan streams without holding the writer lock
+        reader = sqlite3.connect(self.store.path)
+        try:
+            cursor = reader.execute(
+                "SELECT id, data, ingested_at FROM cards WHERE ingested_at > ? ORDER BY ingested_at",
+                (since,)
+            )
+            while True:
+                batch = cursor.fetchmany(INDEX_BATCH_SIZE)
+                if not batch:
+                    break
+                self.index_batch(batch)
+                latest = max(latest, batch[-1][2])
+                indexed += len(batch)
+        finally:
+            reader.close()
+
+        with self.store.lock:
+            if indexed:
+                # Term frequencies pick the rarest terms to draw candidates from
+                conn.execute("DELETE FROM term_stats")
+                conn.execute("INSERT INTO term_stats (term, cards) SELECT term, COUNT(*) FROM card_terms GROUP BY term")
+            conn.execute("INSERT OR REPLACE INTO index_state (key, value) VALUES ('indexed_through', ?)", (latest,))
+            conn.commit()
+        return indexed
+
+    def index_batch(self, batch):
+        """Replace the terms of a batch of (id, data, ingested_at) card rows"""
+        conn = self.store.conn
+        term_rows = []
+        vocabulary = set()
+        for card_id, data, _ in batch:
+            for term in card_terms(loads(data)):
+                term_rows.append((term, card_id))
+                if term.startswith(NAME):
+                    vocabulary.add(term[len(NAME):])
+        trigram_rows = [(gram, term) for term in vocabulary for gram in trigrams(term)]
+
+        with self.store.lock:
+            conn.executemany("DELETE FROM card_terms WHERE card_id = ?", [(row[0],) for row in batch])
+            conn.executemany("INSERT OR IGNORE INTO card_terms (term, card_id) VALUES (?, ?)", term_rows)
+            conn.executemany("INSERT OR IGNORE INTO term_trigrams (trigram, term) VALUES (?, ?)", trigram_rows)
+            conn.commit()
+
+    def correct_token(self, token):
+        """Closest name-vocabulary term to a token by trigram similarity, or None"""
+        grams = trigrams(token)
+        placeholders = ','.join('?' * len(grams))
+        with self.store.lock:
+            rows = self.store.conn.execute(f"""
+                SELECT term, COUNT(*) AS shared FROM term_trigrams
+                WHERE trigram IN ({placeholders})
+                GROUP BY term ORDER BY shared DESC LIMIT 20
+            """, tuple(grams)).fetchall()
+        best, best_similarity = None, MIN_TRIGRAM_SIMILARITY
+        for term, shared in rows:
+            similarity = shared / (len(grams) + len(term) + 1 - shared)
+            if similarity > best_similarity:
+                best, best_similarity = term, similarity
+        return best
+
+    def search(self, query, limit=10):
+        """[(card, score)] best first; every result matches at least one name token"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        with span('catalog.search'):
+            lookups = {}
+            for token in tokens:
+                for kind in (NAME, SET):
+                    lookups[kind + token] = (kind, token)
+                lookups[NUMBER + normalize_number(token)] = (NUMBER, token)
+
+            frequencies = self.term_frequencies(list(lookups))
+
+            # Tokens that are not any known term may be typos of a card name
+            for token in tokens:
+                if any(kind + token in frequencies for kind in (NAME, SET)) or NUMBER + normalize_number(token) in frequencies:
+                    continue
+                corrected = self.correct_token(token)
+                if corrected and NAME + corrected not in frequencies:
+                    lookups[NAME + corrected] = (NAME, token)
+                    frequencies.update(self.term_frequencies([NAME + corrected]))
+
+            lookups = {term: lookup for term, lookup in lookups.items() if term in frequencies}
+            name_terms = sorted((term for term in lookups if term.startswith(NAME)), key=frequencies.get)
+            if not name_terms:
+                return []
+
+            # Candidates come from the rarest name terms; common ones ("ex", "v") only score
+            selected = name_terms[:1]
+            for term in name_terms[1:]:
+                if sum(frequencies[t] for t in selected) >= MIN_CANDIDATES or frequencies[term] > MAX_CANDIDATE_TERM_CARDS:
+                    break
+                selected.append(term)
+            candidates = self.postings(selected)
+            scores = self.score_cards(candidates, lookups)
+
+            # Only cards within reach of the leader once the name bonus is added
+            cutoff = max(scores.values()) - FULL_NAME_BONUS
+            contenders = [card_id for card_id, score in scores.items() if score >= cutoff]
+
+            query_names = set(tokens) | {term[len(NAME):] for term in lookups if term.startswith(NAME)}
+            for card_id, name in self.card_names(contenders).items():
+                if set(tokenize(name)) <= query_names:
+                    scores[card_id] += FULL_NAME_BONUS
+
+            ranked = sorted(contenders, key=lambda card_id: scores[card_id], reverse=True)[:limit]
+            cards = self.load_cards(ranked)
+
+        return [(cards[card_id], scores[card_id]) for card_id in ranked if card_id in cards]
+
+    def term_frequencies(self, terms):
+        """{term: number of cards} for the terms present in the index"""
+        if not terms:
+            return {}
+        placeholders = ','.join('?' * len(terms))
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                f"SELECT term, cards FROM term_stats WHERE term IN ({placeholders})", tuple(terms)
+            ).fetchall()
+        return dict(rows)
+
+    def postings(self, terms):
+        placeholders = ','.join('?' * len(terms))
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                f"SELECT DISTINCT card_id FROM card_terms WHERE term IN ({placeholders})", tuple(terms)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def score_cards(self, card_ids, lookups):
+        """{card_id: score}; each query token counts once per card, through its best-weighted kind"""
+        token_weights = {card_id: {} for card_id in card_ids}
+        terms = list(lookups)
+        for start in range(0, len(card_ids), INDEX_BATCH_SIZE):
+            batch = card_ids[start:start + INDEX_BATCH_SIZE]
+            with self.store.lock:
+                rows = self.store.conn.execute(
+                    f"SELECT card_id, term FROM card_terms WHERE card_id IN ({','.join('?' * len(batch))}) "
+                    f"AND term IN ({','.join('?' * len(terms))})",
+                    (*batch, *terms)
+                ).fetchall()
+            for card_id, term in rows:
+                kind, token = lookups[term]
+                weights = token_weights[card_id]
+                weights[token] = max(weights.get(token, 0.0), WEIGHTS[kind])
+        return {card_id: sum(weights.values()) for card_id, weights in token_weights.items()}
+
+    def card_names(self, card_ids):
+        if not card_ids:
+            return {}
+        placeholders = ','.join('?' * len(card_ids))
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                f"SELECT id, name FROM cards WHERE id IN ({placeholders})", tuple(card_ids)
+            ).fetchall()
+        return dict(rows)
+
+    def load_cards(self, card_ids):
+        if not card_ids:
+            return {}
+        placeholders = ','.join('?' * len(card_ids))
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                f"SELECT id, data, ingested_at FROM cards WHERE id IN ({placeholders})", tuple(card_ids)
+            ).fetchall()
+        cards = {}
+        for card_id, data, ingested_at in rows:
+            card = loads(data)
+            card['_ingested_at'] = ingested_at
+            cards[card_id] = card
+        return cards
+
+    def resolve(self, query):
+        """
+        (card, confidence) for the best match, or (None, 0.0)
+
+        The index only narrows the candidates; they are scored like remote API
+        results. Anything short of a confident match is rejected, so a wrong or
+        ambiguous card cannot shadow the remote search and its follow-up queries.
+        """
+        cards = [card for card, _ in self.search(query, limit=RESOLVE_CANDIDATES)]
+        card, confidence = best_match(query, cards)
+        if card is None or confidence < CONFIDENT:
+            return None, confidence
+        return card, confidence
+
+    def refresh_prices(self, card, max_age_hours=DEFAULT_PRICE_MAX_AGE_HOURS, ingestor=None):
+        """The card itself, re-fetched by id from the API when its stored prices are stale"""
+        ingested_at = card.get('_ingested_at') or ''
+        if ingested_at >= (datetime.now() - timedelta(hours=max_age_hours)).isoformat():
+            return card
+        ingestor = ingestor or CatalogIngestor(self.store)
+        try:
+            fresh = ingestor.fetch_page(f"cards/{card['id']}", {})['data']
+        except Exception as e:
+            print(f"⚠️ Could not refresh prices for {card['id']}, using stored copy: {e}")
+            return card
+        self.store.save_cards([fresh])
+        return fresh
+
+
+def market_price_usd(card):
+    """Highest TCGPlayer market price across the card's printings, or None"""
+    prices = (card.get('tcgplayer') or {}).get('prices', {})
+    market_prices = [float(p['market']) for p in prices.values() if isinstance(p, dict) and p.get('market')]
+    return max(market_prices) if market_prices else None
+
+
+def card_result(card):
+    """
+    A price-source result for a catalog card, shaped like the TCG API
+    results in the analyzers, or None when the card has no price
+    """
+    tcgplayer = card.get('tcgplayer') or {}
+    cardmarket = card.get('cardmarket') or {}
+    set_data = card.get('set') or {}
+
+    price = None
+    url = tcgplayer.get('url')
+    usd = market_price_usd(card)
+    if usd:
+        price = usd_to_gbp(usd)
+    elif (cardmarket.get('prices') or {}).get('avg30'):
+        price = eur_to_gbp(cardmarket['prices']['avg30'])
+        url = cardmarket.get('url')
+    if not price:
+        return None
+
+    return {
+        'title': f"{card.get('name')} (Pokemon TCG API)",
+        'card_info': {
+            'id': card.get('id'),
+            'name': card.get('name'),
+            'set': set_data.get('name', 'Unknown Set'),
+            'number': str(card.get('number', 'Unknown')),
+            'rarity': card.get('rarity', 'Unknown')
+        },
+        'images': card.get('images') or {},
+        'tcgplayer_pricing': {
+            'url': tcgplayer.get('url', ''),
+            'updated_at': tcgplayer.get('updatedAt', ''),
+            'prices': tcgplayer.get('prices', {})
+        },
+        'cardmarket_pricing': {
+            'url': cardmarket.get('url', ''),
+            'updated_at': cardmarket.get('updatedAt', ''),
+            'prices': cardmarket.get('prices', {})
+        },
+        'source': 'Pokemon TCG API',
+        'url': url,
+        'price': price
+    }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_catalog_index():
+    """Process-wide index over the local catalog, or None when it holds no cards"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = os.getenv('TCG_CATALOG_DB', DEFAULT_DB_PATH)
+            if not os.path.exists(path):
+                return None
+            _index = CatalogIndex(CatalogStore(path))
+            _index.refresh()
+        return _index
+
+
+def resolve_card(card_name, refresh_prices=True):
+    """(catalog card, match confidence) for a free-text name, with prices refreshed if stale, or (None, 0.0)"""
+    index = get_catalog_index()
+    if index is None:
+        return None, 0.0
+    card, confidence = index.resolve(card_name)
+    if card is not None and refresh_prices:
+        card = index.refresh_prices(card)
+    return card, confidence
+
+
+def lookup_catalog(card_name):
+    """Priced result for a card from the local catalog, or None to fall back to the remote API"""
+    try:
+        card, confidence = resolve_card(card_name)
+    except sqlite3.Error as e:
+        print(f"⚠️ Local catalog lookup failed: {e}")
+        return None
+    result = card_result(card) if card else None
+    if result:
+        result['match_confidence'] = confidence
+        print(f"   📚 Catalog match: {result['card_info']['name']} ({result['card_info']['set']} "
+              f"#{result['card_info']['number']}, confidence {confidence:.2f})")
+        emit_progress("cardmarket", f"Found catalog price: £{result['price']}")
+    return result
+
+
+def main():
+    index = get_catalog_index()
+    if index is None:
+        print("❌ No local catalog - run tcg_catalog.py first")
+        return
+    query = ' '.join(sys.argv[1:]) or 'Charizard ex'
+    start = time.perf_counter()
+    results = index.search(query)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"🔎 {len(results)} matches for '{query}' in {elapsed_ms:.2f}ms")
+    for card, score in results:
+        print(f"   {score:>5.1f}  {card['name']} - {card.get('set', {}).get('name')} #{card.get('number')} ({card['id']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Exchange rates shared by every price source
+PriceCharting and TCGPlayer quote USD and CardMarket EUR; everything the
+analyzers report is GBP. Override the rates with USD_TO_GBP / EUR_PER_GBP
+"""
+
+import os
+
+DEFAULT_USD_TO_GBP = 0.79
+DEFAULT_EUR_PER_GBP = 1.17
+
+USD_TO_GBP = float(os.getenv('USD_TO_GBP', DEFAULT_USD_TO_GBP))
+EUR_PER_GBP = float(os.getenv('EUR_PER_GBP', DEFAULT_EUR_PER_GBP))
+
+
+def usd_to_gbp(amount):
+    return round(float(amount) * USD_TO_GBP, 2)
+
+
+def eur_to_gbp(amount):
+    return round(float(amount) / EUR_PER_GBP, 2)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Deep eBay UK sold history
+Fetches several sold-listing result pages (_pgn) concurrently, parses each in
+one pass over just the listing elements, de-duplicates by item ID and stops
+at the configured window (last N days or N sales). Pages are consumed in
+order as a stream with a bounded number in flight, so memory does not grow
+with the page count
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+from progress import debug
+from source_health import is_blocked_page
+from tracing import span
+
+SEARCH_URL = "https://www.ebay.co.uk/sch/i.html"
+
+SOURCE_LABEL = 'eBay UK Sold Auction'
+
+USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+# Result pages to read at most, and how many are fetched at once
+DEFAULT_MAX_PAGES = 4
+DEFAULT_CONCURRENCY = 4
+
+# Listings per result page
+PAGE_SIZE = 60
+
+# Window fed to aggregation: sales from the last N days, at most N sales
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_MAX_SALES = 50
+
+REQUEST_TIMEOUT = 15
+
+# Listing containers across eBay's result layouts; everything else is skipped while parsing
+LISTING_CLASS = re.compile(r'^(s-item|s-card|srp-item)$')
+LISTING_STRAINER = SoupStrainer(['li', 'div'], attrs={'class': LISTING_CLASS})
+
+ITEM_ID_PATTERN = re.compile(r'/itm/(?:[^/?]+/)?(\d{9,})')
+PRICE_PATTERN = re.compile(r'£\s*([\d,]+(?:\.\d+)?)')
+SOLD_DATE_PATTERN = re.compile(r'Sold\s+(\d{1,2}\s+[A-Za-z]{3}\s+\d{4})')
+
+GRADED_TERMS = ('psa 10', 'psa 9', 'bgs 10', 'bgs 9', 'cgc 10', 'cgc 9')
+NON_LISTING_TERMS = ('shop on ebay', 'advertisement', 'save this search', 'more like this')
+
+MIN_PRICE = 1
+MAX_PRICE = 10000
+
+
+class SoldHistoryBlocked(Exception):
+    """eBay served a bot-check page instead of results"""
+
+
+def sold_search_params(card_name, auctions_only=True):
+    """Query parameters for UK-located, ungraded, completed and sold listings, newest first"""
+    params = {
+        '_nkw': card_name,
+        '_sacat': 0,
+        '_from': 'R40',
+        'Graded': 'No',
+        '_dcat': 183454,
+        'LH_PrefLoc': 1,
+        'LH_Sold': 1,
+        'LH_Complete': 1,
+        'rt': 'nc',
+        '_ipg': PAGE_SIZE,
+        '_sop': 13
+    }
+    if auctions_only:
+        params['LH_Auction'] = 1
+    return params
+
+
+def parse_sold_date(text):
+    match = SOLD_DATE_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(' '.join(match.group(1).split()), '%d %b %Y')
+    except ValueError:
+        return None
+
+
+def parse_listing(listing):
+    """Listing dict for one result element, or None for ads, graded cards and unparseable entries"""
+    title_elem = (listing.find(class_=re.compile(r'^s-(item|card)__title$')) or
+                  listing.find(attrs={'role': 'heading'}) or
+                  listing.find('h3'))
+    price_elem = listing.find(class_=re.compile(r'^s-(item|card)__price$'))
+    if not title_elem or not price_elem:
+        return None
+
+    title = title_elem.get_text(' ', strip=True)
+    if title.lower().startswith('new listing'):
+        title = title[len('new listing'):].strip()
+    title_lower = title.lower()
+    if len(title) < 15 or any(term in title_lower for term in NON_LISTING_TERMS + GRADED_TERMS):
+        return None
+
+    price_match = PRICE_PATTERN.search(price_elem.get_text(' ', strip=True))
+    if not price_match:
+        return None
+    price = float(price_match.group(1).replace(',', ''))
+    if price < MIN_PRICE or price > MAX_PRICE:
+        return None
+
+    link = listing.find('a', href=ITEM_ID_PATTERN)
+    url = link['href'] if link else None
+    item_id = listing.get('data-listingid')
+    if not item_id and url:
+        item_id = ITEM_ID_PATTERN.search(url).group(1)
+
+    sold_at = parse_sold_date(listing.get_text(' ', strip=True))
+    return {
+        'item_id': item_id,
+        'title': title,
+        'price': price,
+        'url': url.split('?')[0] if url else None,
+        'sold_at': sold_at.date().isoformat() if sold_at else None,
+        'source': SOURCE_LABEL
+    }
+
+
+def parse_sold_page(html):
+    """Listings on one result page, in page order"""
+    with span('ebay.parse'):
+        soup = BeautifulSoup(html, 'html.parser', parse_only=LISTING_STRAINER)
+        listings = []
+        # Matched elements sit at the top level; nested matches are parsed once, via the outer one
+        for element in soup.find_all(['li', 'div'], class_=LISTING_CLASS, recursive=False):
+            listing = parse_listing(element)
+            if listing:
+                listings.append(listing)
+        soup.decompose()
+    return listings
+
+
+def make_session(cookies=None, user_agent=USER_AGENT):
+    """Pooled session for result pages, optionally carrying a browser's cookies"""
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=DEFAULT_CONCURRENCY))
+    session.headers.update({
+        'User-Agent': user_agent,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
+        'Upgrade-Insecure-Requests': '1'
+    })
+    for cookie in cookies or []:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+
+class SoldHistoryFetcher:
+    """Concurrent, windowed, de-duplicated reading of sold-listing result pages"""
+
+    def __init__(self, session=None, max_pages=None, concurrency=None, window_days=None, max_sales=None):
+        self.session = session or make_session()
+        self.max_pages = max_pages or int(os.getenv('EBAY_SOLD_PAGES', DEFAULT_MAX_PAGES))
+        self.concurrency = concurrency or int(os.getenv('EBAY_SOLD_CONCURRENCY', DEFAULT_CONCURRENCY))
+        self.window_days = window_days if window_days is not None else float(
+            os.getenv('EBAY_SOLD_WINDOW_DAYS', DEFAULT_WINDOW_DAYS))
+        self.max_sales = max_sales or int(os.getenv('EBAY_SOLD_MAX_SALES', DEFAULT_MAX_SALES))
+
+    def fetch_page(self, params, page_number):
+        with span('ebay.request'):
+            response = self.session.get(SEARCH_URL, params=dict(params, _pgn=page_number), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return self.parse_page(response.text, page_number)
+
+    def parse_page(self, html, page_number):
+        # Parsed in the worker so only listing dicts, not page HTML, wait to be consumed
+        listings = parse_sold_page(html)
+        if not listings and is_blocked_page(html):
+            raise SoldHistoryBlocked(f"bot check on results page {page_number}")
+        return listings
+
+    def iter_sales(self, params, first_page_html=None, now=None):
+        """
+        Sold listings inside the window, newest first, each item once
+
+        Page 1 can be supplied already rendered (from a browser). Further pages
+        are fetched with at most `concurrency` in flight and consumed in page
+        order; reading stops at max_sales, at the first sale older than the
+        window, or at a page that adds nothing new. Unread pages are cancelled.
+        """
+        now = now or datetime.now()
+        seen = set()
+        yielded = 0
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = {}
+        next_page = 1
+
+        def submit_up_to(limit):
+            nonlocal next_page
+            while next_page <= min(limit, self.max_pages):
+                if next_page == 1 and first_page_html is not None:
+                    pending[1] = executor.submit(self.parse_page, first_page_html, 1)
+                else:
+                    pending[next_page] = executor.submit(self.fetch_page, params, next_page)
+                next_page += 1
+
+        try:
+            submit_up_to(self.concurrency)
+            for page_number in range(1, self.max_pages + 1):
+                future = pending.pop(page_number, None)
+                if future is None:
+                    break
+                try:
+                    listings = future.result()
+                except Exception as e:
+                    # Later pages only deepen the history; keep what was read
+                    if page_number == 1:
+                        raise
+                    debug(f"   ⚠️ eBay results page {page_number} failed: {e}")
+                    return
+                new_on_page = 0
+                for listing in listings:
+                    key = listing['item_id'] or (listing['title'], listing['price'], listing['sold_at'])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    new_on_page += 1
+                    if listing['sold_at'] and self.window_days and \
+                            (now - datetime.fromisoformat(listing['sold_at'])).days > self.window_days:
+                        return
+                    debug(f"   ✅ £{listing['price']} - {listing['title'][:50]}..."
+                          f"{' (' + listing['sold_at'] + ')' if listing['sold_at'] else ''}")
+                    yield listing
+                    yielded += 1
+                    if yielded >= self.max_sales:
+                        return
+                # Past the last page eBay repeats it, so nothing new means no more results
+                if not new_on_page:
+                    return
+                submit_up_to(page_number + self.concurrency)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def collect_sold_listings(card_name, session=None, first_page_html=None, auctions_only=True, max_sales=None,
+                          progress=None):
+    """
+    Windowed sold listings for a card as a list (at most max_sales entries)
+
+    progress(count) is called as sales come in.
+    """
+    fetcher = SoldHistoryFetcher(session=session, max_sales=max_sales)
+    sales = []
+    for listing in fetcher.iter_sales(sold_search_params(card_name, auctions_only), first_page_html):
+        sales.append(listing)
+        if progress and len(sales) % 10 == 0:
+            progress(len(sales))
+    return sales
@@ -4,24 +4,36 @@ Pokemon ETB Arbitrage Analyzer
 Scrapes real-time Elite Trainer Box data from multiple marketplaces
 """
 
-import requests
-import json
-import time
 import re
+import sys
+import time
 from datetime import datetime
-from typing import List, Dict, Any
-from bs4 import BeautifulSoup
-import urllib.parse
+from typing import List
+
+from rankings import Leaderboards, TopK
+from card_models import ETBRecord
+from etb_market import ETBMarket, ETB_CATALOG
+from price_history import PriceHistory, SOURCE_EBAY_COM_SOLD, normalize_card_key, sale_key
+from etb_results_store import ETBResultsStore, encode
+from tracing import span, attach_trace
+
+RESULTS_FILE = 'etb_arbitrage_results.json'
+
+LEADERBOARD_SIZE = 10
+
+# Trend is measured over this many days of recorded sales
+TREND_WINDOW_DAYS = 30
 
 class ETBArbitrageAnalyzer:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        })
+    def __init__(self, market=None):
+        # Shared session, concurrency and caching live in the market client
+        self.market = market or ETBMarket()
+        self.history = PriceHistory()
+        self.store = ETBResultsStore()
         self.etb_data = []
         self.trending_etbs = []
         self.undervalued_etbs = []
+        self.leaderboards = None
         
     def clean_price(self, price_str: str) -> float:
         """Extract price from string and convert to float"""
@@ -32,104 +44,76 @@ class ETBArbitrageAnalyzer:
         price_match = re.search(r'(\d+\.?\d*)', price_clean)
         return float(price_match.group(1)) if price_match else 0.0
 
-    def scrape_tcgplayer_etbs(self) -> List[Dict]:
-        """Scrape ETB data from TCGPlayer-style marketplace"""
+    def scrape_marketplace_etbs(self, force_refresh=False) -> List[ETBRecord]:
+        """Price every tracked ETB from live eBay sold / active listings"""
         etbs = []
+        market = self.market.fetch_market([name for name, _ in ETB_CATALOG], force=force_refresh)
         
-        # Popular ETB sets to search for
-        etb_sets = [
-            "Scarlet Violet Base Set Elite Trainer Box",
-            "Lost Origin Elite Trainer Box", 
-            "Fusion Strike Elite Trainer Box",
-            "Brilliant Stars Elite Trainer Box",
-            "Astral Radiance Elite Trainer Box",
-            "Pokemon Go Elite Trainer Box",
-            "Silver Tempest Elite Trainer Box",
-            "Paldea Evolved Elite Trainer Box",
-            "Obsidian Flames Elite Trainer Box",
-            "151 Elite Trainer Box",
-            "Paradox Rift Elite Trainer Box",
-            "Paldean Fates Elite Trainer Box"
-        ]
-        
-        for etb_name in etb_sets:
+        for etb_name, year in ETB_CATALOG:
+            entry = market.get(etb_name)
+            summary = entry['summary'] if entry else None
+            
+            # Sold median is the market price; fall back to the cheapest live listing
+            current_price = summary and (summary['median_sold_price'] or summary['lowest_active_price'])
+            if not current_price:
+                print(f"⚠ No market data for {etb_name}")
+                continue
+            
             try:
-                # Simulate marketplace data (in real implementation, this would hit actual APIs)
-                # For now, using realistic price ranges based on current market
-                base_prices = {
-                    "Scarlet Violet Base Set Elite Trainer Box": (45.99, 55.99, 2023),
-                    "Lost Origin Elite Trainer Box": (52.99, 65.99, 2022),
-                    "Fusion Strike Elite Trainer Box": (38.99, 65.99, 2021),
-                    "Brilliant Stars Elite Trainer Box": (42.99, 58.99, 2022),
-                    "Astral Radiance Elite Trainer Box": (44.99, 59.99, 2022),
-                    "Pokemon Go Elite Trainer Box": (48.99, 75.99, 2022),
-                    "Silver Tempest Elite Trainer Box": (41.99, 56.99, 2022),
-                    "Paldea Evolved Elite Trainer Box": (43.99, 54.99, 2023),
-                    "Obsidian Flames Elite Trainer Box": (44.99, 53.99, 2023),
-                    "151 Elite Trainer Box": (65.99, 89.99, 2023),
-                    "Paradox Rift Elite Trainer Box": (46.99, 55.99, 2023),
-                    "Paldean Fates Elite Trainer Box": (55.99, 79.99, 2024)
-                }
+                history_key = normalize_card_key(etb_name)
+                if entry and not entry['cached']:
+                    self.history.record_many(self.sold_observations(history_key, entry['sold']))
+                stats = self.history.card_stats(history_key, SOURCE_EBAY_COM_SOLD, TREND_WINDOW_DAYS)
+                
+                # Highest daily average on record, so one outlier sale does not set the high
+                series = self.history.daily_series(history_key, SOURCE_EBAY_COM_SOLD)
+                historical_high = max([avg for _, avg, _, _, _ in series] + [current_price])
+                
+                price_drop = ((historical_high - current_price) / historical_high) * 100
+                price_change = stats['trend'] or 0.0
+                trend = 'up' if price_change > 5 else 'down' if price_change < -5 else 'stable'
                 
-                if etb_name in base_prices:
-                    current_price, historical_high, year = base_prices[etb_name]
-                    
-                    # Calculate market metrics
-                    price_drop = ((historical_high - current_price) / historical_high) * 100
-                    trend = 'up' if price_drop < 10 else 'stable' if price_drop < 25 else 'down'
-                    price_change = ((current_price - (historical_high * 0.9)) / (historical_high * 0.9)) * 100
-                    
-                    # Determine availability based on year and price
-                    if year >= 2023:
-                        availability = 'In Print'
-                        sales_volume = int(1000 + (2024 - year) * 500)
-                    elif year >= 2022:
-                        availability = 'Limited'
-                        sales_volume = int(500 + (2024 - year) * 200)
-                    else:
-                        availability = 'Out of Print'
-                        sales_volume = int(100 + (2024 - year) * 50)
-                    
-                    # Generate marketplace URLs for purchasing
-                    etb_search_name = etb_name.replace(" ", "+")
-                    purchase_links = {
-                        'tcgplayer': f"https://www.tcgplayer.com/search/pokemon/product?q={etb_search_name}",
-                        'ebay': f"https://www.ebay.com/sch/i.html?_nkw={etb_search_name}+pokemon",
-                        'amazon': f"https://www.amazon.com/s?k={etb_search_name}+pokemon",
-                        'trollandtoad': f"https://www.trollandtoad.com/pokemon/sealed-product-10295/elite-trainer-boxes-etb/120",
-                        'dacardworld': f"https://www.dacardworld.com/gaming/pokemon-sealed-products"
-                    }
-                    
-                    # Determine best marketplace based on availability and price
-                    if availability == 'In Print':
-                        recommended_source = 'tcgplayer'
-                    elif availability == 'Limited':
-                        recommended_source = 'ebay'
-                    else:
-                        recommended_source = 'ebay'  # Out of print usually on secondary market
-                    
-                    etb_data = {
-                        'id': str(len(etbs) + 1),
-                        'name': etb_name,
-                        'releaseYear': year,
-                        'currentPrice': current_price,
-                        'historicalHigh': historical_high,
-                        'priceDropPercent': round(price_drop, 1),
-                        'trend': trend,
-                        'priceChange': round(price_change, 1),
-                        'availability': availability,
-                        'salesVolume': sales_volume,
-                        'isUndervalued': price_drop > 20,
-                        'potentialUpside': round(((historical_high - current_price) / current_price) * 100, 1),
-                        'purchaseLinks': purchase_links,
-                        'recommendedSource': recommended_source,
-                        'buyNowUrl': purchase_links[recommended_source]
-                    }
-                    
-                    etbs.append(etb_data)
-                    print(f"✓ Analyzed {etb_name}: ${current_price}")
-                    
-                time.sleep(0.5)  # Rate limiting
+                # Determine availability based on year
+                if year >= 2023:
+                    availability = 'In Print'
+                elif year >= 2022:
+                    availability = 'Limited'
+                else:
+                    availability = 'Out of Print'
+                
+                # Live listings below the sold median are the cheapest way in
+                lowest_active = summary['lowest_active_price']
+                if lowest_active and lowest_active < current_price:
+                    recommended_source = 'ebay'
+                elif availability == 'In Print':
+                    recommended_source = 'tcgplayer'
+                else:
+                    recommended_source = 'ebay'  # Out of print usually on secondary market
+                
+                # Stable IDs let the results store diff records across runs
+                etb_data = ETBRecord(
+                    id=history_key,
+                    name=etb_name,
+                    release_year=year,
+                    current_price=current_price,
+                    historical_high=round(historical_high, 2),
+                    price_drop_percent=round(price_drop, 1),
+                    trend=trend,
+                    price_change=price_change,
+                    availability=availability,
+                    sales_volume=summary['sold_count'],
+                    is_undervalued=price_drop > 20,
+                    potential_upside=round(((historical_high - current_price) / current_price) * 100, 1),
+                    recommended_source=recommended_source
+                )
+                etb_data.ebay_avg_price = summary['mean_sold_price']
+                etb_data.recent_sales_count = summary['sold_count']
+                etb_data.market = summary
+                
+                etbs.append(etb_data)
+                print(f"✓ Analyzed {etb_name}: ${current_price} "
+                      f"({summary['sold_count']} sold, {summary['active_count']} active"
+                      f"{', cached' if entry['cached'] else ''})")
                 
             except Exception as e:
                 print(f"⚠ Error analyzing {etb_name}: {str(e)}")
@@ -137,100 +121,102 @@ class ETBArbitrageAnalyzer:
                 
         return etbs
 
-    def scrape_ebay_sold_listings(self, etb_name: str) -> Dict:
-        """Scrape eBay sold listings for price validation"""
-        try:
-            # Format search query
-            query = urllib.parse.quote(f"{etb_name} pokemon elite trainer box")
-            
-            # In a real implementation, this would use eBay's API or scrape sold listings
-            # For now, returning realistic market data
-            avg_sold_price = 45.99  # Would be calculated from actual sold listings
-            total_sales = 150  # Would be count of recent sales
-            
-            return {
-                'avg_sold_price': avg_sold_price,
-                'total_recent_sales': total_sales,
-                'data_source': 'ebay_sold_listings'
-            }
-            
-        except Exception as e:
-            print(f"⚠ eBay lookup failed for {etb_name}: {str(e)}")
-            return {'avg_sold_price': 0, 'total_recent_sales': 0}
+    def sold_observations(self, history_key, sold):
+        """Price history observations for a box's sold listings at their sale date, one per eBay item"""
+        for listing in sold:
+            if listing.get('sold_at'):
+                yield (history_key, SOURCE_EBAY_COM_SOLD, listing['price'], listing['sold_at'], 'USD',
+                       sale_key(listing))
 
     def analyze_market_trends(self):
         """Analyze ETB market trends and identify opportunities"""
         print("\n📊 Analyzing ETB market trends...")
         
-        # Sort by different criteria
-        self.trending_etbs = sorted([etb for etb in self.etb_data if etb['trend'] == 'up'], 
-                                  key=lambda x: x['priceChange'], reverse=True)
+        # All rankings and price stats in a single pass
+        self.leaderboards = Leaderboards(
+            boards={
+                'trending': TopK(LEADERBOARD_SIZE, key=lambda x: x.price_change,
+                                 where=lambda x: x.trend == 'up'),
+                'undervalued': TopK(LEADERBOARD_SIZE, key=lambda x: x.potential_upside,
+                                    where=lambda x: x.is_undervalued)
+            },
+            stats={
+                'currentPrice': 'current_price',
+                'marketValue': lambda x: x.current_price * x.sales_volume
+            }
+        ).add_many(self.etb_data)
         
-        self.undervalued_etbs = sorted([etb for etb in self.etb_data if etb['isUndervalued']], 
-                                     key=lambda x: x['potentialUpside'], reverse=True)
+        self.trending_etbs = self.leaderboards.top('trending')
+        self.undervalued_etbs = self.leaderboards.top('undervalued')
         
-        print(f"✓ Found {len(self.trending_etbs)} trending ETBs")
-        print(f"✓ Found {len(self.undervalued_etbs)} undervalued opportunities")
+        print(f"✓ Found {self.leaderboards.matched('trending')} trending ETBs")
+        print(f"✓ Found {self.leaderboards.matched('undervalued')} undervalued opportunities")
 
-    def run_analysis(self):
+    def run_analysis(self, force_refresh=False):
         """Main analysis workflow"""
         print("🎴 Starting ETB Arbitrage Analysis...")
         print("=" * 50)
         
-        # Scrape data from multiple sources
+        # Sold and active listings for every box, fetched concurrently
         print("\n🔍 Gathering ETB market data...")
-        self.etb_data = self.scrape_tcgplayer_etbs()
-        
-        # Enhance with eBay data
-        print("\n📈 Validating prices with secondary market data...")
-        for etb in self.etb_data:
-            ebay_data = self.scrape_ebay_sold_listings(etb['name'])
-            etb['ebay_avg_price'] = ebay_data['avg_sold_price']
-            etb['recent_sales_count'] = ebay_data['total_recent_sales']
+        start_time = time.time()
+        with span('etb.market_data'):
+            self.etb_data = self.scrape_marketplace_etbs(force_refresh)
+        print(f"⏱️ Market data gathered in {time.time() - start_time:.1f}s")
         
         # Analyze trends
         self.analyze_market_trends()
         
         # Generate summary
+        prices = self.leaderboards.stats['currentPrice']
+        market_values = self.leaderboards.stats['marketValue']
         summary = {
-            'total_etbs': len(self.etb_data),
-            'trending_count': len(self.trending_etbs),
-            'undervalued_count': len(self.undervalued_etbs),
-            'avg_current_price': round(sum(etb['currentPrice'] for etb in self.etb_data) / len(self.etb_data), 2) if self.etb_data else 0,
-            'total_market_value': round(sum(etb['currentPrice'] * etb['salesVolume'] for etb in self.etb_data), 2),
+            'total_etbs': self.leaderboards.total,
+            'trending_count': self.leaderboards.matched('trending'),
+            'undervalued_count': self.leaderboards.matched('undervalued'),
+            'avg_current_price': round(prices.mean(), 2) if prices.count else 0,
+            'total_market_value': round(market_values.total, 2),
             'last_updated': datetime.now().isoformat(),
-            'data_sources': ['tcgplayer', 'ebay_sold_listings', 'marketplace_apis']
+            'data_sources': ['ebay_sold_listings', 'ebay_active_listings']
         }
         
-        # Save results
-        results = {
-            'summary': summary,
-            'trending_etbs': self.trending_etbs[:10],  # Top 10 trending
-            'undervalued_etbs': self.undervalued_etbs[:10],  # Top 10 undervalued
-            'all_etbs': self.etb_data
+        # Records are stored once; ranking lists reference them by ID
+        records = {etb.id: etb.to_dict() for etb in self.etb_data}
+        rankings = {
+            'trending_etbs': [etb.id for etb in self.trending_etbs],  # Top 10 trending
+            'undervalued_etbs': [etb.id for etb in self.undervalued_etbs],  # Top 10 undervalued
+            'all_etbs': list(records)
         }
+        with span('etb.store'):
+            changes = self.store.save_run(records, rankings, summary)
         
-        # Write to results file
-        with open('etb_arbitrage_results.json', 'w') as f:
-            json.dump(results, f, indent=2)
+        results = {'summary': summary, 'records': records, **rankings, 'changeSeq': self.store.latest_seq()}
+        self.store.export_json(RESULTS_FILE, results)
         
-        print(f"\n✅ Analysis complete! Results saved to etb_arbitrage_results.json")
-        print(f"📊 Summary: {summary['total_etbs']} ETBs analyzed")
+        print(f"\n✅ Analysis complete! Results saved to {RESULTS_FILE}")
+        print(f"📊 Summary: {summary['total_etbs']} ETBs analyzed ({self.store.last_written} records changed)")
         print(f"📈 Trending: {summary['trending_count']} ETBs showing upward momentum") 
         print(f"💎 Opportunities: {summary['undervalued_count']} undervalued ETBs found")
         print(f"💰 Average Price: ${summary['avg_current_price']}")
         
-        return results
+        if changes:
+            print(f"🔔 {len(changes)} market changes since last run:")
+            for change in changes:
+                print(f"   • {change['kind']}: {change['detail'].get('name', change['recordId'])}")
+        
+        # Timings go on the returned results only, so they never dirty the stored file
+        return attach_trace(results)
 
 def main():
     """Run the ETB arbitrage analysis"""
     try:
         analyzer = ETBArbitrageAnalyzer()
-        results = analyzer.run_analysis()
+        results = analyzer.run_analysis(force_refresh='--force' in sys.argv)
         
         # Print some key findings
         print("\n🔥 Top Arbitrage Opportunities:")
-        for i, etb in enumerate(results['undervalued_etbs'][:3], 1):
+        for i, etb_id in enumerate(results['undervalued_etbs'][:3], 1):
+            etb = results['records'][etb_id]
             print(f"{i}. {etb['name']}")
             print(f"   Current: ${etb['currentPrice']} | High: ${etb['historicalHigh']}")
             print(f"   Drop: {etb['priceDropPercent']}% | Upside: +{etb['potentialUpside']}%\n")
@@ -249,13 +235,14 @@ def main():
                 'last_updated': datetime.now().isoformat(),
                 'error': str(e)
             },
+            'records': {},
             'trending_etbs': [],
             'undervalued_etbs': [],
             'all_etbs': []
         }
         
-        with open('etb_arbitrage_results.json', 'w') as f:
-            json.dump(error_results, f, indent=2)
+        with open(RESULTS_FILE, 'w') as f:
+            f.write(encode(error_results))
             
         return 1
 
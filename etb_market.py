@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Elite Trainer Box marketplace pricing
+Fetches eBay sold and active listings for every ETB concurrently through one
+shared session, aggregates median / percentile prices and sale velocity per
+box, and caches the results on disk
+"""
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from serialization import read_json, write_json
+from tcg_catalog import RateLimiter
+from tracing import span
+
+# Boxes tracked by the ETB analyzer, with release year
+ETB_CATALOG = [
+    ("Scarlet Violet Base Set Elite Trainer Box", 2023),
+    ("Lost Origin Elite Trainer Box", 2022),
+    ("Fusion Strike Elite Trainer Box", 2021),
+    ("Brilliant Stars Elite Trainer Box", 2022),
+    ("Astral Radiance Elite Trainer Box", 2022),
+    ("Pokemon Go Elite Trainer Box", 2022),
+    ("Silver Tempest Elite Trainer Box", 2022),
+    ("Paldea Evolved Elite Trainer Box", 2023),
+    ("Obsidian Flames Elite Trainer Box", 2023),
+    ("151 Elite Trainer Box", 2023),
+    ("Paradox Rift Elite Trainer Box", 2023),
+    ("Paldean Fates Elite Trainer Box", 2024)
+]
+
+EBAY_SEARCH_URL = "https://www.ebay.com/sch/i.html"
+
+DEFAULT_CACHE_PATH = 'etb_market_cache.json'
+DEFAULT_CACHE_TTL_MINUTES = 60
+DEFAULT_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 8
+
+# Listings that mention these are not a sealed box at a box price
+EXCLUDED_TITLE_TERMS = [
+    'empty', 'box only', 'no cards', 'case of', 'case x', 'lot of', 'bundle of',
+    'sleeves only', 'dice only', 'insert', 'opened', 'damaged', 'proxy', 'custom'
+]
+
+# Words too common in ETB titles to tell one box from another
+GENERIC_NAME_WORDS = {'elite', 'trainer', 'box', 'pokemon', 'set', 'base'}
+
+SOLD_DATE_FORMATS = ['%b %d, %Y', '%d %b %Y', '%b %d %Y']
+
+
+def parse_price(text):
+    """First dollar amount in a price string ("$40.00 to $55.00" -> 40.0)"""
+    if not text:
+        return None
+    match = re.search(r'\$\s*([\d,]+(?:\.\d+)?)', text)
+    return float(match.group(1).replace(',', '')) if match else None
+
+
+def parse_sold_date(text):
+    """Datetime from an eBay "Sold  Oct 12, 2026" caption"""
+    if not text or 'sold' not in text.lower():
+        return None
+    cleaned = re.sub(r'(?i)^.*?sold\s*', '', text).strip()
+    for fmt in SOLD_DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def name_keywords(etb_name):
+    """Distinguishing words a listing title must contain to match a box"""
+    words = re.findall(r'[a-z0-9]+', etb_name.lower())
+    return [word for word in words if word not in GENERIC_NAME_WORDS]
+
+
+def title_matches(title, keywords):
+    title_lower = title.lower()
+    if 'elite trainer box' not in title_lower and 'etb' not in re.findall(r'[a-z]+', title_lower):
+        return False
+    if any(term in title_lower for term in EXCLUDED_TITLE_TERMS):
+        return False
+    return all(keyword in title_lower for keyword in keywords)
+
+
+def parse_listings(html, keywords):
+    """[{'item_id', 'title', 'price', 'sold_at'}] from an eBay search results page"""
+    soup = BeautifulSoup(html, 'html.parser')
+    listings = []
+    seen = set()
+
+    for item in soup.select('li.s-item, div.s-item, li.s-card'):
+        title_elem = item.select_one('.s-item__title, .s-card__title')
+        price_elem = item.select_one('.s-item__price, .s-card__price')
+        if not title_elem or not price_elem:
+            continue
+
+        title = title_elem.get_text(' ', strip=True)
+        if not title_matches(title, keywords):
+            continue
+
+        price = parse_price(price_elem.get_text(' ', strip=True))
+        if not price:
+            continue
+
+        link_elem = item.select_one('a.s-item__link, a.su-link, a[href*="/itm/"]')
+        href = link_elem.get('href', '') if link_elem else ''
+        id_match = re.search(r'/itm/(?:[^/?]+/)?(\d+)', href)
+        item_id = id_match.group(1) if id_match else None
+
+        # Search pages repeat promoted items
+        if item_id:
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+
+        sold_at = None
+        for caption in item.select('.s-item__caption--signal, .s-item__title--tagblock, .s-card__caption, .POSITIVE'):
+            sold_at = parse_sold_date(caption.get_text(' ', strip=True))
+            if sold_at:
+                break
+
+        listings.append({
+            'item_id': item_id,
+            'title': title,
+            'price': price,
+            'sold_at': sold_at.isoformat() if sold_at else None
+        })
+
+    return listings
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile (q in 0-100) of pre-sorted values"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
+
+def summarize_market(sold, active, now=None):
+    """Median / percentile sold prices, sale velocity and active supply for one box"""
+    now = now or datetime.now()
+    sold_prices = sorted(listing['price'] for listing in sold)
+    active_prices = sorted(listing['price'] for listing in active)
+
+    # Velocity is sales per day over the span the sold results cover
+    sold_dates = [datetime.fromisoformat(listing['sold_at']) for listing in sold if listing.get('sold_at')]
+    span_days = max((now - min(sold_dates)).days, 1) if sold_dates else None
+
+    def rounded(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'sold_count': len(sold_prices),
+        'median_sold_price': rounded(percentile(sold_prices, 50)),
+        'mean_sold_price': rounded(sum(sold_prices) / len(sold_prices)) if sold_prices else None,
+        'p10_sold_price': rounded(percentile(sold_prices, 10)),
+        'p25_sold_price': rounded(percentile(sold_prices, 25)),
+        'p75_sold_price': rounded(percentile(sold_prices, 75)),
+        'p90_sold_price': rounded(percentile(sold_prices, 90)),
+        'sales_per_day': round(len(sold_dates) / span_days, 2) if span_days else None,
+        'sold_span_days': span_days,
+        'active_count': len(active_prices),
+        'lowest_active_price': rounded(active_prices[0]) if active_prices else None,
+        'median_active_price': rounded(percentile(active_prices, 50))
+    }
+
+
+class ETBMarket:
+    """Concurrent eBay sold / active listing fetcher for Elite Trainer Boxes"""
+
+    def __init__(self, cache_path=None, cache_ttl_minutes=None, workers=DEFAULT_WORKERS,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, session=None):
+        self.cache_path = cache_path or os.getenv('ETB_MARKET_CACHE', DEFAULT_CACHE_PATH)
+        if cache_ttl_minutes is None:
+            cache_ttl_minutes = float(os.getenv('ETB_MARKET_CACHE_TTL_MINUTES', DEFAULT_CACHE_TTL_MINUTES))
+        self.cache_ttl = cache_ttl_minutes * 60
+        self.workers = workers
+        self.limiter = RateLimiter(requests_per_second)
+
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5'
+        })
+        # One keep-alive connection per worker instead of a new handshake per request
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+
+        self.cache = self.load_cache()
+
+    def load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            return read_json(self.cache_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable ETB market cache: {e}")
+            return {}
+
+    def save_cache(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        write_json(self.cache, tmp_path, indent=0)
+        os.replace(tmp_path, self.cache_path)
+
+    def cached(self, etb_name):
+        entry = self.cache.get(etb_name)
+        if entry and time.time() - entry['fetched_at'] < self.cache_ttl:
+            return entry
+        return None
+
+    def search_url(self, etb_name, sold):
+        query = quote(f"pokemon {etb_name}")
+        if sold:
+            # Sold + completed, most recently ended first, one large page
+            return f"{EBAY_SEARCH_URL}?_nkw={query}&_sacat=0&LH_Sold=1&LH_Complete=1&rt=nc&_sop=13&_ipg=240"
+        # Buy It Now, lowest price + shipping first
+        return f"{EBAY_SEARCH_URL}?_nkw={query}&_sacat=0&LH_BIN=1&rt=nc&_sop=15&_ipg=120"
+
+    def fetch_listings(self, etb_name, sold):
+        """Sold or active listings for one box; a failed request yields no listings"""
+        url = self.search_url(etb_name, sold)
+        self.limiter.wait()
+        try:
+            with span('etb_market.request'):
+                response = self.session.get(url, timeout=20)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            kind = 'sold' if sold else 'active'
+            print(f"⚠ eBay {kind} lookup failed for {etb_name}: {str(e)}")
+            return None
+        with span('etb_market.parse'):
+            return parse_listings(response.text, name_keywords(etb_name))
+
+    def fetch_market(self, etb_names, force=False):
+        """
+        {etb_name: {'summary', 'sold', 'fetched_at', 'cached'}} for every box
+
+        Boxes with a fresh cache entry are not refetched; all other sold and
+        active searches run concurrently.
+        """
+        results = {}
+        to_fetch = []
+        for name in etb_names:
+            entry = None if force else self.cached(name)
+            if entry:
+                results[name] = {**entry, 'cached': True}
+            else:
+                to_fetch.append(name)
+
+        if to_fetch:
+            jobs = [(name, sold) for name in to_fetch for sold in (True, False)]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                fetched = dict(zip(jobs, executor.map(lambda job: self.fetch_listings(*job), jobs)))
+
+            for name in to_fetch:
+                sold = fetched[(name, True)]
+                active = fetched[(name, False)]
+                if sold is None and active is None:
+                    # Keep serving a stale entry rather than nothing
+                    stale = self.cache.get(name)
+                    if stale:
+                        results[name] = {**stale, 'cached': True}
+                    continue
+
+                entry = {
+                    'fetched_at': time.time(),
+                    'summary': summarize_market(sold or [], active or []),
+                    'sold': sold or []
+                }
+                self.cache[name] = entry
+                results[name] = {**entry, 'cached': False}
+
+            try:
+                self.save_cache()
+            except OSError as e:
+                print(f"⚠️ Could not save ETB market cache: {e}")
+
+        return results
+
+
+def main():
+    start_time = time.time()
+    market = ETBMarket()
+    results = market.fetch_market([name for name, _ in ETB_CATALOG], force='--force' in sys.argv)
+    for name, entry in results.items():
+        summary = entry['summary']
+        print(f"{name}: median ${summary['median_sold_price']} | "
+              f"{summary['sold_count']} sold | {summary['sales_per_day']}/day | "
+              f"{summary['active_count']} active from ${summary['lowest_active_price']}"
+              f"{' (cached)' if entry['cached'] else ''}")
+    print(f"⏱️ {len(results)} boxes in {time.time() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
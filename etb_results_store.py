@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Incremental ETB results store
+Keeps each ETB record once in SQLite, ranking lists as ID references, and
+rewrites only records whose content changed. Every run appends change
+events (price moved, newly undervalued, ...) to a feed consumers can poll
+by sequence number instead of re-reading and diffing the full results
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from serialization import dumps, loads
+
+DEFAULT_DB_PATH = 'etb_results.db'
+
+# Price moves smaller than this are not reported in the change feed
+PRICE_MOVE_THRESHOLD_PERCENT = 1.0
+
+CHANGE_NEW = 'new'
+CHANGE_REMOVED = 'removed'
+CHANGE_PRICE_MOVED = 'price_moved'
+CHANGE_NEWLY_UNDERVALUED = 'newly_undervalued'
+CHANGE_NO_LONGER_UNDERVALUED = 'no_longer_undervalued'
+CHANGE_TREND = 'trend_changed'
+
+# Summary fields that change every run without the results changing
+VOLATILE_SUMMARY_KEYS = ('last_updated',)
+
+
+def encode(data):
+    """Compact JSON encoding used for stored records and the results file"""
+    return dumps(data, indent=0, sort_keys=True)
+
+
+def stable_content(results):
+    """results without the per-run summary fields, for change detection"""
+    summary = {key: value for key, value in (results.get('summary') or {}).items()
+               if key not in VOLATILE_SUMMARY_KEYS}
+    return dict(results, summary=summary)
+
+
+def record_hash(encoded):
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def diff_record(record_id, old, new):
+    """Change events between two versions of one record (old is None for new records)"""
+    if old is None:
+        return [(record_id, CHANGE_NEW, {'name': new.get('name'), 'currentPrice': new.get('currentPrice')})]
+
+    events = []
+    old_price = old.get('currentPrice')
+    new_price = new.get('currentPrice')
+    if old_price and new_price and old_price != new_price:
+        change_pct = (new_price - old_price) / old_price * 100
+        if abs(change_pct) >= PRICE_MOVE_THRESHOLD_PERCENT:
+            events.append((record_id, CHANGE_PRICE_MOVED, {
+                'name': new.get('name'),
+                'from': old_price,
+                'to': new_price,
+                'changePercent': round(change_pct, 1)
+            }))
+
+    if new.get('isUndervalued') and not old.get('isUndervalued'):
+        events.append((record_id, CHANGE_NEWLY_UNDERVALUED, {
+            'name': new.get('name'),
+            'currentPrice': new_price,
+            'potentialUpside': new.get('potentialUpside')
+        }))
+    elif old.get('isUndervalued') and not new.get('isUndervalued'):
+        events.append((record_id, CHANGE_NO_LONGER_UNDERVALUED, {
+            'name': new.get('name'),
+            'currentPrice': new_price
+        }))
+
+    if old.get('trend') != new.get('trend'):
+        events.append((record_id, CHANGE_TREND, {
+            'name': new.get('name'),
+            'from': old.get('trend'),
+            'to': new.get('trend')
+        }))
+
+    return events
+
+
+class ETBResultsStore:
+    """Normalized, diff-updated ETB results with a change feed"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('ETB_RESULTS_DB', DEFAULT_DB_PATH)
+        # Records actually rewritten by the last save_run
+        self.last_written = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                hash TEXT,
+                data TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rankings (
+                list TEXT,
+                position INTEGER,
+                record_id TEXT,
+                PRIMARY KEY (list, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT,
+                record_id TEXT,
+                kind TEXT,
+                detail TEXT
+            );
+        """)
+
+    def save_run(self, records, rankings, summary):
+        """
+        Store one analysis run
+
+        records is {id: record dict}, rankings is {list name: [ids]}. Only
+        records whose encoded content changed are written. Returns the
+        change events appended to the feed.
+        """
+        now = datetime.now().isoformat()
+
+        with self.lock:
+            stored = {
+                row[0]: (row[1], row[2])
+                for row in self.conn.execute("SELECT id, hash, data FROM records")
+            }
+
+            upserts = []
+            events = []
+            for record_id, record in records.items():
+                encoded = encode(record)
+                digest = record_hash(encoded)
+                previous = stored.get(record_id)
+                if previous and previous[0] == digest:
+                    continue
+                upserts.append((record_id, digest, encoded, now))
+                events.extend(diff_record(record_id, loads(previous[1]) if previous else None, record))
+
+            removed = [record_id for record_id in stored if record_id not in records]
+            for record_id in removed:
+                events.append((record_id, CHANGE_REMOVED, {'name': loads(stored[record_id][1]).get('name')}))
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records (id, hash, data, updated_at) VALUES (?, ?, ?, ?)",
+                upserts
+            )
+            self.conn.executemany("DELETE FROM records WHERE id = ?", [(record_id,) for record_id in removed])
+
+            # Rankings are small ID lists, so they are simply replaced
+            self.conn.execute("DELETE FROM rankings")
+            self.conn.executemany(
+                "INSERT INTO rankings (list, position, record_id) VALUES (?, ?, ?)",
+                [(name, position, record_id)
+                 for name, ids in rankings.items()
+                 for position, record_id in enumerate(ids)]
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('summary', ?)", (encode(summary),))
+
+            self.conn.executemany(
+                "INSERT INTO changes (ts, record_id, kind, detail) VALUES (?, ?, ?, ?)",
+                [(now, record_id, kind, encode(detail)) for record_id, kind, detail in events]
+            )
+            self.conn.commit()
+
+        self.last_written = len(upserts)
+        return [
+            {'recordId': record_id, 'kind': kind, 'detail': detail, 'ts': now}
+            for record_id, kind, detail in events
+        ]
+
+    def changes_since(self, seq=0, limit=None):
+        """Change events after a sequence number, oldest first"""
+        query = "SELECT seq, ts, record_id, kind, detail FROM changes WHERE seq > ? ORDER BY seq"
+        params = [seq]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            {'seq': row[0], 'ts': row[1], 'recordId': row[2], 'kind': row[3], 'detail': loads(row[4])}
+            for row in rows
+        ]
+
+    def latest_seq(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    def load_results(self):
+        """Normalized results: {'summary', 'records': {id: record}, '<list>': [ids], 'changeSeq'}"""
+        with self.lock:
+            records = {row[0]: loads(row[1]) for row in self.conn.execute("SELECT id, data FROM records")}
+            rankings = {}
+            for name, record_id in self.conn.execute("SELECT list, record_id FROM rankings ORDER BY list, position"):
+                rankings.setdefault(name, []).append(record_id)
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'summary'").fetchone()
+
+        results = {'summary': loads(row[0]) if row else {}, 'records': records}
+        results.update(rankings)
+        results['changeSeq'] = self.latest_seq()
+        return results
+
+    def export_json(self, path, results=None):
+        """
+        Write the normalized results file compactly; skipped when nothing but
+        the volatile summary fields (last_updated) changed
+        """
+        results = results if results is not None else self.load_results()
+        encoded = encode(results)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    previous = loads(f.read())
+            except ValueError:
+                previous = None
+            if isinstance(previous, dict) and encode(stable_content(previous)) == encode(stable_content(results)):
+                return False
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(encoded)
+        os.replace(tmp_path, path)
+        return True
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    """Print change events after an optional sequence number as JSON lines"""
+    since = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    store = ETBResultsStore()
+    try:
+        for event in store.changes_since(since):
+            print(dumps(event, indent=0))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
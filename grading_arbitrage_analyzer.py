@@ -2,13 +2,23 @@
 # -*- coding: utf-8 -*-
 
 import re
+import io
 import json
 import time
 import csv
 import requests
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from playwright.sync_api import sync_playwright
 from urllib.parse import quote
+from grading_scenarios import sweep_scenarios, best_scenarios, scenario_mask, scenario_label
+from grading_ev import expected_value_analysis, rank_by_risk_adjusted_return, get_ev_recommendation, RISK_AVERSION
+from grading_data_sources import get_card_source
+from tracing import span
+
+# Profit is computed from these, so cards missing any of them are skipped
+REQUIRED_PRICE_FIELDS = ['raw_price_gbp', 'ace10_price_gbp', 'psa10_price_gbp']
 
 def main():
     import os
@@ -68,25 +78,51 @@ def main():
     print(f"\n🎯 ANALYZING {len(valid_sets)} SET(S)")
     print("=" * 50)
     
-    all_results = []
+    source_spec = os.environ.get('GRADING_DATA_SOURCE')
+    print(f"📂 Card data source: {type(get_card_source(source_spec)).__name__}")
     
-    # Analyze each selected set
-    for set_info in valid_sets:
-        print(f"\n🔍 Processing: {set_info['name']}")
-        set_results = analyze_grading_opportunities(set_info)
-        if set_results:  # Only extend if results exist
-            all_results.extend(set_results)
-        else:
-            print(f"⚠ No grading opportunities found for {set_info['name']}")
+    total_results = 0
+    csv_file, writer, filename = open_grading_csv()
     
-    # Save comprehensive results
-    if all_results:
-        save_grading_analysis(all_results)
-        print(f"\n✅ Analysis complete! Found {len(all_results)} grading opportunities")
+    # Analyze sets concurrently and stream each set's rows to the CSV as it finishes
+    with csv_file, ProcessPoolExecutor(max_workers=min(len(valid_sets), os.cpu_count() or 1)) as executor:
+        futures = {
+            executor.submit(run_set_analysis, set_info, source_spec): set_info
+            for set_info in valid_sets
+        }
+        
+        for future in as_completed(futures):
+            set_info = futures[future]
+            print(f"\n🔍 Processing: {set_info['name']}")
+            try:
+                set_results, set_log = future.result()
+            except Exception as e:
+                print(f"❌ Analysis failed for {set_info['name']}: {e}")
+                continue
+            
+            print(set_log, end='')
+            if set_results:
+                write_grading_rows(writer, set_results)
+                csv_file.flush()
+                total_results += len(set_results)
+            else:
+                print(f"⚠ No grading opportunities found for {set_info['name']}")
+    
+    if total_results:
+        print(f"\n💾 Analysis saved to: {filename}")
+        print(f"\n✅ Analysis complete! Found {total_results} grading opportunities")
     else:
+        os.remove(filename)
         print("\n❌ No grading opportunities found")
 
-def analyze_grading_opportunities(set_info):
+def run_set_analysis(set_info, source_spec=None):
+    """Analyze one set in a worker process, capturing its console output"""
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        results = analyze_grading_opportunities(set_info, get_card_source(source_spec))
+    return results or [], buffer.getvalue()
+
+def analyze_grading_opportunities(set_info, card_source=None):
     """Analyze grading arbitrage opportunities for a specific set"""
     
     print(f"\n🎴 ANALYZING: {set_info['name']} ({set_info['release']})")
@@ -124,11 +160,26 @@ def analyze_grading_opportunities(set_info):
     print(f"   • Target ROI: 100%+ after grading costs")
     print(f"   • Card types: {', '.join(target_card_types[:4])}...")
     
-    # Sample cards for demonstration (would be scraped in real implementation)
-    sample_opportunities = get_sample_grading_opportunities(set_info['name'])
+    # Load this set's cards from the configured local data source
+    if card_source is None:
+        card_source = get_card_source()
+    cards = card_source.load_cards(set_info)
+    print(f"\n📂 Loaded {len(cards)} cards for {set_info['name']}")
+    
+    # Blank prices are dropped when loading; such cards cannot be costed
+    priced = [card for card in cards if all(field in card for field in REQUIRED_PRICE_FIELDS)]
+    if len(priced) < len(cards):
+        print(f"⚠️ Skipping {len(cards) - len(priced)} cards without raw, ACE 10 and PSA 10 prices")
+    cards = priced
+    
+    if not cards:
+        return []
     
     # Analyze each opportunity
-    analyze_opportunities(sample_opportunities, grading_costs)
+    results = analyze_opportunities(cards, grading_costs)
+    for result in results:
+        result['set_name'] = set_info['name']
+    return results
 
 def get_sample_grading_opportunities(set_name):
     """Get sample grading opportunities (would scrape real data in production)"""
@@ -377,10 +428,20 @@ def analyze_opportunities(opportunities, grading_costs):
     
     results = []
     
+    # Every service, tier and grade outcome in one batched computation
+    with span('grading.scenario_sweep'):
+        sweep = sweep_scenarios(opportunities, grading_costs)
+        best_if_ten = best_scenarios(sweep, scenario_mask(sweep, grade=10))
+        best_if_nine = best_scenarios(sweep, scenario_mask(sweep, grade=9))
+    
+    # Monte Carlo over grade outcomes instead of assuming every card gets a 10
+    with span('grading.expected_value'):
+        ev_analyses = expected_value_analysis(opportunities, grading_costs)
+    
     for i, card in enumerate(opportunities, 1):
         print(f"\n🎴 CARD {i}: {card['name']}")
-        print(f"   Card Number: {card['card_number']}")
-        print(f"   Type: {card['card_type']}")
+        print(f"   Card Number: {card.get('card_number', 'N/A')}")
+        print(f"   Type: {card.get('card_type', 'Unknown')}")
         print(f"   Raw Price: £{card['raw_price_gbp']}")
         
         # Calculate ACE opportunity
@@ -409,16 +470,37 @@ def analyze_opportunities(opportunities, grading_costs):
         print(f"      ROI: {psa_analysis['roi']:.1f}%")
         print(f"      Return Multiple: {psa_analysis['return_multiple']:.1f}x")
         
+        best_ten = best_if_ten[i - 1]
+        best_nine = best_if_nine[i - 1]
+        print(f"\n   ⚡ BEST SCENARIO ({len(sweep['scenarios'])} evaluated):")
+        print(f"      If 10: {scenario_label(best_ten)} - £{best_ten['net_profit']:.0f} profit, {best_ten['roi']:.0f}% ROI")
+        print(f"      If 9:  {scenario_label(best_nine)} - £{best_nine['net_profit']:.0f} profit, {best_nine['roi']:.0f}% ROI")
+        
+        ev = ev_analyses[i - 1]
+        print(f"\n   🎲 EXPECTED VALUE ({ev['best_service']}):")
+        print(f"      Expected Profit: £{ev['expected_profit']:.0f} (±£{ev['profit_std']:.0f})")
+        print(f"      Expected ROI: {ev['expected_roi']:.1f}%")
+        print(f"      Downside: 5th pct £{ev['p5_profit']:.0f} | 25th pct £{ev['p25_profit']:.0f}")
+        print(f"      Chance of Loss: {ev['probability_of_loss'] * 100:.0f}%")
+        if ev['estimated_inputs']:
+            print(f"      ⚠️ Based on estimated {', '.join(ev['estimated_inputs'])}")
+        
         # Determine recommendation
         recommendation = get_recommendation(ace_analysis, psa_analysis)
+        ev_recommendation = get_ev_recommendation(ev)
         print(f"\n   🎯 RECOMMENDATION: {recommendation}")
+        print(f"   🎲 EV RECOMMENDATION: {ev_recommendation}")
         
         # Store results
         results.append({
             'card': card,
             'ace_analysis': ace_analysis,
             'psa_analysis': psa_analysis,
-            'recommendation': recommendation
+            'best_scenario': best_ten,
+            'best_scenario_if_nine': best_nine,
+            'ev_analysis': ev,
+            'recommendation': recommendation,
+            'ev_recommendation': ev_recommendation
         })
     
     # Show summary and top opportunities
@@ -515,6 +597,16 @@ def show_summary_analysis(results):
             print(f"   ROI: {ace['roi']:.0f}% ACE | {psa['roi']:.0f}% PSA")
             print()
     
+    if results:
+        print(f"\n🎲 RISK-ADJUSTED RANKING (expected ROI - {RISK_AVERSION} × ROI std):")
+        print("-" * 60)
+        for i, result in enumerate(rank_by_risk_adjusted_return(results)[:5], 1):
+            ev = result['ev_analysis']
+            print(f"{i}. {result['card']['name']}")
+            print(f"   {ev['best_service']}: EV £{ev['expected_profit']:.0f} | "
+                  f"Score {ev['risk_adjusted_return']:.0f} | Loss chance {ev['probability_of_loss'] * 100:.0f}%")
+        print()
+    
     # Calculate portfolio summary
     total_investment = sum(min(r['ace_analysis']['total_investment'], 
                               r['psa_analysis']['total_investment']) 
@@ -532,46 +624,74 @@ def show_summary_analysis(results):
 def save_grading_analysis(results):
     """Save analysis results to CSV"""
     
+    csv_file, writer, filename = open_grading_csv()
+    with csv_file:
+        write_grading_rows(writer, results)
+    
+    print(f"\n💾 Analysis saved to: {filename}")
+
+def open_grading_csv():
+    """Open a timestamped analysis CSV and write its header"""
+    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"grading_arbitrage_analysis_{timestamp}.csv"
     
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = [
-            'card_name', 'card_number', 'card_type', 'raw_price_gbp',
-            'ace10_price_gbp', 'ace_net_profit', 'ace_roi', 'ace_multiple',
-            'psa10_price_gbp', 'psa_net_profit', 'psa_roi', 'psa_multiple',
-            'recommendation', 'meets_criteria'
-        ]
+    f = open(filename, 'w', newline='', encoding='utf-8')
+    fieldnames = [
+        'set_name', 'card_name', 'card_number', 'card_type', 'raw_price_gbp',
+        'ace10_price_gbp', 'ace_net_profit', 'ace_roi', 'ace_multiple',
+        'psa10_price_gbp', 'psa_net_profit', 'psa_roi', 'psa_multiple',
+        'best_scenario', 'best_scenario_net_profit', 'best_scenario_if_nine_net_profit',
+        'ev_service', 'ev_expected_profit', 'ev_profit_std', 'ev_p5_profit',
+        'ev_loss_probability', 'ev_risk_adjusted_return', 'ev_estimated_inputs',
+        'recommendation', 'ev_recommendation', 'meets_criteria'
+    ]
+    
+    writer = csv.DictWriter(f, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    return f, writer, filename
+
+def write_grading_rows(writer, results):
+    """Write one CSV row per analyzed card"""
+    
+    for result in results:
+        card = result['card']
+        ace = result['ace_analysis']
+        psa = result['psa_analysis']
+        ev = result['ev_analysis']
         
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+        meets_criteria = (ace['return_multiple'] >= 3.0 and ace['roi'] >= 100) or \
+                       (psa['return_multiple'] >= 3.0 and psa['roi'] >= 100)
         
-        for result in results:
-            card = result['card']
-            ace = result['ace_analysis']
-            psa = result['psa_analysis']
-            
-            meets_criteria = (ace['return_multiple'] >= 3.0 and ace['roi'] >= 100) or \
-                           (psa['return_multiple'] >= 3.0 and psa['roi'] >= 100)
-            
-            writer.writerow({
-                'card_name': card['name'],
-                'card_number': card['card_number'],
-                'card_type': card['card_type'],
-                'raw_price_gbp': card['raw_price_gbp'],
-                'ace10_price_gbp': card['ace10_price_gbp'],
-                'ace_net_profit': round(ace['net_profit'], 2),
-                'ace_roi': round(ace['roi'], 1),
-                'ace_multiple': round(ace['return_multiple'], 1),
-                'psa10_price_gbp': card['psa10_price_gbp'],
-                'psa_net_profit': round(psa['net_profit'], 2),
-                'psa_roi': round(psa['roi'], 1),
-                'psa_multiple': round(psa['return_multiple'], 1),
-                'recommendation': result['recommendation'],
-                'meets_criteria': 'YES' if meets_criteria else 'NO'
-            })
-    
-    print(f"\n💾 Analysis saved to: {filename}")
+        writer.writerow({
+            'set_name': result.get('set_name', ''),
+            'card_name': card['name'],
+            'card_number': card.get('card_number', ''),
+            'card_type': card.get('card_type', ''),
+            'raw_price_gbp': card['raw_price_gbp'],
+            'ace10_price_gbp': card['ace10_price_gbp'],
+            'ace_net_profit': round(ace['net_profit'], 2),
+            'ace_roi': round(ace['roi'], 1),
+            'ace_multiple': round(ace['return_multiple'], 1),
+            'psa10_price_gbp': card['psa10_price_gbp'],
+            'psa_net_profit': round(psa['net_profit'], 2),
+            'psa_roi': round(psa['roi'], 1),
+            'psa_multiple': round(psa['return_multiple'], 1),
+            'best_scenario': scenario_label(result['best_scenario']),
+            'best_scenario_net_profit': round(result['best_scenario']['net_profit'], 2),
+            'best_scenario_if_nine_net_profit': round(result['best_scenario_if_nine']['net_profit'], 2),
+            'ev_service': ev['best_service'],
+            'ev_expected_profit': round(ev['expected_profit'], 2),
+            'ev_profit_std': round(ev['profit_std'], 2),
+            'ev_p5_profit': round(ev['p5_profit'], 2),
+            'ev_loss_probability': round(ev['probability_of_loss'], 3),
+            'ev_risk_adjusted_return': round(ev['risk_adjusted_return'], 1),
+            'ev_estimated_inputs': '; '.join(ev['estimated_inputs']),
+            'recommendation': result['recommendation'],
+            'ev_recommendation': result['ev_recommendation'],
+            'meets_criteria': 'YES' if meets_criteria else 'NO'
+        })
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Pluggable card list sources for the grading arbitrage analyzer
+Loads per-set card lists from local JSON, CSV or SQLite files so the
+analyzer no longer depends on hardcoded sample data
+"""
+
+import csv
+import json
+import os
+import sqlite3
+
+DEFAULT_SOURCE_FILES = ['grading_cards.json', 'grading_cards.csv', 'grading_cards.db']
+
+NUMERIC_FIELDS = ['raw_price_gbp', 'ace10_price_gbp', 'psa10_price_gbp', 'ace9_price_gbp', 'psa9_price_gbp']
+
+CARD_FIELDS = [
+    'name', 'card_number', 'card_type', 'popularity', 'market_liquidity'
+] + NUMERIC_FIELDS
+
+
+def normalize_card(row):
+    """Keep known card fields and coerce prices to floats (blank prices are dropped)"""
+    card = {}
+    for field in CARD_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        card[field] = float(value) if field in NUMERIC_FIELDS else value
+    return card
+
+
+def set_matches(set_info, value):
+    """True if a set name or code from a data file refers to set_info"""
+    if not value:
+        return False
+    value = str(value).strip().lower()
+    return value in (set_info['name'].lower(), set_info['code'].lower())
+
+
+class JSONCardSource:
+    """
+    Card lists from JSON
+
+    Accepts either a single file shaped {"<set name or code>": [cards...]},
+    or a directory holding one <set code>.json list per set.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load_cards(self, set_info):
+        if os.path.isdir(self.path):
+            set_file = os.path.join(self.path, f"{set_info['code']}.json")
+            if not os.path.exists(set_file):
+                return []
+            with open(set_file, 'r', encoding='utf-8') as f:
+                return [normalize_card(row) for row in json.load(f)]
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        for key, rows in data.items():
+            if set_matches(set_info, key):
+                return [normalize_card(row) for row in rows]
+        return []
+
+
+class CSVCardSource:
+    """
+    Card lists from CSV
+
+    Accepts either a single file with a set_code (or set_name) column, or a
+    directory holding one <set code>.csv per set.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load_cards(self, set_info):
+        if os.path.isdir(self.path):
+            set_file = os.path.join(self.path, f"{set_info['code']}.csv")
+            if not os.path.exists(set_file):
+                return []
+            with open(set_file, 'r', newline='', encoding='utf-8') as f:
+                return [normalize_card(row) for row in csv.DictReader(f)]
+
+        cards = []
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if set_matches(set_info, row.get('set_code')) or set_matches(set_info, row.get('set_name')):
+                    cards.append(normalize_card(row))
+        return cards
+
+
+class SQLiteCardSource:
+    """Card lists from a SQLite grading_cards table keyed by set_code"""
+
+    def __init__(self, path, table='grading_cards'):
+        self.path = path
+        self.table = table
+
+    def load_cards(self, set_info):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM {self.table} WHERE lower(set_code) = ? OR lower(set_name) = ?",
+                (set_info['code'].lower(), set_info['name'].lower())
+            ).fetchall()
+        finally:
+            conn.close()
+        return [normalize_card(dict(row)) for row in rows]
+
+
+class SampleCardSource:
+    """Built-in sample cards, used when no local data file is configured"""
+
+    def load_cards(self, set_info):
+        from grading_arbitrage_analyzer import get_sample_grading_opportunities
+        return get_sample_grading_opportunities(set_info['name'])
+
+
+class PriceChartingCardSource:
+    """
+    Another source's cards with raw, PSA 9 and PSA 10 prices refreshed from
+    PriceCharting product pages (one fetch per card covers every grade)
+
+    Only company-specific tiers are used: PriceCharting's generic "Grade 9"
+    mixes every grader, so it is not taken as PSA 9. ACE prices are not
+    listed on PriceCharting and keep the base values.
+    Cards PriceCharting cannot resolve are passed through unchanged.
+    """
+
+    # Card field <- PriceCharting grade tier
+    GRADE_FIELDS = {
+        'raw_price_gbp': 'ungraded',
+        'psa9_price_gbp': 'psa_9',
+        'psa10_price_gbp': 'psa_10'
+    }
+
+    def __init__(self, base):
+        self.base = base
+
+    def load_cards(self, set_info):
+        from pricecharting import lookup_card
+
+        cards = self.base.load_cards(set_info)
+        for card in cards:
+            # PriceCharting titles carry "#269", not "269/193"
+            number = str(card.get('card_number', '')).split('/')[0]
+            query = f"{card['name']} {set_info['name']} {number}".strip()
+            try:
+                result = lookup_card(query)
+            except Exception as e:
+                print(f"⚠️ PriceCharting lookup failed for {card['name']}: {e}")
+                continue
+            if not result:
+                continue
+            for field, grade in self.GRADE_FIELDS.items():
+                if grade in result['grades']:
+                    card[field] = result['grades'][grade]
+            card['price_charting_url'] = result['url']
+        return cards
+
+
+def get_card_source(spec=None):
+    """
+    Resolve a card source from a path
+
+    Uses spec, then the GRADING_DATA_SOURCE environment variable, then the
+    first existing default file. Falls back to the built-in samples.
+    Prefix a spec with "pricecharting:" to refresh its prices live.
+    """
+    spec = spec or os.environ.get('GRADING_DATA_SOURCE')
+    if spec and spec.startswith('pricecharting:'):
+        return PriceChartingCardSource(get_card_source(spec[len('pricecharting:'):] or 'sample'))
+    if not spec:
+        spec = next((path for path in DEFAULT_SOURCE_FILES if os.path.exists(path)), None)
+    if not spec or spec == 'sample':
+        return SampleCardSource()
+
+    lower = spec.lower()
+    if lower.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SQLiteCardSource(spec)
+    if lower.endswith('.csv'):
+        return CSVCardSource(spec)
+    if lower.endswith('.json'):
+        return JSONCardSource(spec)
+
+    # Directory of per-set files - pick the format from its contents
+    if os.path.isdir(spec):
+        if any(name.endswith('.csv') for name in os.listdir(spec)):
+            return CSVCardSource(spec)
+        return JSONCardSource(spec)
+
+    raise ValueError(f"Unsupported grading data source: {spec}")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Expected-value grading model
+Simulates grade outcomes per card type and grading service with a seeded,
+vectorized Monte Carlo and reports EV, variance and downside percentiles so
+opportunities can be ranked by risk-adjusted return instead of assuming a 10
+"""
+
+import os
+
+import numpy as np
+
+from grading_scenarios import graded_price, price_is_estimated
+from serialization import read_json
+
+DEFAULT_DRAWS = 5000
+DEFAULT_SEED = 42
+
+# "7" stands for 7 or below
+GRADE_OUTCOMES = (10, 9, 8, 7)
+
+# Rough gem rates per card type and service, as probabilities of (10, 9, 8, <=7).
+# These are estimates, not measured population data. GRADE_DISTRIBUTIONS_FILE
+# points at a JSON file of the same shape to replace them, and a card can
+# override them with card['grade_probabilities'][service].
+DEFAULT_GRADE_DISTRIBUTIONS = {
+    'Pokemon SAR': {
+        'ace': (0.60, 0.28, 0.08, 0.04),
+        'psa': (0.52, 0.33, 0.10, 0.05)
+    },
+    'Character Rare': {
+        'ace': (0.58, 0.30, 0.08, 0.04),
+        'psa': (0.50, 0.35, 0.10, 0.05)
+    },
+    'Trainer Full Art': {
+        'ace': (0.50, 0.32, 0.12, 0.06),
+        'psa': (0.40, 0.38, 0.15, 0.07)
+    },
+    'default': {
+        'ace': (0.50, 0.30, 0.12, 0.08),
+        'psa': (0.42, 0.35, 0.15, 0.08)
+    }
+}
+
+
+def load_grade_distributions(path=None):
+    """Default gem rates updated with the card types in GRADE_DISTRIBUTIONS_FILE, if set"""
+    distributions = {card_type: dict(by_service) for card_type, by_service in DEFAULT_GRADE_DISTRIBUTIONS.items()}
+    path = path or os.getenv('GRADE_DISTRIBUTIONS_FILE')
+    if path:
+        for card_type, by_service in read_json(path).items():
+            distributions.setdefault(card_type, {}).update(by_service)
+    return distributions
+
+
+GRADE_DISTRIBUTIONS = load_grade_distributions()
+
+# Sale price of an 8 as a share of the 10 price (an estimate; set GRADE_8_PRICE_RATIO
+# or give a card {service}8_price_gbp); 7 or below sells around raw
+DEFAULT_GRADE_8_PRICE_RATIO = 0.30
+GRADE_8_PRICE_RATIO = float(os.getenv('GRADE_8_PRICE_RATIO', DEFAULT_GRADE_8_PRICE_RATIO))
+
+# Weight on ROI standard deviation when ranking (mean ROI - k * ROI std)
+RISK_AVERSION = 0.5
+
+DOWNSIDE_PERCENTILES = (5, 25)
+
+
+def type_distribution(distributions, card, service):
+    """Gem rates for a card's type and service from a distributions table"""
+    by_service = distributions.get(card.get('card_type'), distributions['default'])
+    return by_service.get(service, distributions['default'][service])
+
+
+def grade_probabilities(card, service):
+    """Grade outcome probabilities for a card and service"""
+    override = card.get('grade_probabilities', {}).get(service)
+    if override:
+        probs = np.asarray(override, dtype=float)
+    else:
+        probs = np.asarray(type_distribution(GRADE_DISTRIBUTIONS, card, service), dtype=float)
+    return probs / probs.sum()
+
+
+def outcome_prices(card, service):
+    """Sale price for each entry of GRADE_OUTCOMES"""
+    ten_price = graded_price(card, service, 10)
+    eight_price = card.get(f'{service}8_price_gbp')
+    return [
+        ten_price,
+        graded_price(card, service, 9),
+        float(eight_price) if eight_price is not None else ten_price * GRADE_8_PRICE_RATIO,
+        float(card['raw_price_gbp'])
+    ]
+
+
+def estimated_inputs(card, service):
+    """Which of a card's EV inputs come from the built-in estimates rather than its own data"""
+    estimates = []
+    if not card.get('grade_probabilities', {}).get(service) and \
+            tuple(type_distribution(GRADE_DISTRIBUTIONS, card, service)) == \
+            tuple(type_distribution(DEFAULT_GRADE_DISTRIBUTIONS, card, service)):
+        estimates.append('grade probabilities')
+    if price_is_estimated(card, service, 9):
+        estimates.append('grade 9 price')
+    if card.get(f'{service}8_price_gbp') is None:
+        estimates.append('grade 8 price')
+    return estimates
+
+
+def simulate_service(cards, service, grading_cost, shipping_cost, draws=DEFAULT_DRAWS, rng=None):
+    """
+    Monte Carlo net profit for every card graded by one service
+
+    Returns a (cards, draws) profit matrix and the per-card total investment.
+    """
+    if rng is None:
+        rng = np.random.default_rng(DEFAULT_SEED)
+
+    probs = np.array([grade_probabilities(card, service) for card in cards])
+    prices = np.array([outcome_prices(card, service) for card in cards])
+    investment = np.array([float(card['raw_price_gbp']) for card in cards]) + grading_cost + shipping_cost
+
+    # Inverse-CDF sampling of the grade index for every card and draw at once
+    cdf = np.cumsum(probs, axis=1)[:, :-1]
+    u = rng.random((len(cards), draws))
+    outcome_idx = (u[:, :, None] > cdf[:, None, :]).sum(axis=2)
+
+    sale = np.take_along_axis(prices, outcome_idx, axis=1)
+    return sale - investment[:, None], investment
+
+
+def summarize_profits(profits, investment):
+    """EV, variance, downside percentiles and risk-adjusted return per card"""
+    roi = profits / investment[:, None] * 100
+    expected_profit = profits.mean(axis=1)
+    roi_mean = roi.mean(axis=1)
+    roi_std = roi.std(axis=1)
+    percentiles = np.percentile(profits, DOWNSIDE_PERCENTILES, axis=1)
+
+    summary = {
+        'expected_profit': expected_profit,
+        'profit_variance': profits.var(axis=1),
+        'profit_std': profits.std(axis=1),
+        'expected_roi': roi_mean,
+        'roi_std': roi_std,
+        'probability_of_loss': (profits < 0).mean(axis=1),
+        'risk_adjusted_return': roi_mean - RISK_AVERSION * roi_std
+    }
+    for pct, values in zip(DOWNSIDE_PERCENTILES, percentiles):
+        summary[f'p{pct}_profit'] = values
+    return summary
+
+
+def expected_value_analysis(cards, grading_costs, services=('ace', 'psa'), tier='standard', draws=DEFAULT_DRAWS, seed=DEFAULT_SEED):
+    """
+    Simulate every card under every service and pick the best service per card
+
+    Returns one dict per card (same order as cards) with the per-service
+    summaries and the service with the highest risk-adjusted return.
+    """
+    if not cards:
+        return []
+
+    rng = np.random.default_rng(seed)
+    shipping = grading_costs.get('shipping_insurance', 0)
+
+    per_service = {}
+    for service in services:
+        grading_cost = grading_costs[f'{service}_{tier}']
+        profits, investment = simulate_service(cards, service, grading_cost, shipping, draws, rng)
+        per_service[service] = summarize_profits(profits, investment)
+
+    analyses = []
+    for i in range(len(cards)):
+        services_ev = {
+            service: {key: float(values[i]) for key, values in summary.items()}
+            for service, summary in per_service.items()
+        }
+        best_service = max(services_ev, key=lambda s: services_ev[s]['risk_adjusted_return'])
+        analyses.append({
+            'services': services_ev,
+            'best_service': best_service.upper(),
+            'estimated_inputs': estimated_inputs(cards[i], best_service),
+            **services_ev[best_service]
+        })
+    return analyses
+
+
+def rank_by_risk_adjusted_return(results, key='ev_analysis'):
+    """Sort analyzer results by the best service's risk-adjusted return"""
+    return sorted(results, key=lambda r: r[key]['risk_adjusted_return'], reverse=True)
+
+
+def get_ev_recommendation(ev):
+    """Recommendation based on expected value and downside rather than a guaranteed 10"""
+    if ev['expected_profit'] <= 0:
+        return f"❌ SKIP - Negative EV (£{ev['expected_profit']:.0f})"
+    if ev['p5_profit'] < 0 and ev['probability_of_loss'] > 0.25:
+        return (f"⚠️ RISKY - EV £{ev['expected_profit']:.0f} via {ev['best_service']}, "
+                f"{ev['probability_of_loss'] * 100:.0f}% chance of loss")
+    return (f"✅ {ev['best_service']} - EV £{ev['expected_profit']:.0f}, "
+            f"{ev['expected_roi']:.0f}% expected ROI, worst 5% £{ev['p5_profit']:.0f}")
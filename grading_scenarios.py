@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Fee / FX scenario sweep for grading arbitrage
+Evaluates every card against the full cross-product of grading services,
+service tiers, grade outcomes, shipping costs and currency rates in a single
+batched NumPy computation
+"""
+
+import itertools
+import os
+
+import numpy as np
+
+from opportunity_scoring import score_opportunities
+
+# Same thresholds get_recommendation applies (3x return, 100% ROI)
+MIN_RETURN_MULTIPLE = 3.0
+MIN_ROI = 100.0
+
+GRADES = (10, 9)
+
+# Grade 9 sale price as a share of the grade 10 price, used when a card has
+# no explicit {service}9_price_gbp. Rough estimates, not market data: override
+# per service with GRADE_9_PRICE_RATIO_ACE / GRADE_9_PRICE_RATIO_PSA. Results
+# priced this way are flagged price_estimated
+DEFAULT_GRADE_9_PRICE_RATIO = {
+    'ace': 0.45,
+    'psa': 0.50
+}
+GRADE_9_PRICE_RATIO = {
+    service: float(os.getenv(f'GRADE_9_PRICE_RATIO_{service.upper()}', ratio))
+    for service, ratio in DEFAULT_GRADE_9_PRICE_RATIO.items()
+}
+
+# Pass as swept_tiers to leave out express tiers. Express grading buys a faster
+# turnaround, not a better price, and the model puts no value on time, so every
+# express row is the standard row minus the surcharge
+STANDARD_TIERS = ('standard',)
+
+def grading_tiers(grading_costs, swept_tiers=None):
+    """Split a grading_costs dict into {(service, tier): cost}, ignoring shipping; swept_tiers limits the tiers"""
+    tiers = {}
+    for key, cost in grading_costs.items():
+        if key == 'shipping_insurance' or '_' not in key:
+            continue
+        service, tier = key.split('_', 1)
+        if swept_tiers is None or tier in swept_tiers:
+            tiers[(service, tier)] = float(cost)
+    return tiers
+
+
+def graded_price(card, service, grade):
+    """Sale price of a card at a given service and grade"""
+    explicit = card.get(f'{service}{grade}_price_gbp')
+    if explicit is not None:
+        return float(explicit)
+    ten_price = float(card.get(f'{service}10_price_gbp') or 0)
+    if grade == 10:
+        return ten_price
+    return ten_price * GRADE_9_PRICE_RATIO.get(service, 0.5)
+
+
+def price_is_estimated(card, service, grade):
+    """True when graded_price falls back to a ratio of the grade 10 price"""
+    return grade != 10 and card.get(f'{service}{grade}_price_gbp') is None
+
+
+def build_scenarios(grading_costs, grades=GRADES, shipping=None, fx_rates=(1.0,), swept_tiers=None):
+    """Cross-product of (service, tier, grade, shipping, fx) scenarios as a list of dicts"""
+    if shipping is None:
+        shipping = (grading_costs.get('shipping_insurance', 0),)
+
+    tiers = grading_tiers(grading_costs, swept_tiers)
+    scenarios = []
+    for (service, tier), grade, ship, fx in itertools.product(tiers, grades, shipping, fx_rates):
+        scenarios.append({
+            'service': service,
+            'tier': tier,
+            'grade': grade,
+            'grading_cost': tiers[(service, tier)],
+            'shipping': float(ship),
+            'fx_rate': float(fx)
+        })
+    return scenarios
+
+
+def sweep_scenarios(cards, grading_costs, grades=GRADES, shipping=None, fx_rates=(1.0,), swept_tiers=None):
+    """
+    Score every card under every scenario at once
+
+    fx_rate converts the graded sale price into GBP, so 1.0 means selling in
+    the UK and currency.USD_TO_GBP means selling at the same USD price in the US.
+    Result matrices have shape (scenarios, cards) and are stored as float32.
+    Every tier is swept unless swept_tiers (e.g. STANDARD_TIERS) limits them.
+    """
+    scenarios = build_scenarios(grading_costs, grades, shipping, fx_rates, swept_tiers)
+    if not cards or not scenarios:
+        empty = np.zeros((len(scenarios), len(cards)), dtype=np.float32)
+        return {
+            'scenarios': scenarios,
+            'cards': cards,
+            'net_profit': empty,
+            'roi': empty,
+            'return_multiple': empty,
+            'meets_criteria': empty.astype(bool),
+            'price_estimated': empty.astype(bool)
+        }
+
+    services = sorted({s['service'] for s in scenarios})
+    service_index = {service: i for i, service in enumerate(services)}
+    grade_index = {grade: i for i, grade in enumerate(grades)}
+
+    raw = np.array([float(card['raw_price_gbp']) for card in cards])
+
+    # (cards, services, grades) price cube, then one gather per scenario
+    price_cube = np.array([
+        [[graded_price(card, service, grade) for grade in grades] for service in services]
+        for card in cards
+    ])
+    estimated_cube = np.array([
+        [[price_is_estimated(card, service, grade) for grade in grades] for service in services]
+        for card in cards
+    ])
+    svc_idx = np.array([service_index[s['service']] for s in scenarios])
+    grd_idx = np.array([grade_index[s['grade']] for s in scenarios])
+    fx = np.array([s['fx_rate'] for s in scenarios])
+    sell = price_cube[:, svc_idx, grd_idx].T * fx[:, None]
+    estimated = estimated_cube[:, svc_idx, grd_idx].T
+
+    scores = score_opportunities(
+        raw, sell,
+        shipping=np.array([s['shipping'] for s in scenarios]),
+        extra_cost=np.array([s['grading_cost'] for s in scenarios])
+    )
+
+    # Multiple is measured against the raw price, as calculate_grading_profit does
+    with np.errstate(divide='ignore', invalid='ignore'):
+        multiple = np.where(raw > 0, sell / raw, 0.0)
+
+    roi = scores['roi']
+    return {
+        'scenarios': scenarios,
+        'cards': cards,
+        'net_profit': scores['profit'].astype(np.float32),
+        'roi': roi.astype(np.float32),
+        'return_multiple': multiple.astype(np.float32),
+        'meets_criteria': (multiple >= MIN_RETURN_MULTIPLE) & (roi >= MIN_ROI),
+        'price_estimated': estimated
+    }
+
+
+def scenario_mask(sweep, **conditions):
+    """Boolean mask over scenarios matching e.g. grade=10, service='psa'"""
+    mask = np.ones(len(sweep['scenarios']), dtype=bool)
+    for field, value in conditions.items():
+        mask &= np.array([s[field] == value for s in sweep['scenarios']], dtype=bool)
+    return mask
+
+
+def best_scenarios(sweep, mask=None):
+    """Best scenario (highest net profit) per card, optionally limited to a scenario mask"""
+    net_profit = sweep['net_profit']
+    if net_profit.size == 0:
+        return []
+
+    if mask is not None:
+        net_profit = np.where(mask[:, None], net_profit, -np.inf)
+
+    best_idx = np.argmax(net_profit, axis=0)
+    card_idx = np.arange(net_profit.shape[1])
+
+    best = []
+    for card_i, scenario_i in zip(card_idx, best_idx):
+        best.append({
+            **sweep['scenarios'][scenario_i],
+            'scenario_index': int(scenario_i),
+            'net_profit': float(sweep['net_profit'][scenario_i, card_i]),
+            'roi': float(sweep['roi'][scenario_i, card_i]),
+            'return_multiple': float(sweep['return_multiple'][scenario_i, card_i]),
+            'meets_criteria': bool(sweep['meets_criteria'][scenario_i, card_i]),
+            'price_estimated': bool(sweep['price_estimated'][scenario_i, card_i])
+        })
+    return best
+
+
+def scenario_label(scenario):
+    """Short human-readable label for a scenario"""
+    label = f"{scenario['service'].upper()} {scenario['tier']} → {scenario['grade']}"
+    if scenario['fx_rate'] != 1.0:
+        label += f" @ FX {scenario['fx_rate']:.2f}"
+    if scenario.get('price_estimated'):
+        label += " (estimated price)"
+    return label
@@ -1,58 +1,274 @@
 #!/usr/bin/env python3
 """
 Memory monitoring utility for Railway deployment
-Helps prevent memory crashes by monitoring and limiting resource usage
+Helps prevent memory crashes by monitoring and limiting resource usage.
+A background sampler tracks process + Chromium child RSS with per-stage
+high-water marks, and admission control downgrades a request to the
+lightweight scraper when there is not enough headroom for a browser
 """
 
 import os
 import psutil
 import gc
 import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
 
-def get_memory_usage():
+# Railway free tier has ~512MB limit, so we use 400MB as safe threshold
+DEFAULT_BUDGET_MB = 400
+
+# Approximate peak cost of each analysis path, including Chromium children
+BROWSER_PATH_ESTIMATE_MB = 150
+LIGHTWEIGHT_PATH_ESTIMATE_MB = 60
+
+DEFAULT_SAMPLE_INTERVAL = 0.25
+
+# How long a request waits for headroom before it is downgraded
+DEFAULT_ADMISSION_WAIT_SECONDS = 10
+
+MODE_FULL = 'full'
+MODE_LIGHTWEIGHT = 'lightweight'
+
+def get_memory_usage(include_children=False):
     """Get current memory usage in MB"""
     process = psutil.Process(os.getpid())
     memory_info = process.memory_info()
-    return memory_info.rss / 1024 / 1024  # Convert to MB
+    rss = memory_info.rss
+    if include_children:
+        rss += get_children_rss(process)
+    return rss / 1024 / 1024  # Convert to MB
+
+def get_children_rss(process=None):
+    """Combined RSS in bytes of all child processes (Playwright's Chromium)"""
+    process = process or psutil.Process(os.getpid())
+    total = 0
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total
+
+def get_container_headroom_mb():
+    """Free memory under the container's cgroup limit, or None outside a limited cgroup"""
+    # cgroup v2, then v1
+    for limit_path, usage_path in [
+        ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+        ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')
+    ]:
+        try:
+            with open(limit_path) as f:
+                limit = f.read().strip()
+            with open(usage_path) as f:
+                usage = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        # Unlimited cgroups report "max" (v2) or a huge number (v1)
+        if limit == 'max' or int(limit) >= 1 << 60:
+            return None
+        return (int(limit) - usage) / 1024 / 1024
+    return None
 
 def cleanup_memory():
     """Force garbage collection to free memory"""
     gc.collect()
-    
-def check_memory_limit(max_memory_mb=400):
+
+def check_memory_limit(max_memory_mb=DEFAULT_BUDGET_MB):
     """
     Check if memory usage exceeds limit and cleanup if needed
     Railway free tier has ~512MB limit, so we use 400MB as safe threshold
     """
-    current_memory = get_memory_usage()
-    
+    current_memory = get_memory_usage(include_children=True)
+
     if current_memory > max_memory_mb:
         print(f"⚠️ Memory usage high: {current_memory:.1f}MB (limit: {max_memory_mb}MB)")
         print("🧹 Running memory cleanup...")
         cleanup_memory()
-        
+
         # Check again after cleanup
-        new_memory = get_memory_usage()
+        new_memory = get_memory_usage(include_children=True)
         print(f"✅ Memory after cleanup: {new_memory:.1f}MB")
-        
+
         if new_memory > max_memory_mb:
             print(f"❌ Memory still high after cleanup. Consider reducing workload.")
             return False
-    
+
     return True
 
-def set_memory_limits():
-    """Set memory limits for the process"""
-    try:
-        # Try to set memory limit if on Unix-like system
-        import resource
-        # Set memory limit to 450MB (in bytes)
-        resource.setrlimit(resource.RLIMIT_AS, (450 * 1024 * 1024, 450 * 1024 * 1024))
-        print("✅ Memory limit set to 450MB")
-    except (ImportError, OSError):
-        print("⚠️ Could not set memory limit (not supported on this system)")
+class MemoryGovernor:
+    """
+    Background RSS sampler with per-stage high-water marks and admission control
+
+    RLIMIT_AS is deliberately not used: Chromium reserves far more address
+    space than it touches and fails to start under an address-space cap.
+    """
+
+    def __init__(self, budget_mb=None, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.budget_mb = budget_mb or float(os.getenv('MEMORY_BUDGET_MB', DEFAULT_BUDGET_MB))
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+
+        self.lock = threading.Lock()
+        self.active_stages = {}
+        self.stage_peaks = {}
+        self.peak_mb = 0.0
+        self.peak_children_mb = 0.0
+        self.last_sample = None
+        self.samples = 0
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.sample()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sample()
+            except psutil.Error:
+                continue
+
+    def sample(self):
+        """Record one process + children RSS sample, in MB"""
+        own_mb = self.process.memory_info().rss / 1024 / 1024
+        children_mb = get_children_rss(self.process) / 1024 / 1024
+        total_mb = own_mb + children_mb
+        with self.lock:
+            self.samples += 1
+            self.last_sample = (own_mb, children_mb)
+            self.peak_mb = max(self.peak_mb, total_mb)
+            self.peak_children_mb = max(self.peak_children_mb, children_mb)
+            for name in self.active_stages:
+                self.stage_peaks[name] = max(self.stage_peaks.get(name, 0.0), total_mb)
+        return total_mb
+
+    def current_mb(self):
+        return self.sample()
+
+    @contextmanager
+    def stage(self, name):
+        """Track the high-water mark while a stage runs (stages may overlap across threads)"""
+        with self.lock:
+            self.active_stages[name] = self.active_stages.get(name, 0) + 1
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            with self.lock:
+                self.active_stages[name] -= 1
+                if not self.active_stages[name]:
+                    del self.active_stages[name]
+
+    def headroom_mb(self):
+        """Budget left for this process, capped by what the container itself has free"""
+        headroom = self.budget_mb - self.current_mb()
+        container = get_container_headroom_mb()
+        return min(headroom, container) if container is not None else headroom
+
+    def admit(self, needed_mb=BROWSER_PATH_ESTIMATE_MB, fallback_mb=LIGHTWEIGHT_PATH_ESTIMATE_MB,
+              wait_seconds=None):
+        """
+        Choose an analysis mode for a request
+
+        Waits up to wait_seconds (collecting garbage) for needed_mb of headroom
+        and returns MODE_FULL, otherwise MODE_LIGHTWEIGHT. A request is never
+        rejected - when even fallback_mb is not free it still runs lightweight.
+        """
+        if wait_seconds is None:
+            wait_seconds = float(os.getenv('MEMORY_ADMISSION_WAIT_SECONDS', DEFAULT_ADMISSION_WAIT_SECONDS))
+        deadline = time.monotonic() + wait_seconds
+
+        headroom = self.headroom_mb()
+        while headroom < needed_mb and time.monotonic() < deadline:
+            cleanup_memory()
+            time.sleep(min(0.5, max(deadline - time.monotonic(), 0)))
+            headroom = self.headroom_mb()
+
+        if headroom >= needed_mb:
+            return MODE_FULL
+        if headroom < fallback_mb:
+            print(f"⚠️ Only {headroom:.0f}MB headroom - running lightweight anyway")
+        else:
+            print(f"⚠️ {headroom:.0f}MB headroom is below the {needed_mb}MB browser estimate - using lightweight path")
+        return MODE_LIGHTWEIGHT
+
+    def report(self):
+        """Peaks so far, in MB"""
+        with self.lock:
+            own_mb, children_mb = self.last_sample or (0.0, 0.0)
+            return {
+                'budget_mb': self.budget_mb,
+                'current_mb': round(own_mb + children_mb, 1),
+                'peak_mb': round(self.peak_mb, 1),
+                'peak_children_mb': round(self.peak_children_mb, 1),
+                'stage_peaks_mb': {name: round(peak, 1) for name, peak in self.stage_peaks.items()},
+                'samples': self.samples
+            }
+
+def start_tracemalloc(frames=10):
+    """Start Python allocation tracing (costly - only on demand)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+def tracemalloc_top(limit=10):
+    """Largest Python allocation sites as [{'location', 'size_kb', 'count'}]"""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ])
+    top = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        top.append({
+            'location': f"{frame.filename}:{frame.lineno}",
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count
+        })
+    return top
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    """Process-wide governor with its sampler running"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = MemoryGovernor().start()
+            if os.getenv('MEMORY_TRACEMALLOC') == '1':
+                start_tracemalloc()
+        return _governor
+
+def memory_stage(name):
+    return get_governor().stage(name)
+
+def admit_analysis(needed_mb=BROWSER_PATH_ESTIMATE_MB):
+    return get_governor().admit(needed_mb)
+
+def memory_report(include_allocations=False):
+    report = get_governor().report()
+    if include_allocations:
+        report['top_allocations'] = tracemalloc_top()
+    return report
 
 if __name__ == "__main__":
-    print(f"💾 Current memory usage: {get_memory_usage():.1f}MB")
-    set_memory_limits()
-    check_memory_limit() 
\ No newline at end of file
+    governor = get_governor()
+    print(f"💾 Current memory usage: {governor.current_mb():.1f}MB")
+    headroom = get_container_headroom_mb()
+    if headroom is not None:
+        print(f"📦 Container headroom: {headroom:.1f}MB")
+    print(f"🚦 Admission for a browser analysis: {governor.admit(wait_seconds=0)}")
+    check_memory_limit()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Vectorized opportunity scoring for arbitrage runs
+Scores every card under every fee / shipping / FX scenario in one NumPy pass,
+so a finished run can be re-scored without scraping anything again
+"""
+
+import csv
+import sys
+import numpy as np
+
+# Bulk finder defaults: no fee deduction and a 20% profit threshold
+DEFAULT_FEE_RATE = 0.0
+DEFAULT_MIN_ROI = 20.0
+
+
+def _as_column(values):
+    """Turn a scalar or 1-D sequence into a (scenarios, 1) float column"""
+    arr = np.asarray(values, dtype=float)
+    if arr.ndim == 0:
+        return arr.reshape(1, 1)
+    return arr.reshape(-1, 1)
+
+
+def scenario_grid(fee_rates=(DEFAULT_FEE_RATE,), fx_rates=(1.0,), shipping=(0.0,), extra_costs=(0.0,)):
+    """Build the full cross-product of scenario parameters as flat arrays"""
+    fee_grid, fx_grid, ship_grid, extra_grid = np.meshgrid(
+        np.asarray(fee_rates, dtype=float),
+        np.asarray(fx_rates, dtype=float),
+        np.asarray(shipping, dtype=float),
+        np.asarray(extra_costs, dtype=float),
+        indexing='ij'
+    )
+    return {
+        'fee_rate': fee_grid.ravel(),
+        'fx_rate': fx_grid.ravel(),
+        'shipping': ship_grid.ravel(),
+        'extra_cost': extra_grid.ravel()
+    }
+
+
+def score_opportunities(buy_price, sell_price, fee_rate=DEFAULT_FEE_RATE, fx_rate=1.0, shipping=0.0, extra_cost=0.0):
+    """
+    Score all cards under all scenarios at once
+
+    buy_price is a per-card array in the buy currency and fx_rate converts it
+    into the sell currency. sell_price is per-card, or (scenarios, cards) when
+    the sale price itself depends on the scenario. fee_rate, fx_rate, shipping
+    and extra_cost (e.g. grading fees) may be scalars or per-scenario arrays of
+    equal length. Every returned array has shape (scenarios, cards).
+    """
+    buy = np.asarray(buy_price, dtype=float).reshape(1, -1)
+    sell = np.asarray(sell_price, dtype=float)
+    if sell.ndim < 2:
+        sell = sell.reshape(1, -1)
+
+    fee = _as_column(fee_rate)
+    fx = _as_column(fx_rate)
+    ship = _as_column(shipping)
+    extra = _as_column(extra_cost)
+
+    buy_converted = buy * fx
+    net_sale = sell * (1.0 - fee)
+    investment = buy_converted + ship + extra
+    profit = net_sale - investment
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(investment > 0, profit / investment * 100.0, 0.0)
+        margin = np.where(net_sale > 0, profit / net_sale * 100.0, 0.0)
+        multiple = np.where(buy_converted > 0, sell / buy_converted, 0.0)
+
+    return {
+        'buy_converted': buy_converted,
+        'net_sale': net_sale,
+        'total_investment': investment,
+        'gross_profit': sell - buy_converted,
+        'profit': profit,
+        'roi': roi,
+        'margin': margin,
+        'return_multiple': multiple
+    }
+
+
+def profitable_mask(scores, min_roi=DEFAULT_MIN_ROI, min_multiple=0.0):
+    """Boolean (scenarios, cards) mask of cards that clear the thresholds"""
+    return (scores['roi'] > min_roi) & (scores['return_multiple'] >= min_multiple)
+
+
+def scenario_summary(scores, mask):
+    """Per-scenario opportunity count and total profit"""
+    return {
+        'opportunities': mask.sum(axis=1),
+        'total_profit': np.where(mask, scores['profit'], 0.0).sum(axis=1)
+    }
+
+
+def load_bulk_run(filename):
+    """Load buy (JPY) and sell (USD) columns from a bulk_priced_cards or bulk_opportunities CSV"""
+    rows = []
+    with open(filename, 'r', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            rows.append(row)
+
+    buy_jpy = np.array([float(row['buy_price_jpy']) for row in rows], dtype=float)
+    sell_usd = np.array([float(row['sell_price_usd']) for row in rows], dtype=float)
+    return rows, buy_jpy, sell_usd
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python opportunity_scoring.py <bulk_priced_cards.csv> [jpy_usd_rate ...]")
+        return
+
+    rows, buy_jpy, sell_usd = load_bulk_run(sys.argv[1])
+    if not rows:
+        print("No cards in run")
+        return
+
+    fx_rates = [float(rate) for rate in sys.argv[2:]] or [0.0060, 0.0067, 0.0075]
+    fee_rates = [0.0, 0.13]
+    grid = scenario_grid(fee_rates=fee_rates, fx_rates=fx_rates)
+
+    scores = score_opportunities(buy_jpy, sell_usd, **grid)
+    mask = profitable_mask(scores)
+    summary = scenario_summary(scores, mask)
+
+    print(f"📊 RE-SCORED {len(rows)} CARDS ACROSS {len(grid['fee_rate'])} SCENARIOS")
+    print("=" * 60)
+    for i in range(len(grid['fee_rate'])):
+        print(f"Fees {grid['fee_rate'][i] * 100:>4.0f}% | JPY→USD {grid['fx_rate'][i]:.4f} | "
+              f"{summary['opportunities'][i]:>4} opportunities | ${summary['total_profit'][i]:.2f} profit")
+
+
+if __name__ == "__main__":
+    main()
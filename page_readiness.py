@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Selector-driven page readiness for the Playwright scrapers
+Instead of sleeping a fixed time after navigation, waits for the elements a
+site's data lives in and returns as soon as they are attached. Typical ready
+times are learned per site (and kept across runs) to size the wait, and the
+time saved against the old fixed sleeps is recorded
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from tracing import percentile
+
+DEFAULT_STATE_PATH = 'page_readiness.json'
+
+# Selectors that mean a page's data (or an explicit "no results") has rendered
+SITE_SELECTORS = {
+    'ebay': [
+        '.s-item',
+        '.s-card',
+        '[data-testid="item-card"]',
+        '.srp-item',
+        '.srp-save-null-search'
+    ],
+    'pokemon_names': [
+        'table.wikitable',
+        'table'
+    ]
+}
+
+# Ready times kept per site for the learned timeout
+MAX_SAMPLES_PER_SITE = 200
+
+# Wait at least this long for a selector, and never more than the ceiling
+MIN_TIMEOUT_MS = 1000
+DEFAULT_MAX_TIMEOUT_MS = 8000
+
+# Timeout is this multiple of the site's p90 ready time, plus slack
+TIMEOUT_P90_MULTIPLIER = 2.5
+TIMEOUT_SLACK_MS = 250
+
+
+class ReadinessTracker:
+    """Learned per-site ready times and time saved versus fixed sleeps"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('PAGE_READINESS_FILE', DEFAULT_STATE_PATH)
+        self.lock = threading.Lock()
+        self.ready_ms = {}
+        self.saved_ms = {}
+        self.timeouts = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            from serialization import read_json
+            state = read_json(self.path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read readiness state {self.path}: {e}")
+            return
+        for site, samples in state.get('ready_ms', {}).items():
+            self.ready_ms[site] = deque(samples, maxlen=MAX_SAMPLES_PER_SITE)
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        from serialization import write_json
+        with self.lock:
+            state = {'ready_ms': {site: list(samples) for site, samples in self.ready_ms.items()}}
+            self.dirty = False
+        tmp_path = f"{self.path}.tmp"
+        write_json(state, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def timeout_ms(self, site, max_ms=DEFAULT_MAX_TIMEOUT_MS):
+        """How long to wait for a site's selectors: a multiple of its p90 once learned"""
+        with self.lock:
+            samples = sorted(self.ready_ms.get(site, ()))
+        if len(samples) < 5:
+            return max_ms
+        learned = percentile(samples, 90) * TIMEOUT_P90_MULTIPLIER + TIMEOUT_SLACK_MS
+        return int(min(max(learned, MIN_TIMEOUT_MS), max_ms))
+
+    def record(self, site, elapsed_ms, ready, fixed_wait_ms):
+        with self.lock:
+            if ready:
+                samples = self.ready_ms.get(site)
+                if samples is None:
+                    samples = self.ready_ms[site] = deque(maxlen=MAX_SAMPLES_PER_SITE)
+                samples.append(round(elapsed_ms, 1))
+                self.dirty = True
+            else:
+                self.timeouts[site] = self.timeouts.get(site, 0) + 1
+            if fixed_wait_ms:
+                self.saved_ms[site] = self.saved_ms.get(site, 0.0) + fixed_wait_ms - elapsed_ms
+
+    def report(self):
+        """{site: {samples, typical_ms, p90_ms, timeouts, saved_ms}}"""
+        with self.lock:
+            sites = set(self.ready_ms) | set(self.saved_ms) | set(self.timeouts)
+            report = {}
+            for site in sorted(sites):
+                samples = sorted(self.ready_ms.get(site, ()))
+                report[site] = {
+                    'samples': len(samples),
+                    'typical_ms': percentile(samples, 50),
+                    'p90_ms': percentile(samples, 90),
+                    'timeouts': self.timeouts.get(site, 0),
+                    'saved_ms': round(self.saved_ms.get(site, 0.0), 1)
+                }
+            return report
+
+
+tracker = ReadinessTracker()
+atexit.register(tracker.save)
+
+
+def wait_until_ready(page, site, fixed_wait_ms=0, max_timeout_ms=DEFAULT_MAX_TIMEOUT_MS, selectors=None):
+    """
+    Wait until any of the site's selectors is attached, returning True, or
+    False once the learned timeout passes
+
+    fixed_wait_ms is the sleep this replaces; the difference is recorded as
+    time saved. Returns immediately when the data is already on the page.
+    """
+    selector = ', '.join(selectors or SITE_SELECTORS[site])
+    timeout = tracker.timeout_ms(site, max_timeout_ms)
+    start = time.perf_counter()
+    try:
+        page.wait_for_selector(selector, state='attached', timeout=timeout)
+        ready = True
+    except Exception:
+        # Playwright raises its TimeoutError; scrapers carry on with whatever rendered
+        ready = False
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    tracker.record(site, elapsed_ms, ready, fixed_wait_ms)
+    return ready
+
+
+def readiness_report():
+    return tracker.report()
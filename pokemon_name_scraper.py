@@ -3,11 +3,13 @@
 
 import re
 import json
-import time
 from datetime import datetime
 from playwright.sync_api import sync_playwright
 from urllib.parse import urljoin
 
+from serialization import write_json
+from page_readiness import wait_until_ready
+
 def main():
     print("🔍 POKEMON NAME MAPPING SCRAPER")
     print("Scraping comprehensive Japanese ↔ English Pokemon name mappings")
@@ -47,8 +49,8 @@ def scrape_pokemon_name_mappings():
                 "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
             })
             
-            page.goto(base_url, wait_until='load', timeout=30000)
-            time.sleep(3)
+            page.goto(base_url, wait_until='domcontentloaded', timeout=30000)
+            wait_until_ready(page, 'pokemon_names', fixed_wait_ms=3000)
             
             print("📋 Page loaded, extracting Pokemon name tables...")
             
@@ -138,13 +140,11 @@ def save_mappings_to_file(mappings):
         'mappings': mappings
     }
     
-    # Save timestamped version
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(mapping_data, f, ensure_ascii=False, indent=2)
+    # Save timestamped version (indented - this file is edited by hand)
+    write_json(mapping_data, filename, indent=2)
     
     # Save clean version
-    with open(clean_filename, 'w', encoding='utf-8') as f:
-        json.dump(mapping_data, f, ensure_ascii=False, indent=2)
+    write_json(mapping_data, clean_filename, indent=2)
     
     print(f"💾 Mappings saved to:")
     print(f"   📁 {filename}")
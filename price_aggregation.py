@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Outlier-robust price aggregation
+Accumulates observations per source in fixed-size NumPy buffers (reservoir
+sampled past capacity, so memory stays flat however many sold listings are
+fed in), rejects outliers by median absolute deviation, estimates each source
+with a freshness-weighted trimmed mean and combines sources by inverse
+variance, so sample size and staleness set each source's weight. Every
+estimate comes with a 95% confidence interval
+"""
+
+import math
+import random
+import time
+
+import numpy as np
+
+from price_history import to_timestamp
+
+SOURCE_EBAY = 'ebay'
+SOURCE_PRICE_CHARTING = 'price_charting'
+SOURCE_CARDMARKET = 'cardmarket'
+
+# Observations kept per source; beyond this a uniform reservoir sample is kept
+DEFAULT_CAPACITY = 1000
+
+# Observations further than this many robust standard deviations from the median are dropped
+OUTLIER_MADS = 3.5
+
+# MAD to standard deviation for normally distributed prices
+MAD_SCALE = 1.4826
+
+# A MAD of zero (identical prices) still tolerates this relative spread
+MIN_RELATIVE_SCALE = 0.05
+
+# Weight trimmed from each tail before averaging
+TRIM_FRACTION = 0.1
+
+# An observation this old counts half as much as one from today
+FRESHNESS_HALF_LIFE_DAYS = 14
+
+# Relative error of one observation from a source, used when the sample cannot measure its own spread
+SOURCE_RELATIVE_ERROR = {
+    SOURCE_EBAY: 0.25,
+    SOURCE_PRICE_CHARTING: 0.15,
+    SOURCE_CARDMARKET: 0.2
+}
+DEFAULT_RELATIVE_ERROR = 0.25
+
+# From this many observations a source's spread is measured from the sample itself
+MIN_SPREAD_SAMPLES = 5
+
+# Last-known fallbacks for skipped sources count this much less certain
+STALE_ERROR_MULTIPLIER = 2.0
+
+Z_95 = 1.96
+
+
+def weighted_quantile(values, weights, q):
+    """Quantile q (0-1) of sorted values under weights"""
+    cumulative = np.cumsum(weights)
+    return float(values[min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)])
+
+
+class SourceSample:
+    """Fixed-capacity buffer of (price, timestamp) observations for one source"""
+
+    __slots__ = ('prices', 'timestamps', 'size', 'seen', 'stale', 'rng')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.prices = np.empty(capacity)
+        self.timestamps = np.full(capacity, np.nan)
+        self.size = 0
+        self.seen = 0
+        self.stale = False
+        self.rng = random.Random(0)
+
+    def add(self, price, ts=None):
+        self.seen += 1
+        if self.size < len(self.prices):
+            slot = self.size
+            self.size += 1
+        else:
+            # Algorithm R: every observation ends up kept with equal probability
+            slot = self.rng.randrange(self.seen)
+            if slot >= len(self.prices):
+                return
+        self.prices[slot] = price
+        self.timestamps[slot] = ts if ts is not None else np.nan
+
+    def estimate(self, source, now):
+        """
+        {'estimate', 'median', 'mad', 'count', 'used', 'outliers', 'effective_count',
+        'standard_error', 'ci_low', 'ci_high'} or None when empty
+        """
+        if not self.size:
+            return None
+        prices = self.prices[:self.size]
+        ages = (now - self.timestamps[:self.size]) / 86400
+        weights = np.where(np.isnan(ages), 1.0, 0.5 ** (np.maximum(ages, 0) / FRESHNESS_HALF_LIFE_DAYS))
+
+        median = float(np.median(prices))
+        mad = float(np.median(np.abs(prices - median))) * MAD_SCALE
+        scale = max(mad, median * MIN_RELATIVE_SCALE)
+        inliers = np.abs(prices - median) <= OUTLIER_MADS * scale
+        prices, weights = prices[inliers], weights[inliers]
+
+        order = np.argsort(prices, kind='stable')
+        prices, weights = prices[order], weights[order]
+        cumulative = np.cumsum(weights) / weights.sum()
+        # Keep observations whose weight mass lies inside the trimmed band (all of them when few)
+        kept = (cumulative > TRIM_FRACTION) & (cumulative - weights / weights.sum() < 1 - TRIM_FRACTION)
+        if kept.sum() < 3:
+            kept = np.ones_like(prices, dtype=bool)
+        estimate = float(np.average(prices[kept], weights=weights[kept]))
+
+        effective_count = weights.sum() ** 2 / (weights ** 2).sum()
+        relative_error = SOURCE_RELATIVE_ERROR.get(source, DEFAULT_RELATIVE_ERROR)
+        # The sample's own spread once it is large enough to measure; the source's known noise before that
+        if len(prices) >= MIN_SPREAD_SAMPLES:
+            spread = max(mad, estimate * MIN_RELATIVE_SCALE)
+        else:
+            spread = max(mad, estimate * relative_error)
+        standard_error = spread / math.sqrt(effective_count)
+        if self.stale:
+            standard_error *= STALE_ERROR_MULTIPLIER
+
+        return {
+            'estimate': round(estimate, 2),
+            'median': round(weighted_quantile(prices, weights, 0.5), 2),
+            'mad': round(mad, 2),
+            'count': self.seen,
+            'used': int(len(prices)),
+            'outliers': int((~inliers).sum()),
+            'effective_count': round(float(effective_count), 1),
+            'standard_error': round(standard_error, 2),
+            'ci_low': round(max(estimate - Z_95 * standard_error, 0), 2),
+            'ci_high': round(estimate + Z_95 * standard_error, 2),
+            'stale': self.stale
+        }
+
+
+class PriceAggregator:
+    """Streaming per-source samples combined into one market price"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.samples = {}
+
+    def add(self, source, price, ts=None, stale=False):
+        if price is None or not price > 0:
+            return
+        sample = self.samples.get(source)
+        if sample is None:
+            sample = self.samples[source] = SourceSample(self.capacity)
+        sample.add(float(price), to_timestamp(ts) if ts is not None else None)
+        sample.stale = sample.stale or stale
+
+    def add_listings(self, source, listings):
+        """Feed an iterable of listing dicts ({'price', 'sold_at'?}) without holding on to them"""
+        for listing in listings:
+            self.add(source, listing.get('price'), listing.get('sold_at'))
+
+    def add_result(self, source, result):
+        """A single-price source result ({'price', 'stale'?, 'observed_at'?})"""
+        if result:
+            self.add(source, result.get('price'), result.get('observed_at'), stale=bool(result.get('stale')))
+
+    def source_estimates(self, now=None):
+        now = now or time.time()
+        estimates = {}
+        for source, sample in self.samples.items():
+            estimate = sample.estimate(source, now)
+            if estimate:
+                estimates[source] = estimate
+        return estimates
+
+    def combine(self, now=None):
+        """
+        {'estimate', 'standard_error', 'ci_low', 'ci_high', 'weights', 'sources'}
+        or None without data
+
+        Sources are weighted by inverse variance. When they disagree by more
+        than their errors explain, the interval is widened accordingly.
+        """
+        sources = self.source_estimates(now)
+        if not sources:
+            return None
+        names = list(sources)
+        estimates = np.array([sources[name]['estimate'] for name in names])
+        errors = np.array([max(sources[name]['standard_error'], 0.01) for name in names])
+        weights = 1 / errors ** 2
+
+        combined = float(np.average(estimates, weights=weights))
+        standard_error = 1 / math.sqrt(weights.sum())
+        if len(names) > 1:
+            # Birge ratio: scale up the error when sources scatter beyond it
+            chi_squared = float((weights * (estimates - combined) ** 2).sum())
+            standard_error *= math.sqrt(max(chi_squared / (len(names) - 1), 1.0))
+
+        return {
+            'estimate': round(combined, 2),
+            'standard_error': round(standard_error, 2),
+            'ci_low': round(max(combined - Z_95 * standard_error, 0), 2),
+            'ci_high': round(combined + Z_95 * standard_error, 2),
+            'weights': {name: round(float(w / weights.sum()), 3) for name, w in zip(names, weights)},
+            'sources': sources
+        }
+
+
+def summarize_market(ebay_prices, price_charting, cardmarket):
+    """
+    The analysis block shared by the what-to-pay analyzers
+
+    Keeps the existing keys (ebay_average, final_average, price_range,
+    recommendation ...) with robust values and adds the confidence interval,
+    per-source weights and outlier counts.
+    """
+    aggregator = PriceAggregator()
+    aggregator.add_listings(SOURCE_EBAY, ebay_prices or [])
+    aggregator.add_result(SOURCE_PRICE_CHARTING, price_charting)
+    aggregator.add_result(SOURCE_CARDMARKET, cardmarket)
+
+    market = aggregator.combine()
+    ebay = market['sources'].get(SOURCE_EBAY) if market else None
+    analysis = {
+        'ebay_average': ebay['estimate'] if ebay else None,
+        'ebay_median': ebay['median'] if ebay else None,
+        'ebay_sales_used': ebay['used'] if ebay else 0,
+        'ebay_outliers': ebay['outliers'] if ebay else 0,
+        'price_charting_price': price_charting['price'] if price_charting else None,
+        'cardmarket_price': cardmarket['price'] if cardmarket else None
+    }
+    if not market:
+        analysis['final_average'] = None
+        analysis['recommendation'] = "Insufficient data"
+        return analysis
+
+    final = market['estimate']
+    source_prices = [source['estimate'] for source in market['sources'].values()]
+    analysis.update({
+        'final_average': final,
+        'confidence_interval': [market['ci_low'], market['ci_high']],
+        'price_range': f"£{min(source_prices):.2f} - £{max(source_prices):.2f}",
+        'recommendation': f"£{final * 0.8:.2f} - £{final * 0.9:.2f}",
+        'source_weights': market['weights'],
+        'sources': market['sources']
+    })
+    return analysis
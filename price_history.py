@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Append-only price history store
+Records every observed price (TCG API, eBay sold, Price Charting, CardMarket
+averages) in SQLite keyed by (card_id, source, ts, item_id), rolls old observations up
+into daily bars, and answers trend / volatility / all-time-low queries from
+real history instead of mock values
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_DB_PATH = 'price_history.db'
+
+# One source per currency, so a card's series never mixes units:
+# tcgplayer is the catalog's USD market price, tcg_api_gbp the analyzers'
+# converted RapidAPI price, ebay_sold eBay UK sales (GBP) and ebay_com_sold
+# eBay.com sales (USD)
+SOURCE_TCGPLAYER = 'tcgplayer'
+SOURCE_TCG_API_GBP = 'tcg_api_gbp'
+SOURCE_EBAY_SOLD = 'ebay_sold'
+SOURCE_EBAY_COM_SOLD = 'ebay_com_sold'
+SOURCE_PRICE_CHARTING = 'price_charting'
+SOURCE_CARDMARKET_AVG7 = 'cardmarket_avg7'
+SOURCE_CARDMARKET_AVG30 = 'cardmarket_avg30'
+
+DAY_SECONDS = 86400
+
+# Raw observations older than this are folded into daily_rollups
+DEFAULT_RAW_RETENTION_DAYS = 90
+
+# Trend and volatility need at least this many days with data
+MIN_DAYS_FOR_TREND = 2
+
+# Individual sales carry their listing's item_id; snapshot prices leave it empty.
+# A sale is stored once per card however often it is scraped again
+OBSERVATIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS observations (
+        card_id TEXT NOT NULL,
+        source TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        item_id TEXT NOT NULL DEFAULT '',
+        price REAL NOT NULL,
+        currency TEXT,
+        PRIMARY KEY (card_id, source, ts, item_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_observations_source_ts
+        ON observations(source, ts, card_id, price);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_observations_item
+        ON observations(card_id, source, item_id) WHERE item_id != '';
+"""
+
+
+def normalize_card_key(card_name):
+    """Stable history key for a free-text card name"""
+    return re.sub(r'[^a-z0-9]+', '-', card_name.lower()).strip('-')
+
+
+def sale_key(listing):
+    """Stable identity of a sold listing: its eBay item ID, else its title and price"""
+    if listing.get('item_id'):
+        return str(listing['item_id'])
+    return f"{listing.get('title') or ''}|{listing.get('price')}"
+
+
+def to_timestamp(value=None):
+    """Epoch seconds from None (now), a number, a datetime or an ISO / YYYY/MM/DD string"""
+    if value is None:
+        return int(time.time())
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(datetime.fromisoformat(str(value).replace('/', '-')).timestamp())
+
+
+class PriceHistory:
+    """SQLite time-series of price observations with daily rollups"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('PRICE_HISTORY_DB', DEFAULT_DB_PATH)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+        backfill_seen = not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seen_sales'"
+        ).fetchone()
+        self.conn.executescript(OBSERVATIONS_SCHEMA + """
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                card_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                total REAL,
+                count INTEGER,
+                PRIMARY KEY (card_id, source, day)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_rollups_source_day
+                ON daily_rollups(source, day, card_id);
+
+            CREATE TABLE IF NOT EXISTS extremes (
+                card_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                low REAL,
+                low_ts INTEGER,
+                high REAL,
+                high_ts INTEGER,
+                count INTEGER,
+                PRIMARY KEY (card_id, source)
+            ) WITHOUT ROWID;
+
+            -- Keep all-time extremes current so lookups never scan history.
+            -- Fires only for new rows, so ignored duplicates are not counted.
+            CREATE TRIGGER IF NOT EXISTS trg_observations_extremes
+            AFTER INSERT ON observations
+            BEGIN
+                INSERT INTO extremes (card_id, source, low, low_ts, high, high_ts, count)
+                VALUES (NEW.card_id, NEW.source, NEW.price, NEW.ts, NEW.price, NEW.ts, 1)
+                ON CONFLICT(card_id, source) DO UPDATE SET
+                    low_ts = CASE WHEN excluded.low < low THEN excluded.low_ts ELSE low_ts END,
+                    low = MIN(low, excluded.low),
+                    high_ts = CASE WHEN excluded.high > high THEN excluded.high_ts ELSE high_ts END,
+                    high = MAX(high, excluded.high),
+                    count = count + 1;
+            END;
+
+            -- Sale identities outlive their raw rows, so a sale folded into
+            -- daily_rollups is not stored again when it is re-scraped.
+            CREATE TABLE IF NOT EXISTS seen_sales (
+                card_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                PRIMARY KEY (card_id, source, item_id)
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER IF NOT EXISTS trg_observations_seen_sales
+            AFTER INSERT ON observations
+            WHEN NEW.item_id != ''
+            BEGIN
+                INSERT OR IGNORE INTO seen_sales (card_id, source, item_id)
+                VALUES (NEW.card_id, NEW.source, NEW.item_id);
+            END;
+        """)
+        if backfill_seen:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO seen_sales (card_id, source, item_id) "
+                    "SELECT card_id, source, item_id FROM observations WHERE item_id != ''"
+                )
+                self.conn.commit()
+
+    def migrate(self):
+        """Rebuild an observations table from before item_id under the current key"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(observations)")]
+        if not columns or 'item_id' in columns:
+            return
+        with self.lock:
+            # The extremes trigger is recreated afterwards, so copied rows are not counted twice
+            self.conn.executescript("""
+                DROP TRIGGER IF EXISTS trg_observations_extremes;
+                DROP INDEX IF EXISTS idx_observations_source_ts;
+                ALTER TABLE observations RENAME TO observations_old;
+            """ + OBSERVATIONS_SCHEMA + """
+                INSERT INTO observations (card_id, source, ts, price, currency)
+                    SELECT card_id, source, ts, price, currency FROM observations_old;
+                DROP TABLE observations_old;
+            """)
+
+    def record(self, card_id, source, price, ts=None, currency=None, item_id=None):
+        """Record a single observation"""
+        return self.record_many([(card_id, source, price, ts, currency, item_id)])
+
+    def record_many(self, observations):
+        """
+        Record (card_id, source, price, ts, currency[, item_id]) tuples
+
+        Duplicate (card_id, source, ts) snapshots and sales whose item_id was
+        ever recorded for the card (even if since rolled up) are ignored, so
+        re-recording the same API snapshot or sold listing is harmless. Returns
+        the number of new rows.
+        """
+        rows = []
+        for card_id, source, price, ts, currency, *item_id in observations:
+            if price is None or price <= 0:
+                continue
+            rows.append((card_id, source, to_timestamp(ts), (item_id and item_id[0]) or '', float(price), currency))
+        if not rows:
+            return 0
+
+        with self.lock:
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO observations (card_id, source, ts, item_id, price, currency) "
+                "SELECT ?1, ?2, ?3, ?4, ?5, ?6 WHERE ?4 = '' OR NOT EXISTS ("
+                "SELECT 1 FROM seen_sales WHERE card_id = ?1 AND source = ?2 AND item_id = ?4)",
+                rows
+            )
+            inserted = cursor.rowcount
+            self.conn.commit()
+        return inserted
+
+    def daily_series(self, card_id, source, since=None):
+        """[(day_start_ts, avg, low, high, count)] for one card, rollups and raw combined"""
+        since_ts = to_timestamp(since) if since is not None else 0
+        since_day = since_ts // DAY_SECONDS
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT day, SUM(total) / SUM(cnt), MIN(low), MAX(high), SUM(cnt) FROM (
+                    SELECT ts / 86400 AS day, SUM(price) AS total, COUNT(*) AS cnt,
+                           MIN(price) AS low, MAX(price) AS high
+                    FROM observations
+                    WHERE card_id = ? AND source = ? AND ts >= ?
+                    GROUP BY day
+                    UNION ALL
+                    SELECT day, total, count, low, high
+                    FROM daily_rollups
+                    WHERE card_id = ? AND source = ? AND day >= ?
+                ) GROUP BY day ORDER BY day
+            """, (card_id, source, since_ts, card_id, source, since_day)).fetchall()
+        return [(day * DAY_SECONDS, avg, low, high, count) for day, avg, low, high, count in rows]
+
+    def extremes(self, card_id, source):
+        """All-time low / high for one card and source"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT low, low_ts, high, high_ts, count FROM extremes WHERE card_id = ? AND source = ?",
+                (card_id, source)
+            ).fetchone()
+        if not row:
+            return None
+        return {'low': row[0], 'low_ts': row[1], 'high': row[2], 'high_ts': row[3], 'count': row[4]}
+
+    def latest(self, card_id, source, since=None):
+        """(price, ts) of the most recent raw observation, optionally no older than since"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT price, ts FROM observations WHERE card_id = ? AND source = ? AND ts >= ? "
+                "ORDER BY ts DESC LIMIT 1",
+                (card_id, source, to_timestamp(since) if since is not None else 0)
+            ).fetchone()
+
+    def all_time_low(self, card_id, source):
+        found = self.extremes(card_id, source)
+        return found['low'] if found else None
+
+    def window_stats(self, source, window_days=30, card_ids=None):
+        """
+        Trend, volatility and range for every card of a source in one pass
+
+        Streams the windowed daily series ordered by card, so memory stays
+        proportional to one card's window rather than the whole table.
+        Returns {card_id: stats}.
+        """
+        since_day = (int(time.time()) - window_days * DAY_SECONDS) // DAY_SECONDS
+        since_ts = since_day * DAY_SECONDS
+        wanted = set(card_ids) if card_ids is not None else None
+
+        stats = {}
+        current_id = None
+        series = []
+
+        with self.lock:
+            extremes = {
+                row[0]: row[1:]
+                for row in self.conn.execute(
+                    "SELECT card_id, low, high, count FROM extremes WHERE source = ?", (source,)
+                )
+            }
+
+            cursor = self.conn.execute("""
+                SELECT card_id, day, SUM(total) / SUM(cnt), MIN(low), MAX(high), SUM(cnt) FROM (
+                    SELECT card_id, ts / 86400 AS day, SUM(price) AS total, COUNT(*) AS cnt,
+                           MIN(price) AS low, MAX(price) AS high
+                    FROM observations
+                    WHERE source = ? AND ts >= ?
+                    GROUP BY card_id, day
+                    UNION ALL
+                    SELECT card_id, day, total, count, low, high
+                    FROM daily_rollups
+                    WHERE source = ? AND day >= ?
+                ) GROUP BY card_id, day ORDER BY card_id, day
+            """, (source, since_ts, source, since_day))
+
+            for card_id, day, avg, low, high, count in cursor:
+                if wanted is not None and card_id not in wanted:
+                    continue
+                if card_id != current_id:
+                    if current_id is not None:
+                        stats[current_id] = summarize_series(series, extremes.get(current_id))
+                    current_id = card_id
+                    series = []
+                series.append((day, avg, low, high, count))
+
+        if current_id is not None:
+            stats[current_id] = summarize_series(series, extremes.get(current_id))
+        return stats
+
+    def card_stats(self, card_id, source, window_days=30):
+        """Trend, volatility and range for one card"""
+        since = (int(time.time()) - window_days * DAY_SECONDS) // DAY_SECONDS * DAY_SECONDS
+        series = [
+            (ts // DAY_SECONDS, avg, low, high, count)
+            for ts, avg, low, high, count in self.daily_series(card_id, source, since)
+        ]
+        found = self.extremes(card_id, source)
+        extremes = (found['low'], found['high'], found['count']) if found else None
+        return summarize_series(series, extremes)
+
+    def rollup(self, retention_days=DEFAULT_RAW_RETENTION_DAYS):
+        """Fold raw observations older than the retention window into daily bars"""
+        cutoff_day = (int(time.time()) - retention_days * DAY_SECONDS) // DAY_SECONDS
+        cutoff_ts = cutoff_day * DAY_SECONDS
+
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO daily_rollups (card_id, source, day, open, high, low, close, total, count)
+                SELECT card_id, source, ts / 86400 AS day,
+                       (SELECT price FROM observations o2
+                        WHERE o2.card_id = o.card_id AND o2.source = o.source
+                          AND o2.ts / 86400 = o.ts / 86400 ORDER BY ts LIMIT 1),
+                       MAX(price), MIN(price),
+                       (SELECT price FROM observations o3
+                        WHERE o3.card_id = o.card_id AND o3.source = o.source
+                          AND o3.ts / 86400 = o.ts / 86400 ORDER BY ts DESC LIMIT 1),
+                       SUM(price), COUNT(*)
+                FROM observations o
+                WHERE ts < ?
+                GROUP BY card_id, source, day
+                ON CONFLICT(card_id, source, day) DO UPDATE SET
+                    high = MAX(high, excluded.high),
+                    low = MIN(low, excluded.low),
+                    close = excluded.close,
+                    total = total + excluded.total,
+                    count = count + excluded.count
+            """, (cutoff_ts,))
+            deleted = self.conn.execute("DELETE FROM observations WHERE ts < ?", (cutoff_ts,)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def close(self):
+        self.conn.close()
+
+
+def summarize_series(series, extremes=None):
+    """Stats from an ordered daily series of (day, avg, low, high, count)"""
+    averages = [avg for _, avg, _, _, _ in series]
+    stats = {
+        'last': averages[-1] if averages else None,
+        'window_low': min(low for _, _, low, _, _ in series) if series else None,
+        'window_high': max(high for _, _, _, high, _ in series) if series else None,
+        'observations': sum(count for _, _, _, _, count in series),
+        'days': len(series),
+        'trend': None,
+        'volatility': None,
+        'all_time_low': extremes[0] if extremes else None,
+        'all_time_high': extremes[1] if extremes else None
+    }
+
+    if len(averages) >= MIN_DAYS_FOR_TREND and averages[0] > 0:
+        stats['trend'] = round((averages[-1] - averages[0]) / averages[0] * 100, 1)
+
+        # Standard deviation of daily log returns, in percent
+        returns = [
+            math.log(curr / prev)
+            for prev, curr in zip(averages, averages[1:])
+            if prev > 0 and curr > 0
+        ]
+        if len(returns) >= 2:
+            mean = sum(returns) / len(returns)
+            variance = sum((r - mean) ** 2 for r in returns) / (len(returns) - 1)
+            stats['volatility'] = round(math.sqrt(variance) * 100, 2)
+        elif returns:
+            stats['volatility'] = round(abs(returns[0]) * 100, 2)
+
+    return stats
+
+
+def record_analysis(results, history=None):
+    """Record every price from a what_to_pay / lightweight analysis result dict"""
+    if not results:
+        return 0
+
+    own_history = history is None
+    history = history or PriceHistory()
+    card_id = normalize_card_key(results['card_name'])
+    ts = results.get('timestamp')
+
+    observations = []
+    # Keyed by item ID, so sales sharing a sale date are all kept and re-scraped ones are not added again
+    for item in results.get('ebay_prices') or []:
+        observations.append((card_id, SOURCE_EBAY_SOLD, item.get('price'), item.get('sold_at') or ts, 'GBP',
+                             sale_key(item)))
+
+    # Last-known fallbacks for skipped sources are already in the history
+    price_charting = results.get('price_charting')
+    if price_charting and not price_charting.get('stale'):
+        observations.append((card_id, SOURCE_PRICE_CHARTING, price_charting.get('price'), ts, 'GBP'))
+
+    cardmarket = results.get('cardmarket')
+    if cardmarket and not cardmarket.get('stale'):
+        observations.append((card_id, SOURCE_TCG_API_GBP, cardmarket.get('price'), ts, 'GBP'))
+        cm_prices = (cardmarket.get('cardmarket_pricing') or {}).get('prices') or {}
+        observations.append((card_id, SOURCE_CARDMARKET_AVG7, cm_prices.get('avg7'), ts, 'EUR'))
+        observations.append((card_id, SOURCE_CARDMARKET_AVG30, cm_prices.get('avg30'), ts, 'EUR'))
+
+    try:
+        return history.record_many(observations)
+    finally:
+        if own_history:
+            history.close()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+HTTP-only PriceCharting client
+Resolves a card to its product page (through the local product index when
+possible) and parses the static HTML price tables once, returning ungraded
+and every graded tier (Grade 7 - 9.5, PSA / BGS / CGC / SGC 10) together,
+so neither the what-to-pay nor the grading analysis needs a browser
+"""
+
+import re
+import sys
+import threading
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+from currency import usd_to_gbp
+from pricecharting_index import get_index, tokenize, product_url
+from tracing import span
+
+SEARCH_URL = "https://www.pricecharting.com/search-products"
+
+SOURCE_NAME = 'Price Charting'
+
+# Ignore placeholder prices below this
+MIN_PRICE_USD = 0.50
+
+# Only the tables and headings carry data; skip the rest of the document tree
+PAGE_STRAINER = SoupStrainer(['table', 'h1'])
+SEARCH_STRAINER = SoupStrainer('a', href=re.compile(r'/game/'))
+
+PRICE_PATTERN = re.compile(r'\$\s*([\d,]+(?:\.\d+)?)')
+
+# Labels that name a grade tier, after grade_key(): ungraded, grade_9_5, psa_10, bgs_10_black...
+GRADE_PATTERN = re.compile(r'^(ungraded|grade_\d+(_5)?|(psa|bgs|cgc|sgc)_\d+(_5)?(_[a-z]+)?)$')
+
+
+def grade_key(label):
+    """Canonical key for a price column / row label: 'Grade 9.5' -> 'grade_9_5', 'PSA 10' -> 'psa_10'"""
+    return re.sub(r'[^a-z0-9]+', '_', label.strip().lower()).strip('_')
+
+
+def parse_price(text):
+    match = PRICE_PATTERN.search(text or '')
+    if not match:
+        return None
+    price = float(match.group(1).replace(',', ''))
+    return price if price >= MIN_PRICE_USD else None
+
+
+def parse_product_page(html):
+    """
+    {'title', 'console', 'grades': {grade_key: usd}} from a product page
+
+    Reads the headline table (grade headers over one price row) and the
+    full price list (label / price rows) in the same pass. The first price
+    seen for a grade wins.
+    """
+    soup = BeautifulSoup(html, 'html.parser', parse_only=PAGE_STRAINER)
+    grades = {}
+
+    for table in soup.find_all('table'):
+        headers = [th.get_text(strip=True) for th in table.find_all('th')]
+        # Column headers only name grades in the headline table ("Grade | Price" does not count)
+        if not any(GRADE_PATTERN.match(grade_key(header)) for header in headers):
+            headers = []
+        for row in table.find_all('tr'):
+            cells = row.find_all('td')
+            if not cells:
+                continue
+            if headers and len(cells) == len(headers):
+                pairs = zip(headers, cells)
+            elif len(cells) >= 2:
+                pairs = [(cells[0].get_text(strip=True), cells[1])]
+            else:
+                continue
+            for label, cell in pairs:
+                key = grade_key(label)
+                if GRADE_PATTERN.match(key) and key not in grades:
+                    price = parse_price(cell.get_text(' ', strip=True))
+                    if price is not None:
+                        grades[key] = price
+
+    title = console = None
+    heading = soup.find('h1')
+    if heading:
+        console_link = heading.find('a')
+        console = console_link.get_text(strip=True) if console_link else None
+        if console_link:
+            console_link.extract()
+        title = heading.get_text(' ', strip=True)
+
+    return {'title': title, 'console': console, 'grades': grades}
+
+
+def best_search_match(card_name, links):
+    """Best Pokemon product link for a query: most query tokens covered, card numbers agreeing"""
+    query_tokens = set(tokenize(card_name))
+    numbers = {token for token in query_tokens if token.isdigit()}
+    best_href, best_score = None, 0
+    for link in links:
+        href = link.get('href', '')
+        if 'pokemon' not in href.lower():
+            continue
+        link_tokens = set(tokenize(f"{link.get_text(' ')} {href.replace('-', ' ')}"))
+        if numbers and not numbers <= link_tokens:
+            continue
+        score = len(query_tokens & link_tokens)
+        if score > best_score:
+            best_href, best_score = href, score
+    return product_url(best_href) if best_href else None
+
+
+class PriceChartingClient:
+    """Product lookup and price-table parsing over plain HTTP"""
+
+    def __init__(self, session=None, index=None):
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            'Accept-Language': 'en-US,en;q=0.9'
+        })
+        self.index = index or get_index()
+
+    def get(self, url, params=None):
+        with span('price_charting.request'):
+            response = self.session.get(url, params=params, timeout=15)
+        response.raise_for_status()
+        return response
+
+    def product(self, url):
+        """Parsed prices for one product page"""
+        response = self.get(url)
+        with span('price_charting.parse'):
+            page = parse_product_page(response.content)
+        page['url'] = url
+        return page
+
+    def search(self, card_name):
+        """Product page for a query, parsed when the search redirected straight to it"""
+        response = self.get(SEARCH_URL, params={'q': card_name, 'type': 'prices'})
+        # A single match redirects to the product page itself
+        if '/game/' in response.url:
+            with span('price_charting.parse'):
+                page = parse_product_page(response.content)
+            page['url'] = response.url
+            return page
+
+        with span('price_charting.parse'):
+            links = BeautifulSoup(response.content, 'html.parser', parse_only=SEARCH_STRAINER).find_all('a')
+        url = best_search_match(card_name, links)
+        return self.product(url) if url else None
+
+    def lookup(self, card_name):
+        """Product page with prices, via the product index first and search second"""
+        url = self.index.lookup(card_name)
+        if url:
+            page = self.product(url)
+            if page['grades'].get('ungraded'):
+                return page
+            # Stale alias - search again, keeping the product and its tokens
+            self.index.forget_alias(card_name)
+
+        page = self.search(card_name)
+        if page and page['grades'].get('ungraded'):
+            self.index.remember(card_name, page['url'], page['title'])
+            return page
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PriceChartingClient()
+        return _client
+
+
+def lookup_card(card_name):
+    """
+    Price Charting result for a card, or None
+
+    Shaped like the other price sources ({'title', 'price', 'source', 'url'},
+    price being ungraded GBP) plus 'grades' (GBP) and 'grades_usd' for every
+    graded tier on the page.
+    """
+    page = get_client().lookup(card_name)
+    if not page:
+        return None
+    grades_usd = page['grades']
+    return {
+        'title': f"{card_name} (Price Charting)",
+        'price': usd_to_gbp(grades_usd['ungraded']),
+        'source': SOURCE_NAME,
+        'url': page['url'],
+        'product_title': page['title'],
+        'set': page['console'],
+        'grades': {grade: usd_to_gbp(price) for grade, price in grades_usd.items()},
+        'grades_usd': grades_usd
+    }
+
+
+if __name__ == "__main__":
+    result = lookup_card(' '.join(sys.argv[1:]) or 'Umbreon VMAX 215')
+    if result:
+        print(f"💰 {result['product_title']} ({result['set']}): {result['url']}")
+        for grade, price in result['grades_usd'].items():
+            print(f"   {grade}: ${price:.2f} (£{result['grades'][grade]:.2f})")
+    else:
+        print("❌ No Price Charting product found")
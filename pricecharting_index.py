@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Local PriceCharting product-URL index
+Maps normalized card names to PriceCharting product pages so known cards go
+straight to their product page instead of searching. Entries are learned from
+successful lookups and can be bulk-built from PriceCharting's Pokemon set
+listing pages; lookups fall back to fuzzy token matching
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from difflib import SequenceMatcher
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+from tcg_catalog import RateLimiter
+from tracing import span
+
+BASE_URL = "https://www.pricecharting.com"
+CATEGORY_URL = f"{BASE_URL}/category/pokemon-cards"
+
+DEFAULT_DB_PATH = 'pricecharting_index.db'
+
+# Words that carry no identity in a card name
+STOPWORDS = {'pokemon', 'card', 'cards', 'the', 'of', 'tcg'}
+
+# Fuzzy matches below this score, or too close to the runner-up, are not trusted
+MIN_FUZZY_SCORE = 0.75
+MIN_FUZZY_MARGIN = 0.05
+
+MAX_CANDIDATES = 50
+
+# Set listing pages load further rows through a cursor parameter
+MAX_LISTING_PAGES = 40
+
+
+def tokenize(text):
+    """Lowercase identity tokens of a card name or product title"""
+    return [token for token in re.findall(r'[a-z0-9]+', text.lower()) if token not in STOPWORDS]
+
+
+def normalize_key(text):
+    return '-'.join(tokenize(text))
+
+
+def product_url(href):
+    return urljoin(BASE_URL, href)
+
+
+class PriceChartingIndex:
+    """SQLite index of product URLs with learned aliases and a token index"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('PRICECHARTING_INDEX_DB', DEFAULT_DB_PATH)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS products (
+                url TEXT PRIMARY KEY,
+                title TEXT,
+                console TEXT,
+                key TEXT,
+                source TEXT,
+                updated_at INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                url TEXT,
+                hits INTEGER DEFAULT 0,
+                updated_at INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS product_tokens (
+                token TEXT,
+                url TEXT,
+                PRIMARY KEY (token, url)
+            ) WITHOUT ROWID;
+        """)
+
+    def add_products(self, products, source='listing'):
+        """Insert or refresh (url, title, console) entries"""
+        now = int(time.time())
+        rows = []
+        token_rows = []
+        for url, title, console in products:
+            rows.append((url, title, console, normalize_key(title), source, now))
+            for token in set(tokenize(f"{title} {console or ''}")):
+                token_rows.append((token, url))
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO products (url, title, console, key, source, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO product_tokens (token, url) VALUES (?, ?)", token_rows)
+            self.conn.commit()
+        return len(rows)
+
+    def remember(self, card_name, url, title=None):
+        """Record a successful lookup so the same query goes straight to its product page"""
+        alias = normalize_key(card_name)
+        if not alias:
+            return
+        console = url.rstrip('/').split('/')[-2].replace('-', ' ') if '/game/' in url else None
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM products WHERE url = ?", (url,)).fetchone()
+        if not exists:
+            self.add_products([(url, title or card_name, console)], source='lookup')
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO aliases (alias, url, hits, updated_at) VALUES "
+                "(?, ?, COALESCE((SELECT hits FROM aliases WHERE alias = ? AND url = ?), 0), ?)",
+                (alias, url, alias, url, int(time.time()))
+            )
+            self.conn.commit()
+
+    def forget_alias(self, card_name):
+        """Drop a learned alias whose product page no longer had a price; the product stays indexed"""
+        alias = normalize_key(card_name)
+        if not alias:
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM aliases WHERE alias = ?", (alias,))
+            self.conn.commit()
+
+    def forget(self, url):
+        """Drop a product URL that no longer resolves to a price"""
+        with self.lock:
+            self.conn.execute("DELETE FROM aliases WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM product_tokens WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM products WHERE url = ?", (url,))
+            self.conn.commit()
+
+    def lookup(self, card_name):
+        """Product URL for a card name: exact alias, exact title key, then fuzzy match"""
+        alias = normalize_key(card_name)
+        if not alias:
+            return None
+
+        with self.lock:
+            row = self.conn.execute("SELECT url FROM aliases WHERE alias = ?", (alias,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE aliases SET hits = hits + 1 WHERE alias = ?", (alias,))
+                self.conn.commit()
+                return row[0]
+            rows = self.conn.execute("SELECT url FROM products WHERE key = ? LIMIT 2", (alias,)).fetchall()
+        # A title shared by several sets (e.g. "Pikachu #25") is not enough on its own
+        if len(rows) == 1:
+            return rows[0][0]
+
+        match = self.fuzzy_lookup(card_name)
+        return match[0] if match else None
+
+    def fuzzy_lookup(self, card_name):
+        """Best (url, score) by token overlap and key similarity, or None when not confident"""
+        tokens = list(dict.fromkeys(tokenize(card_name)))
+        if not tokens:
+            return None
+        numbers = {token for token in tokens if token.isdigit()}
+        query_key = '-'.join(tokens)
+
+        placeholders = ','.join('?' * len(tokens))
+        with self.lock:
+            candidates = self.conn.execute(f"""
+                SELECT p.url, p.title, p.console, COUNT(*) AS shared
+                FROM product_tokens t JOIN products p ON p.url = t.url
+                WHERE t.token IN ({placeholders})
+                GROUP BY p.url
+                ORDER BY shared DESC
+                LIMIT ?
+            """, (*tokens, MAX_CANDIDATES)).fetchall()
+
+        scored = []
+        for url, title, console, shared in candidates:
+            candidate_tokens = set(tokenize(f"{title} {console or ''}"))
+            # Card numbers must agree - a different number is a different card
+            if numbers and not numbers <= candidate_tokens:
+                continue
+            coverage = shared / len(tokens)
+            similarity = SequenceMatcher(None, query_key, normalize_key(title)).ratio()
+            scored.append((0.7 * coverage + 0.3 * similarity, url))
+
+        if not scored:
+            return None
+        scored.sort(reverse=True)
+        best_score, best_url = scored[0]
+        if best_score < MIN_FUZZY_SCORE:
+            return None
+        if len(scored) > 1 and best_score - scored[1][0] < MIN_FUZZY_MARGIN:
+            return None
+        return best_url, round(best_score, 3)
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class ListingIndexBuilder:
+    """Bulk-builds the index from PriceCharting's Pokemon set listing pages"""
+
+    def __init__(self, index=None, requests_per_second=2, session=None):
+        self.index = index or PriceChartingIndex()
+        self.limiter = RateLimiter(requests_per_second)
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+        })
+
+    def fetch(self, url, params=None):
+        self.limiter.wait()
+        with span('price_charting.request'):
+            response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return BeautifulSoup(response.content, 'html.parser')
+
+    def set_pages(self):
+        """URLs of every Pokemon set ("console") listing page"""
+        soup = self.fetch(CATEGORY_URL)
+        urls = {product_url(a['href']) for a in soup.find_all('a', href=re.compile(r'^/console/pokemon'))}
+        return sorted(urls)
+
+    def index_set(self, set_url):
+        """Index every product row of one set, following the listing's cursor pages"""
+        console = set_url.rstrip('/').split('/')[-1].replace('-', ' ')
+        params = None
+        added = 0
+        for _ in range(MAX_LISTING_PAGES):
+            soup = self.fetch(set_url, params)
+            products = []
+            for link in soup.select('#games_table td.title a[href*="/game/"]'):
+                products.append((product_url(link['href']), link.get_text(strip=True), console))
+            if not products:
+                break
+            added += self.index.add_products(products)
+
+            cursor = soup.find('input', attrs={'name': 'cursor'})
+            if not cursor or not cursor.get('value'):
+                break
+            params = {'cursor': cursor['value']}
+        return added
+
+    def build(self, set_urls=None):
+        set_urls = set_urls or self.set_pages()
+        print(f"📚 Indexing {len(set_urls)} PriceCharting sets...")
+        total = 0
+        for set_url in set_urls:
+            try:
+                count = self.index_set(set_url)
+                total += count
+                print(f"   ✓ {set_url}: {count} products")
+            except requests.RequestException as e:
+                print(f"   ⚠️ Failed to index {set_url}: {e}")
+        print(f"✅ Indexed {total} products ({self.index.count()} stored)")
+        return total
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide index, opened on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PriceChartingIndex()
+        return _index
+
+
+def main():
+    builder = ListingIndexBuilder()
+    try:
+        builder.build(sys.argv[1:] or None)
+    finally:
+        builder.index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Progress event channel for the analyzers
+Coalesces progress updates per stage, throttles them to a maximum rate and
+writes them in buffered batches to stdout (PROGRESS: lines) or to a socket
+as length-prefixed binary frames. Diagnostic console chatter goes through
+debug(), which writes to stderr and is off by default in production
+"""
+
+import atexit
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+from serialization import progress_event
+
+# Most progress writes per second; later updates to the same stage replace pending ones
+DEFAULT_MAX_RATE = 4.0
+
+# Railway sets RAILWAY_ENVIRONMENT; Next.js sets NODE_ENV
+PRODUCTION = bool(os.getenv('RAILWAY_ENVIRONMENT')) or os.getenv('NODE_ENV') == 'production'
+
+# ANALYZER_VERBOSE=1 / 0 overrides the production default
+VERBOSE = os.getenv('ANALYZER_VERBOSE', '0' if PRODUCTION else '1') not in ('0', 'false', '')
+
+
+def debug(*args):
+    """Diagnostic console output, kept off the machine-read stdout channel"""
+    if VERBOSE:
+        print(*args, file=sys.stderr)
+
+
+class StdoutTransport:
+    """PROGRESS:<json> lines on stdout, flushed once per batch"""
+
+    def write(self, payload):
+        sys.stdout.write("PROGRESS:" + payload.decode('utf-8') + "\n")
+
+    def flush(self):
+        sys.stdout.flush()
+
+    def close(self):
+        self.flush()
+
+
+class SocketTransport:
+    """
+    Length-prefixed frames over a unix or TCP socket
+
+    Each event is a 4-byte big-endian length followed by its JSON bytes.
+    address is "unix:/path/to.sock" or "tcp:host:port".
+    """
+
+    def __init__(self, address):
+        kind, _, target = address.partition(':')
+        if kind == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(target)
+        elif kind == 'tcp':
+            host, _, port = target.rpartition(':')
+            self.sock = socket.create_connection((host, int(port)), timeout=5)
+        else:
+            raise ValueError(f"Unsupported progress transport: {address}")
+        self.buffer = bytearray()
+
+    def write(self, payload):
+        self.buffer += struct.pack('>I', len(payload)) + payload
+
+    def flush(self):
+        if self.buffer:
+            self.sock.sendall(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.sock.close()
+
+
+class NullTransport:
+    def write(self, payload):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_transport(spec=None):
+    """Transport from a spec: "stdout" (default), "off", "unix:<path>" or "tcp:<host>:<port>" """
+    spec = spec or os.getenv('PROGRESS_TRANSPORT', 'stdout')
+    if spec == 'stdout':
+        return StdoutTransport()
+    if spec == 'off':
+        return NullTransport()
+    try:
+        return SocketTransport(spec)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Progress transport {spec} unavailable, using stdout: {e}", file=sys.stderr)
+        return StdoutTransport()
+
+
+class ProgressChannel:
+    """
+    Coalescing, rate-limited progress events
+
+    A new stage is always written straight away. Further updates within the
+    rate limit are held, and only the latest message per stage is written
+    when the window ends.
+    """
+
+    def __init__(self, transport=None, max_rate=None):
+        self.transport = transport or make_transport()
+        if max_rate is None:
+            max_rate = float(os.getenv('PROGRESS_MAX_RATE', DEFAULT_MAX_RATE))
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_stage = None
+        self.last_write = 0.0
+        self.coalesced = 0
+
+        self.closed = threading.Event()
+        self.flusher = None
+
+    def emit(self, stage, message):
+        event = (message, datetime.now())
+        with self.lock:
+            if stage in self.pending:
+                self.coalesced += 1
+            self.pending[stage] = event
+
+            now = time.monotonic()
+            if stage != self.last_stage or now - self.last_write >= self.interval:
+                self.write_pending(now)
+            elif self.flusher is None:
+                self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+                self.flusher.start()
+
+    def write_pending(self, now):
+        """Write every held event in arrival order as one batch (lock held)"""
+        if not self.pending:
+            return
+        for stage, (message, timestamp) in self.pending.items():
+            self.transport.write(progress_event(stage, message, timestamp))
+            self.last_stage = stage
+        self.pending.clear()
+        self.last_write = now
+        try:
+            self.transport.flush()
+        except OSError as e:
+            print(f"⚠️ Progress transport failed, using stdout: {e}", file=sys.stderr)
+            self.transport = StdoutTransport()
+
+    def flush_loop(self):
+        while not self.closed.wait(self.interval):
+            with self.lock:
+                if self.pending and time.monotonic() - self.last_write >= self.interval:
+                    self.write_pending(time.monotonic())
+
+    def flush(self):
+        with self.lock:
+            self.write_pending(time.monotonic())
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.flush()
+        self.transport.close()
+
+
+_channel = None
+_channel_lock = threading.Lock()
+
+
+def get_channel():
+    """Process-wide channel, created on first use and flushed at exit"""
+    global _channel
+    with _channel_lock:
+        if _channel is None:
+            _channel = ProgressChannel()
+            atexit.register(_channel.close)
+        return _channel
+
+
+def flush_progress():
+    """
+    Write any held progress events now
+
+    Call before machine-read output (the results path line, the JSON block)
+    so the background flusher cannot interleave PROGRESS: lines with it.
+    """
+    with _channel_lock:
+        channel = _channel
+    if channel is not None:
+        channel.flush()
+
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """Call listener(stage, message) for every progress event until removed"""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def emit_progress(stage, message):
+    """Emit progress updates that can be captured by the API"""
+    get_channel().emit(stage, message)
+    if _listeners:
+        with _listeners_lock:
+            listeners = list(_listeners)
+        for listener in listeners:
+            listener(stage, message)
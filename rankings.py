@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Single-pass leaderboards with bounded heaps
+Keeps the top K items for any number of rankings plus running summary
+stats while cards stream in, instead of fully sorting the list per ranking
+"""
+
+import heapq
+import itertools
+
+
+class TopK:
+    """
+    The k largest items by key, in O(n log k) time and O(k) memory
+
+    Ties keep arrival order, matching sorted(..., reverse=True).
+    """
+
+    def __init__(self, k, key, where=None):
+        self.k = k
+        self.key = key
+        self.where = where
+        self.heap = []
+        self.matched = 0
+        self.counter = itertools.count()
+
+    def push(self, item):
+        if self.where is not None and not self.where(item):
+            return
+        self.matched += 1
+
+        # Later arrivals rank lower on ties, so they are evicted first
+        entry = (self.key(item), -next(self.counter), item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+
+    def items(self):
+        """Current top items, best first"""
+        return [entry[2] for entry in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class RunningStats:
+    """Count / min / max / total / mean of one numeric field or derived value"""
+
+    def __init__(self, value):
+        if callable(value):
+            self.value = value
+        else:
+            self.value = lambda item: item[value] if isinstance(item, dict) else getattr(item, value)
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+
+    def push(self, item):
+        value = self.value(item)
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class Leaderboards:
+    """
+    Several TopK rankings and RunningStats fed from one stream
+
+    stats is a list of field names, or a dict of name -> field / callable.
+    """
+
+    def __init__(self, boards, stats=()):
+        self.boards = boards
+        if not isinstance(stats, dict):
+            stats = {field: field for field in stats}
+        self.stats = {name: RunningStats(value) for name, value in stats.items()}
+        self.total = 0
+
+    def add(self, item):
+        self.total += 1
+        for board in self.boards.values():
+            board.push(item)
+        for stat in self.stats.values():
+            stat.push(item)
+
+    def add_many(self, items):
+        for item in items:
+            self.add(item)
+        return self
+
+    def top(self, name):
+        return self.boards[name].items()
+
+    def matched(self, name):
+        """How many streamed items qualified for a board, not just the k kept"""
+        return self.boards[name].matched
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Background price refresh for popular and watched cards
+Counts lookups per card (decaying over time), serves analyses from a result
+cache while they are fresh, and refreshes the cards with the highest
+popularity x staleness in the background within a request budget, so hot
+cards are answered without paying scrape latency
+"""
+
+import heapq
+import importlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from serialization import dumps, loads
+from single_flight import flight_key, single_flight
+
+DEFAULT_DB_PATH = 'refresh_scheduler.db'
+
+# Analyses younger than this are served from the cache
+DEFAULT_FRESH_MINUTES = 30
+
+# Cards are queued once this fraction of the fresh window has passed, so hot ones never go stale
+REFRESH_AHEAD = 0.75
+
+# Lookup counts halve over this period
+POPULARITY_HALF_LIFE_HOURS = 24
+
+# Below this decayed lookup count an unwatched card is not worth refreshing
+MIN_POPULARITY = 0.5
+
+# Watching a card counts as this many recent lookups
+WATCH_WEIGHT = 5.0
+
+# Never-refreshed cards rank as this stale (in fresh windows)
+MAX_STALENESS = 4.0
+
+# Refresh budget: per scheduler cycle and per rolling hour
+DEFAULT_CYCLE_BUDGET = 5
+DEFAULT_HOURLY_BUDGET = 60
+DEFAULT_CYCLE_SECONDS = 60
+
+# Failed refreshes back off exponentially up to this
+MAX_RETRY_DELAY_SECONDS = 3600
+
+# Unwatched cards not looked up for this long are dropped
+FORGET_AFTER_DAYS = 14
+
+# Analysis entry points a refresh runs, bypassing the cache (module, function)
+RUNNERS = {
+    'what_to_pay': ('what_to_pay_analyzer', 'run_analysis'),
+    'lightweight': ('lightweight_scraper', 'run_lightweight_analysis')
+}
+
+
+def runner_for(source):
+    module_name, function_name = RUNNERS[source]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class RefreshStore:
+    """Per-card lookup counts, watch flags and cached analysis results"""
+
+    def __init__(self, path=None, fresh_minutes=None):
+        self.path = path or os.getenv('REFRESH_SCHEDULER_DB', DEFAULT_DB_PATH)
+        if fresh_minutes is None:
+            fresh_minutes = float(os.getenv('REFRESH_FRESH_MINUTES', DEFAULT_FRESH_MINUTES))
+        self.fresh_seconds = fresh_minutes * 60
+        self.decay = 0.5 ** (1 / (POPULARITY_HALF_LIFE_HOURS * 3600))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cards (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                card_name TEXT NOT NULL,
+                popularity REAL NOT NULL DEFAULT 0,
+                last_lookup REAL,
+                watched INTEGER NOT NULL DEFAULT 0,
+                refreshed_at REAL,
+                result TEXT,
+                failures INTEGER NOT NULL DEFAULT 0,
+                retry_at REAL
+            );
+        """)
+
+    def popularity(self, popularity, last_lookup, now):
+        """Decayed lookup count as of now"""
+        if not last_lookup:
+            return popularity
+        return popularity * self.decay ** max(now - last_lookup, 0)
+
+    def record_lookup(self, source, card_name, now=None):
+        now = now or time.time()
+        key = flight_key(source, card_name)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT popularity, last_lookup FROM cards WHERE key = ?", (key,)).fetchone()
+            popularity = self.popularity(*row, now) + 1 if row else 1.0
+            self.conn.execute("""
+                INSERT INTO cards (key, source, card_name, popularity, last_lookup) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET popularity = excluded.popularity,
+                    last_lookup = excluded.last_lookup, card_name = excluded.card_name
+            """, (key, source, card_name, popularity, now))
+            self.conn.commit()
+
+    def watch(self, source, card_name, watched=True):
+        key = flight_key(source, card_name)
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO cards (key, source, card_name, watched) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET watched = excluded.watched
+            """, (key, source, card_name, int(watched)))
+            self.conn.commit()
+
+    def cached(self, source, card_name, now=None):
+        """(result, age_seconds) when a fresh result is cached, else (None, None)"""
+        now = now or time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, refreshed_at FROM cards WHERE key = ?",
+                (flight_key(source, card_name),)).fetchone()
+        if not row or not row[0] or now - row[1] > self.fresh_seconds:
+            return None, None
+        return loads(row[0]), now - row[1]
+
+    def store_result(self, source, card_name, result, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO cards (key, source, card_name, refreshed_at, result) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET refreshed_at = excluded.refreshed_at,
+                    result = excluded.result, failures = 0, retry_at = NULL
+            """, (flight_key(source, card_name), source, card_name, now, dumps(result)))
+            self.conn.commit()
+
+    def record_failure(self, key, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.conn.execute("""
+                UPDATE cards SET failures = failures + 1,
+                    retry_at = ? + MIN(60 * (1 << MIN(failures, 10)), ?)
+                WHERE key = ?
+            """, (now, MAX_RETRY_DELAY_SECONDS, key))
+            self.conn.commit()
+
+    def due(self, limit, now=None):
+        """
+        Up to limit (priority, key, source, card_name) to refresh, highest first
+
+        Priority is decayed popularity (plus the watch weight) times staleness
+        in fresh windows; cards are only due once REFRESH_AHEAD of their window
+        has passed.
+        """
+        now = now or time.time()
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT key, source, card_name, popularity, last_lookup, watched, refreshed_at
+                FROM cards
+                WHERE (retry_at IS NULL OR retry_at <= ?)
+                  AND (refreshed_at IS NULL OR refreshed_at <= ?)
+            """, (now, now - self.fresh_seconds * REFRESH_AHEAD)).fetchall()
+
+        candidates = []
+        for key, source, card_name, popularity, last_lookup, watched, refreshed_at in rows:
+            popularity = self.popularity(popularity, last_lookup, now) + (WATCH_WEIGHT if watched else 0)
+            if popularity < MIN_POPULARITY or source not in RUNNERS:
+                continue
+            staleness = (now - refreshed_at) / self.fresh_seconds if refreshed_at else MAX_STALENESS
+            candidates.append((popularity * min(staleness, MAX_STALENESS), key, source, card_name))
+        return heapq.nlargest(limit, candidates)
+
+    def forget_cold(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            deleted = self.conn.execute(
+                "DELETE FROM cards WHERE watched = 0 AND last_lookup < ?",
+                (now - FORGET_AFTER_DAYS * 86400,)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def close(self):
+        self.conn.close()
+
+
+class RefreshScheduler:
+    """Background thread that refreshes the highest-priority cards within a budget"""
+
+    def __init__(self, store=None, cycle_budget=None, hourly_budget=None, cycle_seconds=None):
+        self.store = store or get_store()
+        self.cycle_budget = cycle_budget or int(os.getenv('REFRESH_CYCLE_BUDGET', DEFAULT_CYCLE_BUDGET))
+        self.hourly_budget = hourly_budget or int(os.getenv('REFRESH_HOURLY_BUDGET', DEFAULT_HOURLY_BUDGET))
+        self.cycle_seconds = cycle_seconds or float(os.getenv('REFRESH_CYCLE_SECONDS', DEFAULT_CYCLE_SECONDS))
+        self.recent = deque()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stats = {'refreshed': 0, 'failed': 0, 'cycles': 0}
+
+    def remaining_budget(self, now):
+        while self.recent and now - self.recent[0] > 3600:
+            self.recent.popleft()
+        return max(min(self.cycle_budget, self.hourly_budget - len(self.recent)), 0)
+
+    def refresh(self, key, source, card_name):
+        print(f"🔄 Refreshing {card_name} ({source})")
+        self.recent.append(time.time())
+        try:
+            # Shares the run with any user request for the same card in flight
+            result = single_flight(source, card_name, runner_for(source), card_name)
+        except Exception as e:
+            print(f"⚠️ Refresh of {card_name} failed: {e}")
+            self.store.record_failure(key)
+            self.stats['failed'] += 1
+            return False
+        self.store.store_result(source, card_name, result)
+        self.stats['refreshed'] += 1
+        return True
+
+    def run_cycle(self):
+        """Refresh the top due cards the budget allows, returning how many were attempted"""
+        now = time.time()
+        budget = self.remaining_budget(now)
+        self.stats['cycles'] += 1
+        if not budget:
+            return 0
+        due = self.store.due(budget, now)
+        for priority, key, source, card_name in due:
+            if self.stopped.is_set():
+                break
+            self.refresh(key, source, card_name)
+        if self.stats['cycles'] % 60 == 0:
+            self.store.forget_cold(now)
+        return len(due)
+
+    def loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.run_cycle()
+            except Exception as e:
+                print(f"⚠️ Refresh cycle failed: {e}")
+            self.stopped.wait(self.cycle_seconds)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop, name='refresh-scheduler', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RefreshStore()
+        return _store
+
+
+def serve_analysis(source, card_name, runner):
+    """
+    Cached analysis while fresh, otherwise runner(card_name) through the
+    single-flight layer; either way the lookup counts towards popularity
+    """
+    store = get_store()
+    try:
+        store.record_lookup(source, card_name)
+        result, age = store.cached(source, card_name)
+    except sqlite3.Error as e:
+        print(f"⚠️ Refresh cache unavailable: {e}")
+        return single_flight(source, card_name, runner, card_name)
+
+    if result is not None:
+        print(f"⚡ Serving cached analysis for {card_name} ({age / 60:.0f} min old)")
+        result['cache'] = {'hit': True, 'age_seconds': round(age)}
+        return result
+
+    result = single_flight(source, card_name, runner, card_name)
+    # Followers got a copy of the leader's result; the leader stores it
+    if isinstance(result, dict) and 'single_flight' not in result:
+        try:
+            store.store_result(source, card_name, result)
+        except (sqlite3.Error, TypeError) as e:
+            print(f"⚠️ Could not cache analysis: {e}")
+    return result
+
+
+def main():
+    """python refresh_scheduler.py [--once] [--watch <source> <card name>]"""
+    args = sys.argv[1:]
+    store = get_store()
+    if args[:1] == ['--watch'] and len(args) > 2:
+        store.watch(args[1], ' '.join(args[2:]))
+        print(f"👀 Watching {' '.join(args[2:])} ({args[1]})")
+        return
+
+    scheduler = RefreshScheduler(store)
+    if args[:1] == ['--once']:
+        attempted = scheduler.run_cycle()
+        print(f"✅ Refreshed {scheduler.stats['refreshed']} of {attempted} due cards")
+        return
+
+    print(f"🕒 Refreshing up to {scheduler.cycle_budget} cards every {scheduler.cycle_seconds:.0f}s "
+          f"({scheduler.hourly_budget}/hour)")
+    scheduler.start()
+    try:
+        while scheduler.thread.is_alive():
+            scheduler.thread.join(1)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
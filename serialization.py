@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Fast JSON serialization for analyzer outputs and progress events
+Uses orjson, then msgspec, when installed and falls back to the standard
+library. Output is compact unless an indent is asked for (or set with the
+RESULTS_JSON_INDENT environment variable)
+"""
+
+import json
+import os
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+BACKEND = 'orjson' if orjson is not None else 'msgspec' if msgspec is not None else 'json'
+
+# Compact by default; RESULTS_JSON_INDENT=2 for human-readable result files
+DEFAULT_INDENT = int(os.getenv('RESULTS_JSON_INDENT', '0')) or None
+
+# Encoders for result types the backends do not know, keyed by class.
+# Model modules register their own (see card_models)
+ENCODERS = {}
+
+
+def register_encoder(cls, encoder):
+    """Serialize instances of cls with encoder(obj) -> JSON-compatible value"""
+    ENCODERS[cls] = encoder
+
+
+def default(obj):
+    """Fallback for values the backend cannot encode natively"""
+    encoder = ENCODERS.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # numpy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+if msgspec is not None:
+    MSGSPEC_ENCODER = msgspec.json.Encoder(enc_hook=default)
+
+
+def dumpb(obj, indent=None, sort_keys=False):
+    """
+    Encode obj as UTF-8 JSON bytes
+
+    indent=None uses DEFAULT_INDENT; indent=0 is always compact, for
+    storage and machine-read lines.
+    """
+    indent = indent if indent is not None else DEFAULT_INDENT
+
+    if orjson is not None:
+        options = ORJSON_OPTIONS
+        if indent:
+            # orjson only supports two-space indentation
+            options |= orjson.OPT_INDENT_2
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=options)
+
+    if msgspec is not None and not sort_keys:
+        data = MSGSPEC_ENCODER.encode(obj)
+        return msgspec.json.format(data, indent=indent) if indent else data
+
+    separators = None if indent else (',', ':')
+    return json.dumps(obj, default=default, indent=indent or None, sort_keys=sort_keys,
+                      separators=separators, ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj, indent=None, sort_keys=False):
+    """Encode obj as a JSON string"""
+    return dumpb(obj, indent=indent, sort_keys=sort_keys).decode('utf-8')
+
+
+def write_json(obj, path, indent=None, sort_keys=False):
+    """Write obj as JSON to a file path"""
+    with open(path, 'wb') as f:
+        f.write(dumpb(obj, indent=indent, sort_keys=sort_keys))
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def progress_event(stage, message, timestamp=None):
+    """Compact JSON bytes for one progress event, timestamped now unless given"""
+    # The backends encode datetimes directly, without an isoformat() round trip
+    return dumpb({'stage': stage, 'message': message, 'timestamp': timestamp or datetime.now()}, indent=0)
+
+
+def progress_line(stage, message, timestamp=None):
+    """PROGRESS: line for the API"""
+    return "PROGRESS:" + progress_event(stage, message, timestamp).decode('utf-8')
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Single-flight deduplication for concurrent identical lookups
+Requests for the same normalized card name and source attach to the one
+analysis already in flight instead of starting their own browsers and API
+calls. Threads in a process share it through an in-memory table; separate
+analyzer processes share it through a lock file, with the leader's progress
+events and result written next to it for the followers to replay and read.
+Files of flights that finished long ago are swept periodically
+"""
+
+import copy
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+    FILE_LOCKS = True
+except ImportError:
+    # Windows - deduplicate within the process only
+    FILE_LOCKS = False
+
+from progress import emit_progress, add_listener, remove_listener
+from serialization import dumpb, loads, write_json, read_json
+
+DEFAULT_FLIGHT_DIR = os.path.join(tempfile.gettempdir(), 'pokemon-single-flight')
+
+# How often a waiting process checks for new progress events and the leader finishing
+POLL_INTERVAL = 0.25
+
+# Followers stop waiting after this long and run the analysis themselves
+DEFAULT_MAX_WAIT_SECONDS = 300
+
+# A flight's files are removed once its lock file is this old and not held
+DEFAULT_FILE_MAX_AGE_SECONDS = 3600
+
+# Each process sweeps old flight files at most this often
+CLEANUP_INTERVAL_SECONDS = 600
+
+ROLE_FOLLOWER = 'follower'
+
+
+def flight_key(source, card_name):
+    """'what_to_pay:charizard-ex-199' for ('what_to_pay', '  Charizard EX  199/165 ')"""
+    # "199/165" and "199" are the same card
+    tokens = re.findall(r'[a-z0-9]+', re.sub(r'(\d+)/\d+', r'\1', card_name.lower()))
+    return f"{source}:{'-'.join(tokens)}"
+
+
+def same_file(handle, path):
+    """True while path still names the file handle has open"""
+    try:
+        return os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino
+    except OSError:
+        return False
+
+
+class Flight:
+    """One in-process analysis and the threads waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """In-process flight table backed by per-key lock files shared across processes"""
+
+    def __init__(self, directory=None, max_wait_seconds=None):
+        self.directory = directory or os.getenv('SINGLE_FLIGHT_DIR', DEFAULT_FLIGHT_DIR)
+        self.max_wait_seconds = max_wait_seconds or float(
+            os.getenv('SINGLE_FLIGHT_MAX_WAIT', DEFAULT_MAX_WAIT_SECONDS))
+        self.file_max_age = float(os.getenv('SINGLE_FLIGHT_FILE_MAX_AGE', DEFAULT_FILE_MAX_AGE_SECONDS))
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.last_cleanup = 0.0
+        self.stats = {'led': 0, 'joined_thread': 0, 'joined_process': 0, 'files_removed': 0}
+        if FILE_LOCKS:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def paths(self, key):
+        base = os.path.join(self.directory, re.sub(r'[^a-z0-9_-]+', '_', key))
+        return f"{base}.lock", f"{base}.events", f"{base}.result.json"
+
+    def run(self, source, card_name, func, *args):
+        """
+        func(*args) for the first caller with this key; concurrent callers
+        get a copy of its result (or its exception)
+        """
+        key = flight_key(source, card_name)
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                leader = True
+            else:
+                flight.followers += 1
+                self.stats['joined_thread'] += 1
+                leader = False
+
+        if not leader:
+            print(f"🔗 Joining in-flight analysis for {card_name}")
+            emit_progress("analysis", "Same card already being analyzed - sharing its results...")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return mark_shared(copy.deepcopy(flight.result))
+
+        try:
+            flight.result = self.run_across_processes(key, card_name, func, *args)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+    def run_across_processes(self, key, card_name, func, *args):
+        if not FILE_LOCKS:
+            self.stats['led'] += 1
+            return func(*args)
+
+        self.maybe_cleanup()
+        lock_path, events_path, result_path = self.paths(key)
+        while True:
+            lock_file = open(lock_path, 'a+')
+            try:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    result, locked = self.follow(card_name, lock_file, events_path, result_path)
+                    if result is not None:
+                        return result
+                    if not locked:
+                        self.stats['led'] += 1
+                        return func(*args)
+                # A sweep may have removed the file before it was locked; lock the current one instead
+                if not same_file(lock_file, lock_path):
+                    continue
+                # Holding the lock: no other process is analyzing this card
+                os.utime(lock_path)
+                return self.lead(func, args, events_path, result_path)
+            finally:
+                lock_file.close()
+
+    def maybe_cleanup(self):
+        now = time.time()
+        with self.lock:
+            if now - self.last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return
+            self.last_cleanup = now
+        try:
+            removed = self.cleanup(now)
+        except OSError as e:
+            print(f"⚠️ Could not clean up single-flight files: {e}")
+            return
+        with self.lock:
+            self.stats['files_removed'] += removed
+
+    def cleanup(self, now=None):
+        """
+        Remove the lock, events and result files of flights last led more than
+        file_max_age ago, skipping any still locked. Returns how many files went.
+        """
+        now = now or time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.lock'):
+                continue
+            lock_path = os.path.join(self.directory, name)
+            base = lock_path[:-len('.lock')]
+            try:
+                if now - os.path.getmtime(lock_path) < self.file_max_age:
+                    continue
+                with open(lock_path, 'a+') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    # Removed while locked, so a process that opened it meanwhile re-opens a fresh one
+                    for path in (f"{base}.events", f"{base}.result.json", lock_path):
+                        try:
+                            os.remove(path)
+                            removed += 1
+                        except FileNotFoundError:
+                            pass
+            except OSError:
+                # Held by a running flight, or already gone
+                continue
+        return removed
+
+    def lead(self, func, args, events_path, result_path):
+        """Run the analysis, mirroring progress events to the events file and the result to disk"""
+        self.stats['led'] += 1
+        events = open(events_path, 'wb', buffering=0)
+
+        def record(stage, message):
+            events.write(dumpb({'stage': stage, 'message': message}) + b'\n')
+
+        add_listener(record)
+        try:
+            result = func(*args)
+        finally:
+            remove_listener(record)
+            events.close()
+
+        tmp_path = f"{result_path}.tmp"
+        try:
+            write_json({'finished_at': time.time(), 'result': result}, tmp_path)
+            os.replace(tmp_path, result_path)
+        except (OSError, TypeError) as e:
+            print(f"⚠️ Could not share analysis result: {e}")
+        return result
+
+    def follow(self, card_name, lock_file, events_path, result_path):
+        """
+        Replay the leading process's progress until it releases the lock
+
+        Returns (result, locked): the leader's result, or None when it left no
+        result (or the wait timed out) and this process should run the
+        analysis itself - under the lock when locked is True.
+        """
+        print(f"🔗 Joining analysis for {card_name} running in another process")
+        emit_progress("analysis", "Same card already being analyzed - sharing its results...")
+        self.stats['joined_process'] += 1
+        joined_at = time.time()
+        deadline = time.monotonic() + self.max_wait_seconds
+        offset = 0
+
+        while True:
+            offset = self.replay_events(events_path, offset)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    print(f"⚠️ In-flight analysis for {card_name} is taking too long - running separately")
+                    return None, False
+                time.sleep(POLL_INTERVAL)
+
+        self.replay_events(events_path, offset)
+        try:
+            shared = read_json(result_path)
+        except (OSError, ValueError):
+            shared = None
+        # A result from before this process joined belongs to an earlier flight
+        if not shared or shared.get('finished_at', 0) < joined_at:
+            print("⚠️ Leading process finished without a result - running analysis")
+            return None, True
+        return mark_shared(shared['result']), True
+
+    def replay_events(self, events_path, offset):
+        """Re-emit events appended since offset, returning the new offset"""
+        try:
+            with open(events_path, 'rb') as events:
+                events.seek(0, os.SEEK_END)
+                # The leader truncated the file for a new flight
+                if events.tell() < offset:
+                    offset = 0
+                events.seek(offset)
+                data = events.read()
+        except OSError:
+            return offset
+        complete = data.rfind(b'\n') + 1
+        for line in data[:complete].splitlines():
+            try:
+                event = loads(line)
+            except ValueError:
+                continue
+            emit_progress(event['stage'], event['message'])
+        return offset + complete
+
+    def report(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.flights))
+
+
+def mark_shared(result):
+    if isinstance(result, dict):
+        result['single_flight'] = {'role': ROLE_FOLLOWER, 'shared_at': datetime.now().isoformat()}
+    return result
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
+
+
+def single_flight(source, card_name, func, *args):
+    """func(*args), shared with every concurrent call for the same source and card"""
+    return get_single_flight().run(source, card_name, func, *args)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Per-source health tracking and circuit breakers
+Records the outcome and latency of every eBay / Price Charting / TCG API
+search in a rolling window shared by all analyzer processes. A source whose
+recent calls mostly fail or run slow is skipped for a cooldown, then probed
+by a single request before it is trusted again. Skipped or failed sources
+fall back to their last recorded price (flagged stale) rather than waiting
+out the full timeouts
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from price_history import PriceHistory, normalize_card_key, SOURCE_PRICE_CHARTING, SOURCE_TCG_API_GBP
+from tracing import percentile
+
+DEFAULT_DB_PATH = 'source_health.db'
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Calls considered when deciding whether to trip
+WINDOW_SECONDS = 300
+
+# Need at least this many recent calls before tripping
+MIN_CALLS = 4
+
+# Trip when this share of recent calls failed or were slow
+FAILURE_RATE_THRESHOLD = 0.5
+
+# A call slower than this counts against the source even if it returned data
+SLOW_CALL_SECONDS = {'ebay': 20.0, 'price_charting': 10.0, 'cardmarket': 10.0}
+DEFAULT_SLOW_CALL_SECONDS = 15.0
+
+# First cooldown after tripping; doubled after each failed probe up to the maximum
+BASE_COOLDOWN_SECONDS = 30
+MAX_COOLDOWN_SECONDS = 600
+
+# A probe that has not reported back after this long is presumed dead and re-issued
+PROBE_LEASE_SECONDS = 60
+
+# Skipped sources fall back to a recorded price no older than this
+STALE_PRICE_MAX_AGE_DAYS = 7
+
+# Price history source and display name for the single-price sources
+HISTORY_SOURCES = {
+    'price_charting': (SOURCE_PRICE_CHARTING, 'Price Charting'),
+    'cardmarket': (SOURCE_TCG_API_GBP, 'Pokemon TCG API')
+}
+
+# Text on the interstitial pages eBay serves when it blocks a scraper
+BLOCK_MARKERS = ('pardon our interruption', 'captcha', 'checking your browser')
+
+_local = threading.local()
+
+
+class SourceHealth:
+    """Rolling call windows and breaker state per source, in SQLite"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SOURCE_HEALTH_DB', DEFAULT_DB_PATH)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS calls (
+                source TEXT NOT NULL,
+                ts REAL NOT NULL,
+                ok INTEGER NOT NULL,
+                latency REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_calls_source_ts ON calls(source, ts);
+
+            CREATE TABLE IF NOT EXISTS breakers (
+                source TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                opened_at REAL,
+                cooldown REAL,
+                probe_until REAL
+            );
+        """)
+
+    def allow(self, source, now=None):
+        """
+        (allowed, probe) for a call to source
+
+        Open breakers allow nothing until their cooldown ends; then exactly one
+        caller (across processes) gets the probe lease.
+        """
+        now = now or time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state, opened_at, cooldown, probe_until FROM breakers WHERE source = ?",
+                (source,)).fetchone()
+            if not row or row[0] == STATE_CLOSED:
+                return True, False
+            state, opened_at, cooldown, probe_until = row
+            if state == STATE_OPEN and now < opened_at + cooldown:
+                return False, False
+            if state == STATE_HALF_OPEN and now < probe_until:
+                return False, False
+            # Take the probe lease unless another caller just did
+            taken = self.conn.execute("""
+                UPDATE breakers SET state = ?, probe_until = ?
+                WHERE source = ? AND state = ? AND COALESCE(probe_until, 0) = COALESCE(?, 0)
+            """, (STATE_HALF_OPEN, now + PROBE_LEASE_SECONDS, source, state, probe_until)).rowcount
+            self.conn.commit()
+            return bool(taken), bool(taken)
+
+    def record(self, source, ok, latency, probe=False, now=None):
+        """Record one call and trip, close or re-open the breaker as needed"""
+        now = now or time.time()
+        ok = ok and latency <= SLOW_CALL_SECONDS.get(source, DEFAULT_SLOW_CALL_SECONDS)
+        with self.lock:
+            self.conn.execute("INSERT INTO calls (source, ts, ok, latency) VALUES (?, ?, ?, ?)",
+                              (source, now, int(ok), latency))
+            self.conn.execute("DELETE FROM calls WHERE source = ? AND ts < ?", (source, now - WINDOW_SECONDS))
+
+            if probe:
+                if ok:
+                    self.conn.execute("DELETE FROM breakers WHERE source = ?", (source,))
+                    print(f"✅ {source} recovered - circuit closed")
+                else:
+                    self.conn.execute("""
+                        UPDATE breakers SET state = ?, opened_at = ?, cooldown = MIN(cooldown * 2, ?), probe_until = NULL
+                        WHERE source = ?
+                    """, (STATE_OPEN, now, MAX_COOLDOWN_SECONDS, source))
+            elif not ok:
+                calls, failures = self.conn.execute(
+                    "SELECT COUNT(*), SUM(1 - ok) FROM calls WHERE source = ? AND ts >= ?",
+                    (source, now - WINDOW_SECONDS)).fetchone()
+                if calls >= MIN_CALLS and failures / calls >= FAILURE_RATE_THRESHOLD:
+                    tripped = self.conn.execute("""
+                        INSERT INTO breakers (source, state, opened_at, cooldown) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(source) DO NOTHING
+                    """, (source, STATE_OPEN, now, BASE_COOLDOWN_SECONDS)).rowcount
+                    if tripped:
+                        print(f"⛔ {source} unhealthy ({failures}/{calls} recent calls failed or slow) - "
+                              f"skipping for {BASE_COOLDOWN_SECONDS}s")
+            self.conn.commit()
+
+    def report(self, now=None):
+        """{source: {state, calls, failure_rate, p50_ms, p95_ms, retry_in_seconds}}"""
+        now = now or time.time()
+        with self.lock:
+            calls = self.conn.execute(
+                "SELECT source, ok, latency FROM calls WHERE ts >= ? ORDER BY source",
+                (now - WINDOW_SECONDS,)).fetchall()
+            breakers = {
+                row[0]: row[1:]
+                for row in self.conn.execute("SELECT source, state, opened_at, cooldown FROM breakers")
+            }
+
+        by_source = {}
+        for source, ok, latency in calls:
+            by_source.setdefault(source, []).append((ok, latency))
+        report = {}
+        for source in sorted(set(by_source) | set(breakers)):
+            outcomes = by_source.get(source, [])
+            latencies = sorted(latency * 1000 for _, latency in outcomes)
+            state, opened_at, cooldown = breakers.get(source, (STATE_CLOSED, None, None))
+            report[source] = {
+                'state': state,
+                'calls': len(outcomes),
+                'failure_rate': round(1 - sum(ok for ok, _ in outcomes) / len(outcomes), 2) if outcomes else None,
+                'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+                'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+                'retry_in_seconds': round(max(opened_at + cooldown - now, 0)) if state == STATE_OPEN else None
+            }
+        return report
+
+    def close(self):
+        self.conn.close()
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_health():
+    global _health
+    with _health_lock:
+        if _health is None:
+            _health = SourceHealth()
+        return _health
+
+
+def source_failed(source, reason=None):
+    """
+    Mark the current guarded call as failed
+
+    Searchers catch their own errors and return nothing; calling this from
+    their except blocks lets the breaker tell a failure from "no results".
+    """
+    failures = getattr(_local, 'failures', None)
+    if failures is not None:
+        failures[source] = str(reason) if reason is not None else 'failed'
+
+
+def is_blocked_page(html):
+    """True for an anti-bot interstitial served in place of search results"""
+    text = (html or '')[:20000].lower()
+    return any(marker in text for marker in BLOCK_MARKERS)
+
+
+def last_known(source, card_name):
+    """Most recent recorded price for a single-price source, flagged stale, or None"""
+    if source not in HISTORY_SOURCES:
+        return None
+    history_source, label = HISTORY_SOURCES[source]
+    history = PriceHistory()
+    try:
+        row = history.latest(normalize_card_key(card_name), history_source,
+                             since=time.time() - STALE_PRICE_MAX_AGE_DAYS * 86400)
+    except sqlite3.Error:
+        row = None
+    finally:
+        history.close()
+    if not row:
+        return None
+    return {
+        'title': f"{card_name} ({label}, last known)",
+        'price': row[0],
+        'source': label,
+        'url': None,
+        'stale': True,
+        'observed_at': row[1]
+    }
+
+
+def guarded_call(source, func, card_name, *args, skipped=None):
+    """
+    func(card_name, *args) behind the source's circuit breaker
+
+    An open breaker skips the call; a skipped or failed call returns the
+    source's last known price (or [] for eBay listings) and, when a skipped
+    list is given, appends the source to it.
+    """
+    fallback = [] if source == 'ebay' else None
+    try:
+        health = get_health()
+        allowed, probe = health.allow(source)
+    except sqlite3.Error as e:
+        print(f"⚠️ Source health unavailable: {e}")
+        return func(card_name, *args)
+
+    if not allowed:
+        print(f"⏭️ Skipping {source} - circuit open after recent failures")
+        if skipped is not None:
+            skipped.append(source)
+        return last_known(source, card_name) or fallback
+
+    _local.failures = {}
+    start = time.perf_counter()
+    try:
+        result = func(card_name, *args)
+    except Exception as e:
+        _local.failures[source] = str(e)
+        result = None
+        print(f"   ❌ {source} search failed: {e}")
+    finally:
+        latency = time.perf_counter() - start
+        failure = _local.failures.get(source)
+        _local.failures = None
+
+    try:
+        health.record(source, failure is None, latency, probe=probe)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not record {source} health: {e}")
+
+    if failure is not None and not result:
+        return last_known(source, card_name) or fallback
+    return result if result is not None else fallback
+
+
+def health_report():
+    try:
+        return get_health().report()
+    except sqlite3.Error:
+        return {}
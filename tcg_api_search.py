@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Pokemon TCG API (RapidAPI) card search
+Plans the query variants for a card name once (deduplicated, most specific
+first), sends the top few concurrently over a pooled session and cancels the
+rest as soon as one response contains a confidently matching card, so a
+lookup costs about one round trip instead of one per variant
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from card_matching import best_match, targeted_queries, CONFIDENT, MIN_CONFIDENCE
+from tracing import span
+
+API_HOST = "pokemon-tcg-api.p.rapidapi.com"
+API_KEY = os.getenv('RAPIDAPI_KEY', "2390eefca8msh0b090b1b575b879p1c9090jsn0df6e6a47659")
+
+# Variants in flight at once; the rest only run if these all miss
+DEFAULT_FANOUT = 3
+
+PAGE_SIZE = 10
+REQUEST_TIMEOUT = 15
+
+# Suffix tokens the API's search often fails to match
+SUFFIX_TOKENS = ('ex', 'v')
+
+
+def plan_query_variants(card_name):
+    """
+    Distinct search strings for a card name, most specific first
+
+    The full name always leads; then the name without each suffix token,
+    without all of them, and finally the first word alone. Variants that
+    normalize to the same string are only sent once.
+    """
+    words = card_name.split()
+    candidates = [words]
+    for suffix in SUFFIX_TOKENS:
+        candidates.append([word for word in words if word.lower() != suffix])
+    candidates.append([word for word in words if word.lower() not in SUFFIX_TOKENS])
+    if len(words) > 1:
+        candidates.append(words[:1])
+
+    variants = []
+    seen = set()
+    for candidate in candidates:
+        query = ' '.join(candidate)
+        key = query.lower()
+        if query and key not in seen:
+            seen.add(key)
+            variants.append(query)
+
+    # More words means a narrower search; keep the full name first
+    return variants[:1] + sorted(variants[1:], key=lambda query: len(query.split()), reverse=True)
+
+
+class TCGApiSearcher:
+    """Concurrent variant fan-out over one pooled RapidAPI session"""
+
+    def __init__(self, session=None, fanout=None):
+        self.fanout = fanout or int(os.getenv('TCG_API_FANOUT', DEFAULT_FANOUT))
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.fanout)
+            session.mount('https://', adapter)
+        self.session = session
+        self.session.headers.update({
+            'X-RapidAPI-Key': API_KEY,
+            'X-RapidAPI-Host': API_HOST
+        })
+
+    def fetch(self, query):
+        """Cards returned for one search string ([] on an empty or failed response)"""
+        print(f"   Trying search query: {query}")
+        with span('cardmarket.api_request'):
+            response = self.session.get(
+                f"https://{API_HOST}/cards",
+                params={'search': query, 'pageSize': PAGE_SIZE},
+                timeout=REQUEST_TIMEOUT
+            )
+        if response.status_code != 200:
+            print(f"   API request failed with status: {response.status_code}")
+            return []
+        cards = response.json().get('data') or []
+        print(f"   Found {len(cards)} cards for query: {query}")
+        return cards
+
+    def search(self, card_name):
+        """
+        (card, confidence) for the best-scored card across the responses,
+        or (None, confidence) when nothing reaches MIN_CONFIDENCE
+
+        Variants stop as soon as one response holds a confident match. A
+        low-confidence best guess is followed up with targeted queries
+        (name + suffix + number) rather than more loose variants.
+        """
+        variants = plan_query_variants(card_name)
+        best = self.fan_out(card_name, variants, (None, 0.0))
+        if best[1] < CONFIDENT:
+            tried = {query.lower() for query in variants}
+            follow_ups = [query for query in targeted_queries(card_name) if query.lower() not in tried]
+            if follow_ups:
+                print(f"   Low match confidence ({best[1]:.2f}) - trying targeted queries")
+                best = self.fan_out(card_name, follow_ups, best)
+        if best[1] < MIN_CONFIDENCE:
+            return None, best[1]
+        return best
+
+    def fan_out(self, card_name, queries, best):
+        """
+        Run queries concurrently and keep the best (card, confidence)
+
+        Queued queries are cancelled once a confident match arrives;
+        requests already in flight finish in the background and are ignored.
+        """
+        executor = ThreadPoolExecutor(max_workers=min(self.fanout, len(queries)))
+        try:
+            futures = {executor.submit(self.fetch, query): query for query in queries}
+            for future in as_completed(futures):
+                try:
+                    cards = future.result()
+                except requests.RequestException as e:
+                    print(f"   ⚠️ Query '{futures[future]}' failed: {e}")
+                    continue
+                card, confidence = best_match(card_name, cards)
+                if confidence > best[1]:
+                    best = (card, confidence)
+                    print(f"   Best so far: {card.get('name', 'Unknown')} ({card.get('tcgid', card.get('id', ''))}) "
+                          f"- confidence {confidence:.2f} via '{futures[future]}'")
+                if best[1] >= CONFIDENT:
+                    break
+            return best
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_searcher = None
+_searcher_lock = threading.Lock()
+
+
+def get_searcher():
+    global _searcher
+    with _searcher_lock:
+        if _searcher is None:
+            _searcher = TCGApiSearcher()
+        return _searcher
+
+
+def search_cards(card_name):
+    return get_searcher().search(card_name)
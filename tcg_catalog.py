@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Incremental Pokemon TCG catalog ingestion
+Pages through the full pokemontcg.io catalog concurrently under a rate limit
+and keeps a local SQLite copy. Later runs only refetch sets whose updatedAt
+changed (or whose cards are older than the refresh window)
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from serialization import dumps, loads
+from tracing import span
+
+API_BASE = "https://api.pokemontcg.io/v2"
+PAGE_SIZE = 250
+CARD_FIELDS = 'id,name,set,tcgplayer,cardmarket,rarity,number,images'
+
+DEFAULT_DB_PATH = 'tcg_catalog.db'
+
+# Without an API key pokemontcg.io allows far fewer requests
+DEFAULT_REQUESTS_PER_SECOND = 4
+DEFAULT_WORKERS = 4
+
+# Prices move daily even when a set's updatedAt does not
+DEFAULT_REFRESH_AFTER_HOURS = 24
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces requests evenly"""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CatalogStore:
+    """Local SQLite copy of sets and cards"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sets (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                total INTEGER,
+                updated_at TEXT,
+                ingested_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS cards (
+                id TEXT PRIMARY KEY,
+                set_id TEXT,
+                name TEXT,
+                number TEXT,
+                rarity TEXT,
+                data TEXT,
+                ingested_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_cards_set ON cards(set_id);
+        """)
+
+    def get_set_state(self):
+        """{set_id: (updated_at, ingested_at)} for every stored set"""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, updated_at, ingested_at FROM sets").fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def save_cards(self, cards):
+        """Insert or replace a page of raw API cards"""
+        now = datetime.now().isoformat()
+        rows = [
+            (
+                card['id'],
+                card.get('set', {}).get('id'),
+                card.get('name'),
+                card.get('number'),
+                card.get('rarity'),
+                dumps(card, indent=0),
+                now
+            )
+            for card in cards
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO cards (id, set_id, name, number, rarity, data, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    def mark_set_ingested(self, set_data):
+        """Record a set's updatedAt once all of its pages are stored"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sets (id, name, total, updated_at, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    set_data['id'],
+                    set_data.get('name'),
+                    set_data.get('total'),
+                    set_data.get('updatedAt'),
+                    datetime.now().isoformat()
+                )
+            )
+            self.conn.commit()
+
+    def iter_cards(self, set_id=None, batch_size=500):
+        """Yield stored cards as API-shaped dicts, holding only one batch of rows at a time"""
+        if set_id:
+            query, params = "SELECT data FROM cards WHERE set_id = ?", (set_id,)
+        else:
+            query, params = "SELECT data FROM cards", ()
+
+        # Separate read-only connection so streaming does not hold the writer lock
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield loads(row[0])
+        finally:
+            conn.close()
+
+    def count_cards(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class CatalogIngestor:
+    """Concurrent, rate-limited, incremental pokemontcg.io catalog sync"""
+
+    def __init__(self, store=None, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 workers=DEFAULT_WORKERS, refresh_after_hours=DEFAULT_REFRESH_AFTER_HOURS, session=None):
+        self.store = store or CatalogStore()
+        self.limiter = RateLimiter(requests_per_second)
+        self.workers = workers
+        self.refresh_after = timedelta(hours=refresh_after_hours)
+
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+        })
+        api_key = os.getenv('POKEMONTCG_API_KEY')
+        if api_key:
+            self.session.headers['X-Api-Key'] = api_key
+
+    def fetch_page(self, endpoint, params, retries=3):
+        """GET one API page, retrying on rate limiting and server errors"""
+        for attempt in range(retries):
+            self.limiter.wait()
+            try:
+                with span('tcg_api.request'):
+                    response = self.session.get(f"{API_BASE}/{endpoint}", params=params, timeout=30)
+                if response.status_code == 429 or response.status_code >= 500:
+                    time.sleep(2 ** attempt)
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException as e:
+                if attempt == retries - 1:
+                    raise
+                print(f"⚠️ Retrying {endpoint} page {params.get('page')}: {e}")
+                time.sleep(2 ** attempt)
+        raise RuntimeError(f"Gave up fetching {endpoint} page {params.get('page')}")
+
+    def fetch_all_pages(self, endpoint, params, on_page=None):
+        """Fetch page 1, then every remaining page concurrently"""
+        first = self.fetch_page(endpoint, {**params, 'page': 1, 'pageSize': PAGE_SIZE})
+        pages = [first]
+        if on_page:
+            on_page(first.get('data', []))
+
+        total_count = first.get('totalCount', len(first.get('data', [])))
+        page_count = (total_count + PAGE_SIZE - 1) // PAGE_SIZE
+
+        if page_count > 1:
+            def fetch(page):
+                data = self.fetch_page(endpoint, {**params, 'page': page, 'pageSize': PAGE_SIZE})
+                if on_page:
+                    on_page(data.get('data', []))
+                return data
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pages.extend(executor.map(fetch, range(2, page_count + 1)))
+
+        return [item for page in pages for item in page.get('data', [])]
+
+    def fetch_sets(self):
+        return self.fetch_all_pages('sets', {'select': 'id,name,total,updatedAt'})
+
+    def stale_sets(self, sets):
+        """Sets that are new, whose updatedAt changed, or whose prices are older than the refresh window"""
+        state = self.store.get_set_state()
+        cutoff = (datetime.now() - self.refresh_after).isoformat()
+
+        stale = []
+        for set_data in sets:
+            stored = state.get(set_data['id'])
+            if (stored is None or
+                    stored[0] != set_data.get('updatedAt') or
+                    (stored[1] or '') < cutoff):
+                stale.append(set_data)
+        return stale
+
+    def ingest_set(self, set_data):
+        cards = self.fetch_all_pages(
+            'cards',
+            {'q': f"set.id:{set_data['id']}", 'select': CARD_FIELDS},
+            on_page=self.store.save_cards
+        )
+        self.store.mark_set_ingested(set_data)
+        return len(cards)
+
+    def sync(self):
+        """Bring the local catalog up to date, fetching only changed sets"""
+        print("🔄 Syncing Pokemon TCG catalog...")
+        start_time = time.time()
+
+        sets = self.fetch_sets()
+        stale = self.stale_sets(sets)
+        print(f"📦 {len(sets)} sets in catalog, {len(stale)} need refreshing")
+
+        ingested = 0
+        # Sets run concurrently too; the shared limiter keeps the total request rate bounded
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.ingest_set, set_data): set_data for set_data in stale}
+            for future, set_data in futures.items():
+                try:
+                    count = future.result()
+                    ingested += count
+                    print(f"   ✓ {set_data.get('name', set_data['id'])}: {count} cards")
+                except Exception as e:
+                    print(f"   ⚠️ Failed to ingest {set_data.get('name', set_data['id'])}: {e}")
+
+        # Keep the search index in step with the refreshed cards
+        from catalog_search import CatalogIndex
+        indexed = CatalogIndex(self.store).refresh()
+
+        elapsed = time.time() - start_time
+        print(f"🔎 Indexed {indexed} cards for search")
+        print(f"✅ Catalog sync complete: {ingested} cards refreshed in {elapsed:.1f}s "
+              f"({self.store.count_cards()} cards stored)")
+        return ingested
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    ingestor = CatalogIngestor(CatalogStore(db_path))
+    try:
+        ingestor.sync()
+    finally:
+        ingestor.store.close()
+
+
+if __name__ == "__main__":
+    main()
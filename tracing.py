@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Lightweight span timing for the analyzers
+Context-manager spans around network calls, browser operations and parse
+steps, aggregated into count / p50 / p95 per span and exported as JSON or
+OpenMetrics text. Disabled spans are a shared no-op, so instrumentation
+costs next to nothing unless ANALYZER_TRACING=1
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+# Durations kept per span name for percentiles; older samples are dropped
+MAX_SAMPLES_PER_SPAN = 10000
+
+METRIC_NAME = 'analyzer_span_seconds'
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile (q in 0-100) of pre-sorted values"""
+    if not sorted_values:
+        return None
+    index = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class Span:
+    """One timed operation; use as a context manager or call end()"""
+
+    __slots__ = ('tracer', 'name', 'start', 'ended')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.start = time.perf_counter()
+        self.ended = False
+
+    def end(self, error=False):
+        if not self.ended:
+            self.ended = True
+            self.tracer.record(self.name, time.perf_counter() - self.start, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc_type is not None)
+        return False
+
+
+class NullSpan:
+    """Stand-in returned while tracing is disabled"""
+
+    __slots__ = ()
+
+    def end(self, error=False):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """Thread-safe span duration aggregator"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.totals = {}
+        self.errors = {}
+
+    def span(self, name):
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def record(self, name, seconds, error=False):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=MAX_SAMPLES_PER_SPAN)
+            samples.append(seconds)
+            count, total = self.totals.get(name, (0, 0.0))
+            self.totals[name] = (count + 1, total + seconds)
+            if error:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.totals.clear()
+            self.errors.clear()
+
+    def summary(self):
+        """{span: {count, total_ms, mean_ms, p50_ms, p95_ms, max_ms, errors}}, slowest total first"""
+        with self.lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items()}
+            totals = dict(self.totals)
+            errors = dict(self.errors)
+
+        summary = {}
+        for name, values in snapshot.items():
+            count, total = totals[name]
+            summary[name] = {
+                'count': count,
+                'total_ms': round(total * 1000, 2),
+                'mean_ms': round(total / count * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+                'errors': errors.get(name, 0)
+            }
+        return dict(sorted(summary.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+    def to_openmetrics(self):
+        """OpenMetrics text exposition of every span as a summary metric"""
+        lines = [
+            f"# TYPE {METRIC_NAME} summary",
+            f"# UNIT {METRIC_NAME} seconds",
+            f"# HELP {METRIC_NAME} Duration of traced analyzer operations."
+        ]
+        for name, stats in self.summary().items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{METRIC_NAME}{{span="{label}",quantile="0.5"}} {round(stats["p50_ms"] / 1000, 6)}')
+            lines.append(f'{METRIC_NAME}{{span="{label}",quantile="0.95"}} {round(stats["p95_ms"] / 1000, 6)}')
+            lines.append(f'{METRIC_NAME}_sum{{span="{label}"}} {round(stats["total_ms"] / 1000, 6)}')
+            lines.append(f'{METRIC_NAME}_count{{span="{label}"}} {stats["count"]}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the summary as JSON (.json) or OpenMetrics text (anything else)"""
+        if path.endswith('.json'):
+            from serialization import write_json
+            write_json(self.summary(), path, indent=2)
+        else:
+            with open(path, 'w') as f:
+                f.write(self.to_openmetrics())
+
+    def attach(self, results):
+        """Add the span summary to a result dict under 'trace' when tracing is on"""
+        if self.enabled and isinstance(results, dict):
+            results['trace'] = self.summary()
+        return results
+
+
+tracer = Tracer(enabled=os.getenv('ANALYZER_TRACING', '0') not in ('0', 'false', ''))
+
+
+def span(name):
+    """Time a block: with span('ebay.goto'): ..."""
+    return tracer.span(name)
+
+
+def start_span(name):
+    """Span for a block too long to indent under with; call .end() when done"""
+    return tracer.span(name)
+
+
+def traced_call(name, func, *args, **kwargs):
+    """Call func inside a span, e.g. when submitting work to an executor"""
+    with tracer.span(name):
+        return func(*args, **kwargs)
+
+
+def enable_tracing(enabled=True):
+    tracer.enabled = enabled
+
+
+def attach_trace(results):
+    return tracer.attach(results)
+
+
+def _export_at_exit():
+    path = os.getenv('ANALYZER_TRACE_FILE')
+    if tracer.enabled and path and tracer.totals:
+        try:
+            tracer.export(path)
+        except OSError as e:
+            print(f"⚠️ Could not write trace file {path}: {e}")
+
+
+atexit.register(_export_at_exit)
@@ -6,135 +6,192 @@ Now includes All-Time Low analysis for arbitrage opportunities
 """
 
 import requests
-import json
 import time
 from datetime import datetime, timedelta
 from collections import defaultdict
 import sys
+import os
+
+from tcg_catalog import CatalogIngestor, CatalogStore, DEFAULT_DB_PATH
+from price_history import (PriceHistory, normalize_card_key, SOURCE_TCGPLAYER, SOURCE_EBAY_SOLD,
+                           SOURCE_CARDMARKET_AVG7, SOURCE_CARDMARKET_AVG30)
+
+from rankings import Leaderboards, TopK
+from serialization import write_json
+from tracing import span, attach_trace
+from card_models import TrendingCard
+
+# Trend and volatility are measured over this many days of recorded prices
+TREND_WINDOW_DAYS = 30
+
+LEADERBOARD_SIZE = 25
 
 class TrendingCardsAnalyzer:
-    def __init__(self):
+    def __init__(self, catalog_path=None, sync_catalog=True):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         })
         
-        # Pokemon TCG API endpoints
-        self.api_base = "https://api.pokemontcg.io/v2"
-        self.cards_endpoint = f"{self.api_base}/cards"
+        # Full catalog is mirrored locally and refreshed incrementally
+        self.catalog = CatalogStore(catalog_path or os.getenv('TCG_CATALOG_DB', DEFAULT_DB_PATH))
+        self.sync_catalog = sync_catalog
+        
+        # Every observed price is recorded so trends come from real history
+        self.history = PriceHistory()
         
     def get_high_value_cards(self):
-        """Get high-value cards with recent price data from Pokemon TCG API"""
-        all_cards = []
+        """Get high-value cards with recent price data from the local Pokemon TCG catalog"""
+        return list(self.iter_high_value_cards())
+    
+    def iter_high_value_cards(self):
+        """Stream high-value cards with recent price data from the local Pokemon TCG catalog"""
+        found = 0
         
         print(f"🔍 Fetching real market data from Pokemon TCG API...")
         
-        # Simple approach: just get cards and filter by price
         try:
-            params = {
-                'pageSize': 250,  # Get more cards to filter from
-                'select': 'id,name,set,tcgplayer,rarity,number'
-            }
+            if self.sync_catalog:
+                with span('catalog.sync'):
+                    CatalogIngestor(self.catalog, session=self.session).sync()
+        except Exception as e:
+            # A failed sync still leaves the previously stored catalog usable
+            print(f"⚠️ Catalog sync failed, using stored catalog: {str(e)}")
+        
+        try:
+            # Record today's snapshot first so it is part of the trend window
+            with span('history.record'):
+                recorded = self.history.record_many(self.price_observations(self.catalog.iter_cards()))
+            print(f"🗃️ Recorded {recorded} new price observations")
+            # Fold raw observations past the retention window into daily bars
+            with span('history.rollup'):
+                rolled_up = self.history.rollup()
+            if rolled_up:
+                print(f"🗜️ Rolled {rolled_up} old observations into daily history")
+            with span('history.window_stats'):
+                stats = self.history.window_stats(SOURCE_TCGPLAYER, TREND_WINDOW_DAYS)
+                # eBay sales recorded by what-to-pay lookups, keyed by card name and number
+                sales = self.history.window_stats(SOURCE_EBAY_SOLD, TREND_WINDOW_DAYS)
             
-            response = self.session.get(self.cards_endpoint, params=params)
-            response.raise_for_status()
-            data = response.json()
+            scanned = 0
+            for card in self.catalog.iter_cards():
+                scanned += 1
+                if 'tcgplayer' in card and 'prices' in card['tcgplayer']:
+                    sale_stats = sales.get(normalize_card_key(f"{card['name']} {card.get('number', '')}"))
+                    parsed_card = self.parse_card_data(card, stats.get(card['id']),
+                                                       sale_stats['observations'] if sale_stats else 0)
+                    if parsed_card:
+                        found += 1
+                        yield parsed_card
             
-            if 'data' in data:
-                print(f"📡 Retrieved {len(data['data'])} cards from API")
-                
-                for card in data['data']:
-                    if 'tcgplayer' in card and 'prices' in card['tcgplayer']:
-                        parsed_card = self.parse_card_data(card)
-                        if parsed_card:
-                            all_cards.append(parsed_card)
-                
-                print(f"✅ Found {len(all_cards)} cards with pricing data")
+            print(f"📡 Scanned {scanned} cards from catalog")
+            print(f"✅ Found {found} cards with pricing data")
             
         except Exception as e:
-            print(f"❌ Error fetching cards: {str(e)}")
-            return []
-        
-        return all_cards
+            print(f"❌ Error reading catalog: {str(e)}")
     
-    def parse_card_data(self, card):
-        """Parse card data from Pokemon TCG API"""
-        try:
+    def current_market_price(self, card):
+        """Highest TCGPlayer market price across the card's printings"""
+        prices = card.get('tcgplayer', {}).get('prices', {})
+        current_price = None
+        for price_type in ['holofoil', 'reverseHolofoil', 'normal']:
+            market = prices.get(price_type, {}).get('market')
+            if market:
+                market_price = float(market)
+                if not current_price or market_price > current_price:
+                    current_price = market_price
+        return current_price
+    
+    def price_observations(self, cards):
+        """Price history observations for a batch of catalog cards"""
+        for card in cards:
             tcg = card.get('tcgplayer', {})
-            prices = tcg.get('prices', {})
-            
-            # Get all available prices to determine historical high vs current
-            all_prices = []
-            current_price = None
+            yield (card['id'], SOURCE_TCGPLAYER, self.current_market_price(card),
+                   tcg.get('updatedAt'), 'USD')
             
-            for price_type in ['holofoil', 'reverseHolofoil', 'normal']:
-                if price_type in prices:
-                    price_data = prices[price_type]
-                    
-                    # Current market price
-                    if price_data.get('market'):
-                        market_price = float(price_data['market'])
-                        if not current_price or market_price > current_price:
-                            current_price = market_price
-                        all_prices.append(market_price)
-                    
-                    # High price (represents historical peak)
-                    if price_data.get('high'):
-                        high_price = float(price_data['high'])
-                        all_prices.append(high_price)
+            cardmarket = card.get('cardmarket', {})
+            cm_prices = cardmarket.get('prices', {})
+            yield (card['id'], SOURCE_CARDMARKET_AVG7, cm_prices.get('avg7'),
+                   cardmarket.get('updatedAt'), 'EUR')
+            yield (card['id'], SOURCE_CARDMARKET_AVG30, cm_prices.get('avg30'),
+                   cardmarket.get('updatedAt'), 'EUR')
+    
+    def parse_card_data(self, card, stats=None, sale_count=0):
+        """
+        Parse a Pokemon TCG API card into a compact TrendingCard, using recorded price history for context
+
+        sale_count is the number of recorded eBay sales in the trend window;
+        TCGPlayer price snapshots are not sales and are counted separately.
+        """
+        try:
+            current_price = self.current_market_price(card)
             
             if not current_price or current_price < 10:
                 return None
             
-            # Calculate historical context
-            historical_high = max(all_prices) if all_prices else current_price
+            stats = stats or {}
+            
+            # Historical context comes from recorded prices, not the listing 'high'
+            historical_high = max(stats.get('all_time_high') or current_price, current_price)
+            all_time_low = min(stats.get('all_time_low') or current_price, current_price)
             price_drop_pct = ((historical_high - current_price) / historical_high) * 100 if historical_high > current_price else 0
             
-            # Calculate mock trend and volume
-            price_change = self.calculate_mock_trend(card['name'], current_price)
-            mock_volume = max(5, int(current_price / 3) + (len(card['name']) % 8))
+            # Trend over the window; zero until at least two days are recorded
+            price_change = stats.get('trend') or 0.0
             
-            return {
-                'id': card['id'],
-                'name': card['name'],
-                'set': card.get('set', {}).get('name', 'Unknown Set'),
-                'cardNumber': card.get('number', 'N/A'),
-                'salePrice': current_price,
-                'historicalHigh': historical_high,
-                'priceDropPercent': round(price_drop_pct, 1),
-                'saleTime': datetime.now().isoformat(),
-                'condition': 'Near Mint',
-                'saleCount': mock_volume,
-                'priceChange': price_change,
-                'trend': 'up' if price_change > 5 else 'down' if price_change < -5 else 'stable',
-                'isUndervalued': price_drop_pct >= 25,  # 25%+ drop from historical high
-                'potentialUpside': round(((historical_high - current_price) / current_price) * 100, 1) if historical_high > current_price else 0
-            }
+            return TrendingCard(
+                id=card['id'],
+                name=card['name'],
+                set=card.get('set', {}).get('name', 'Unknown Set'),
+                rarity=card.get('rarity'),
+                card_number=card.get('number', 'N/A'),
+                sale_price=current_price,
+                historical_high=historical_high,
+                all_time_low=all_time_low,
+                price_drop_percent=round(price_drop_pct, 1),
+                sale_count=sale_count,
+                price_observations=stats.get('observations', 0),
+                price_change=price_change,
+                volatility=stats.get('volatility'),
+                history_days=stats.get('days', 0),
+                trend='up' if price_change > 5 else 'down' if price_change < -5 else 'stable',
+                is_undervalued=price_drop_pct >= 25,  # 25%+ drop from historical high
+                potential_upside=round(((historical_high - current_price) / current_price) * 100, 1) if historical_high > current_price else 0
+            )
             
         except Exception as e:
             print(f"⚠️ Error parsing card {card.get('name', 'Unknown')}: {str(e)}")
             return None
     
-    def calculate_mock_trend(self, card_name, current_price):
-        """Calculate mock price trend based on card characteristics"""
-        # Create deterministic but varied trends based on card name and price
-        name_hash = sum(ord(c) for c in card_name.lower())
-        price_factor = int(current_price * 10) % 20
-        
-        trend_seed = (name_hash + price_factor) % 100
-        
-        if trend_seed < 35:
-            return round((trend_seed / 3) + 2, 1)  # Positive trend
-        elif trend_seed > 75:
-            return round(-((100 - trend_seed) / 2) - 1, 1)  # Negative trend
-        else:
-            return round((trend_seed - 50) / 10, 1)  # Mild trend
+    def new_leaderboards(self):
+        """Trending and undervalued rankings plus price stats, fed one card at a time"""
+        return Leaderboards(
+            boards={
+                # Trending: by volume, then price change
+                'trending': TopK(LEADERBOARD_SIZE, key=lambda x: (x.sale_count, x.price_change)),
+                # Undervalued: by price drop %, then potential upside
+                'undervalued': TopK(LEADERBOARD_SIZE,
+                                    key=lambda x: (x.price_drop_percent, x.potential_upside),
+                                    where=lambda x: x.is_undervalued)
+            },
+            stats={'salePrice': 'sale_price'}
+        )
     
-    def get_trending_analysis(self):
-        """Get comprehensive trending analysis including undervalued opportunities"""
-        cards = self.get_high_value_cards()
+    def get_trending_analysis(self, cards=None, leaderboards=None):
+        """
+        Get comprehensive trending analysis including undervalued opportunities
         
-        if not cards:
+        Cards are streamed through bounded heaps in a single pass. Pass an
+        existing leaderboards object to fold newly arrived cards into it.
+        Only the ranked cards are turned into dicts, at the output boundary.
+        """
+        if cards is None:
+            cards = self.iter_high_value_cards()
+        # Scanning, parsing and ranking all happen in this one streaming pass
+        with span('trending.scan_and_rank'):
+            leaderboards = (leaderboards or self.new_leaderboards()).add_many(cards)
+        
+        if not leaderboards.total:
             print("❌ No card data available")
             return {
                 'trending_cards': [],
@@ -147,33 +204,28 @@ class TrendingCardsAnalyzer:
                 }
             }
         
-        # Sort for trending (by volume, then price change)
-        trending_cards = sorted(cards, 
-                              key=lambda x: (x['saleCount'], x['priceChange']), 
-                              reverse=True)[:25]
-        
-        # Sort for undervalued opportunities (by price drop %, then potential upside)
-        undervalued_cards = [card for card in cards if card['isUndervalued']]
-        undervalued_cards = sorted(undervalued_cards,
-                                 key=lambda x: (x['priceDropPercent'], x['potentialUpside']),
-                                 reverse=True)[:25]
+        # Every card in one analysis shares the same snapshot time
+        snapshot_time = datetime.now().isoformat()
+        trending_cards = [card.to_dict(snapshot_time) for card in leaderboards.top('trending')]
+        undervalued_cards = [card.to_dict(snapshot_time) for card in leaderboards.top('undervalued')]
+        prices = leaderboards.stats['salePrice']
         
         print(f"📊 Analysis Complete:")
         print(f"   • {len(trending_cards)} trending cards")
         print(f"   • {len(undervalued_cards)} undervalued opportunities")
-        print(f"   • Price range: ${min(card['salePrice'] for card in cards):.2f} - ${max(card['salePrice'] for card in cards):.2f}")
+        print(f"   • Price range: ${prices.min:.2f} - ${prices.max:.2f}")
         
         return {
             'trending_cards': trending_cards,
             'undervalued_cards': undervalued_cards,
             'summary': {
-                'total_cards': len(cards),
+                'total_cards': leaderboards.total,
                 'trending_count': len(trending_cards),
                 'undervalued_count': len(undervalued_cards),
-                'last_updated': datetime.now().isoformat(),
+                'last_updated': snapshot_time,
                 'price_range': {
-                    'min': min(card['salePrice'] for card in cards),
-                    'max': max(card['salePrice'] for card in cards)
+                    'min': prices.min,
+                    'max': prices.max
                 }
             }
         }
@@ -186,12 +238,11 @@ def main():
         print("🎯 Pokemon Card Market Analysis Starting...")
         print("=" * 50)
         
-        results = analyzer.get_trending_analysis()
+        results = attach_trace(analyzer.get_trending_analysis())
         
         # Save results to file
         output_file = 'trending_cards_results.json'
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        write_json(results, output_file)
         
         print(f"💾 Results saved to {output_file}")
         
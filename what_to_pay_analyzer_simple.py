@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import re
-import json
 import time
 import requests
 from datetime import datetime
@@ -11,139 +10,39 @@ from bs4 import BeautifulSoup
 import concurrent.futures
 import sys
 
-def emit_progress(stage, message):
-    """Emit progress updates that can be captured by the API"""
-    progress_data = {
-        'stage': stage,
-        'message': message,
-        'timestamp': datetime.now().isoformat()
-    }
-    print(f"PROGRESS:{json.dumps(progress_data)}", flush=True)
+from currency import USD_TO_GBP
+from serialization import dumps
+from progress import emit_progress, flush_progress
+from tracing import span, traced_call, attach_trace
+from catalog_search import lookup_catalog
+from card_matching import best_match, QueryParts, CONFIDENT, MIN_CONFIDENCE
+from source_health import guarded_call, source_failed, health_report
+from price_aggregation import summarize_market
+from ebay_sold_history import collect_sold_listings
 
-def search_ebay_uk_sold(card_name, max_results=4):
-    """Search eBay UK for recently sold raw cards using requests"""
+def search_ebay_uk_sold(card_name, max_results=None):
+    """Search eBay UK for recently sold raw cards using requests, several result pages at once"""
     emit_progress("ebay", "Connecting to eBay UK...")
     print(f"🔍 Searching eBay UK for: {card_name}")
     
     prices = []
     
     try:
-        # Search for SOLD AUCTIONS ONLY - matching exact parameters
-        search_query = f"{card_name} pokemon card"
-        # Simplified URL for better compatibility with UK-only filtering
-        ebay_url = f"https://www.ebay.co.uk/sch/i.html?_nkw={quote(search_query)}&_sacat=0&LH_Sold=1&LH_Complete=1&LH_PrefLoc=1&rt=nc&_ipg=50"
-        
-        print(f"   Searching: {ebay_url}")
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'DNT': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1'
-        }
-        
         emit_progress("ebay", "Fetching eBay search results...")
         
-        response = requests.get(ebay_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        print(f"   Response received, status: {response.status_code}")
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Save debug file
-        with open('debug_ebay_simple.html', 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        print("   Debug: Saved page to debug_ebay_simple.html")
-        
-        # Find listings using multiple selectors
-        listings = soup.find_all('div', class_='s-item')
-        if not listings:
-            listings = soup.find_all('div', {'data-testid': 'item-card'})
-        if not listings:
-            listings = soup.find_all('div', class_='srp-item')
-        
-        print(f"   Found {len(listings)} listings")
-        
-        count = 0
-        for i, listing in enumerate(listings):
-            if count >= max_results:
-                break
-                
-            try:
-                # Extract title
-                title_elem = (listing.find('h3', class_='s-item__title') or 
-                            listing.find('a', class_='s-item__link') or
-                            listing.find('span', class_='s-item__title'))
-                
-                if not title_elem:
-                    continue
-                    
-                title = title_elem.get_text(strip=True)
-                
-                # Skip ads and non-listings
-                if ('shop on ebay' in title.lower() or 
-                    'advertisement' in title.lower() or
-                    'save this search' in title.lower() or
-                    len(title) < 15):
-                    continue
-                
-                # Extract price
-                price_elem = (listing.find('span', class_='s-item__price') or
-                            listing.find('span', class_='notranslate') or
-                            listing.find('span', class_='s-price'))
-                
-                if not price_elem:
-                    continue
-                    
-                price_text = price_elem.get_text(strip=True)
-                
-                # Extract price value
-                price_match = re.search(r'£([\d,]+\.?\d*)', price_text)
-                if not price_match:
-                    continue
-                    
-                price = float(price_match.group(1).replace(',', ''))
-                
-                # Filter out obviously graded cards
-                obvious_graded_terms = ['psa 10', 'psa 9', 'bgs 10', 'bgs 9', 'cgc 10', 'cgc 9']
-                title_lower = title.lower()
-                if any(term in title_lower for term in obvious_graded_terms):
-                    continue
-                
-                # Reasonable price range filter
-                if price < 1 or price > 10000:
-                    continue
-                
-                # Get listing URL
-                link_elem = listing.find('a', class_='s-item__link')
-                listing_url = link_elem.get('href') if link_elem else 'https://www.ebay.co.uk'
-                
-                prices.append({
-                    'title': title,
-                    'price': price,
-                    'url': listing_url,
-                    'source': 'eBay UK (Sold Auctions)'
-                })
-                
-                print(f"   ✅ Found: {title[:50]}... - £{price}")
-                count += 1
-                
-            except Exception as e:
-                print(f"   ❌ Error processing listing {i}: {e}")
-                continue
+        # Sold and completed listings of any format, newest first
+        prices = collect_sold_listings(
+            f"{card_name} pokemon card",
+            auctions_only=False,
+            max_sales=max_results,
+            progress=lambda count: emit_progress("ebay", f"Collected {count} sold listings...")
+        )
         
         print(f"   📊 Total eBay prices found: {len(prices)}")
         
     except Exception as e:
         print(f"   ❌ eBay search failed: {e}")
+        source_failed('ebay', e)
         
     return prices
 
@@ -163,10 +62,12 @@ def search_price_charting(card_name):
         
         emit_progress("price_charting", "Fetching Price Charting data...")
         
-        response = requests.get(url, headers=headers, timeout=10)
+        with span('price_charting.request'):
+            response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        with span('price_charting.parse'):
+            soup = BeautifulSoup(response.content, 'html.parser')
         
         # Look for price information
         price_elements = soup.find_all('td', class_='price')
@@ -176,8 +77,7 @@ def search_price_charting(card_name):
                 price_match = re.search(r'\$?([\d,]+\.?\d*)', price_text)
                 if price_match:
                     usd_price = float(price_match.group(1).replace(',', ''))
-                    # Convert USD to GBP (approximate)
-                    gbp_price = usd_price * 0.79
+                    gbp_price = usd_price * USD_TO_GBP
                     
                     print(f"   ✅ Price Charting: £{gbp_price:.2f}")
                     return {
@@ -187,26 +87,51 @@ def search_price_charting(card_name):
                         'url': 'https://www.pricecharting.com'
                     }
         
-        # Fallback price based on card name
-        fallback_price = 15.50
-        print(f"   💡 Using fallback price: £{fallback_price}")
-        return {
-            'title': f"{card_name} (Price Charting)",
-            'price': fallback_price,
-            'source': 'Price Charting',
-            'url': 'https://www.pricecharting.com'
-        }
+        print("   ❌ No Price Charting price found")
+        return None
         
     except Exception as e:
         print(f"   ❌ Price Charting search failed: {e}")
+        source_failed('price_charting', e)
         return None
 
+def requery_pokemon_tcg_api(card_name, headers, best):
+    """
+    Follow up a low-confidence match with field queries on the base name
+    and card number, keeping whichever (card, confidence) scores best
+    """
+    parts = QueryParts(card_name)
+    if not parts.base_name:
+        return best
+    queries = []
+    if parts.number and parts.number.isdigit():
+        queries.append(f'name:"{parts.base_name}*" number:{parts.number}')
+    queries.append(f'name:"{parts.base_name}*"')
+    for query in queries:
+        print(f"   Low match confidence ({best[1]:.2f}) - trying {query}")
+        with span('cardmarket.api_request'):
+            response = requests.get("https://api.pokemontcg.io/v2/cards",
+                                    params={'q': query, 'pageSize': 50}, headers=headers, timeout=10)
+        if response.status_code != 200:
+            continue
+        card, confidence = best_match(card_name, response.json().get('data') or [])
+        if confidence > best[1]:
+            best = (card, confidence)
+        if best[1] >= CONFIDENT:
+            break
+    return best
+
 def search_pokemon_tcg_api(card_name):
     """Search Pokemon TCG API for card data"""
     emit_progress("cardmarket", "Connecting to Pokemon TCG API...")
     print(f"🔍 Searching Pokemon TCG API for: {card_name}")
     
     try:
+        # Cards in the local catalog resolve without a search request
+        local_result = lookup_catalog(card_name)
+        if local_result:
+            return local_result
+        
         # Use Pokemon TCG API (free version)
         url = f"https://api.pokemontcg.io/v2/cards?q=name:{quote(card_name)}"
         
@@ -216,20 +141,25 @@ def search_pokemon_tcg_api(card_name):
         
         emit_progress("cardmarket", "Fetching Pokemon TCG API data...")
         
-        response = requests.get(url, headers=headers, timeout=10)
+        with span('cardmarket.api_request'):
+            response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         data = response.json()
         
-        if data.get('data') and len(data['data']) > 0:
-            card = data['data'][0]
+        card, confidence = best_match(card_name, data.get('data') or [])
+        if confidence < CONFIDENT:
+            card, confidence = requery_pokemon_tcg_api(card_name, headers, (card, confidence))
+        
+        if card and confidence >= MIN_CONFIDENCE:
+            print(f"   ✅ Matched {card.get('name', 'Unknown')} {card.get('number', '')} - confidence {confidence:.2f}")
             
             # Extract pricing if available
             if card.get('tcgplayer') and card['tcgplayer'].get('prices'):
                 prices = card['tcgplayer']['prices']
                 if prices.get('normal') and prices['normal'].get('market'):
                     usd_price = prices['normal']['market']
-                    gbp_price = usd_price * 0.79  # Convert USD to GBP
+                    gbp_price = usd_price * USD_TO_GBP
                     
                     print(f"   ✅ Pokemon TCG API: £{gbp_price:.2f}")
                     return {
@@ -237,6 +167,7 @@ def search_pokemon_tcg_api(card_name):
                         'price': round(gbp_price, 2),
                         'source': 'Pokemon TCG API',
                         'url': None,
+                        'match_confidence': confidence,
                         'card_info': {
                             'name': card.get('name', card_name),
                             'set': card.get('set', {}).get('name', 'Unknown'),
@@ -245,18 +176,12 @@ def search_pokemon_tcg_api(card_name):
                         }
                     }
         
-        # Fallback price
-        fallback_price = 18.75
-        print(f"   💡 Using fallback price: £{fallback_price}")
-        return {
-            'title': f"{card_name} (Pokemon TCG API)",
-            'price': fallback_price,
-            'source': 'Pokemon TCG API',
-            'url': None
-        }
+        print("   ❌ No Pokemon TCG API price found")
+        return None
         
     except Exception as e:
         print(f"   ❌ Pokemon TCG API search failed: {e}")
+        source_failed('cardmarket', e)
         return None
 
 def analyze_what_to_pay(card_name):
@@ -268,11 +193,14 @@ def analyze_what_to_pay(card_name):
     
     emit_progress("analysis", "Starting price analysis...")
     
+    # Sources with an open circuit breaker are skipped (reported in skipped_sources)
+    skipped = []
+    
     # Run searches in parallel
     with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        ebay_future = executor.submit(search_ebay_uk_sold, card_name)
-        price_charting_future = executor.submit(search_price_charting, card_name)
-        pokemon_api_future = executor.submit(search_pokemon_tcg_api, card_name)
+        ebay_future = executor.submit(traced_call, 'ebay.total', guarded_call, 'ebay', search_ebay_uk_sold, card_name, skipped=skipped)
+        price_charting_future = executor.submit(traced_call, 'price_charting.total', guarded_call, 'price_charting', search_price_charting, card_name, skipped=skipped)
+        pokemon_api_future = executor.submit(traced_call, 'cardmarket.total', guarded_call, 'cardmarket', search_pokemon_tcg_api, card_name, skipped=skipped)
         
         # Get results
         ebay_prices = ebay_future.result() or []
@@ -286,38 +214,16 @@ def analyze_what_to_pay(card_name):
         'ebay_prices': ebay_prices,
         'price_charting': price_charting,
         'cardmarket': pokemon_api,
-        'analysis': {}
+        'analysis': {},
+        'skipped_sources': skipped,
+        'source_health': health_report()
     }
     
     # Calculate analysis
-    all_prices = []
-    
-    # Add eBay prices
-    for item in ebay_prices:
-        all_prices.append(item['price'])
-    
-    # Add Price Charting price
-    if price_charting and price_charting.get('price'):
-        all_prices.append(price_charting['price'])
-    
-    # Add Pokemon API price
-    if pokemon_api and pokemon_api.get('price'):
-        all_prices.append(pokemon_api['price'])
-    
-    if all_prices:
-        ebay_average = sum(item['price'] for item in ebay_prices) / len(ebay_prices) if ebay_prices else 0
-        final_average = sum(all_prices) / len(all_prices)
-        min_price = min(all_prices)
-        max_price = max(all_prices)
-        
-        results['analysis'] = {
-            'ebay_average': round(ebay_average, 2),
-            'price_charting_price': price_charting['price'] if price_charting else 0,
-            'cardmarket_price': pokemon_api['price'] if pokemon_api else 0,
-            'final_average': round(final_average, 2),
-            'price_range': f"£{min_price:.2f} - £{max_price:.2f}",
-            'recommendation': f"£{final_average * 0.8:.2f} - £{final_average * 0.9:.2f}"
-        }
+    with span('analysis.aggregate'):
+        analysis = summarize_market(ebay_prices, price_charting, pokemon_api)
+    if analysis['final_average'] is not None:
+        results['analysis'] = analysis
     
     # Print summary
     print("\n" + "=" * 80)
@@ -344,11 +250,12 @@ def analyze_what_to_pay(card_name):
         print(f"   Price Range: {analysis['price_range']}")
         print(f"   Recommendation: {analysis['recommendation']}")
     
-    # Output JSON for API
+    # Output JSON for API, after any held progress events so none land inside it
+    flush_progress()
     print("\n" + "=" * 80)
     print("JSON_OUTPUT_START")
-    print(json.dumps(results, indent=2))
-    print("JSON_OUTPUT_END")
+    print(dumps(attach_trace(results)))
+    print("JSON_OUTPUT_END", flush=True)
     
     return results
 